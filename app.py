@@ -1,290 +1,344 @@
-import streamlit as st
-import pandas as pd
+import os
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import streamlit as st
+import batch
 from task1_profanity.regex_detector import ProfanityRegexDetector
-from task1_profanity.llm_detector import ProfanityLLMDetector
 from task2_privacy.regex_detector import ComplianceRegexDetector
-from task2_privacy.llm_detector import ComplianceLLMDetector
-from task3_metrics.call_quality import CallQualityAnalyzer
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
+from task3_metrics.timeline import build_timeline
+
+# The Gemini SDK and matplotlib are slow to import, so they are only loaded
+# once an LLM detector or a chart is actually needed.
+
+
+# Calls with more segments than this open in the interactive timeline view
+LONG_CALL_SEGMENTS = 500
+
+
+@st.cache_resource
+def get_regex_detector(entity: str):
+    # Compiled once per process and shared across reruns and sessions
+    if entity == "Profanity Detection":
+        return ProfanityRegexDetector()
+    return ComplianceRegexDetector()
+
+
+@st.cache_resource
+def get_llm_detector(entity: str, api_key: str):
+    # Keyed by API key so each key gets its own configured client
+    if entity == "Profanity Detection":
+        from task1_profanity.llm_detector import ProfanityLLMDetector
+        return ProfanityLLMDetector(api_key=api_key)
+    from task2_privacy.llm_detector import ComplianceLLMDetector
+    return ComplianceLLMDetector(api_key=api_key)
+
+
+@st.cache_resource
+def get_hybrid_detector(entity: str, api_key: str):
+    # Regex first; the LLM detector is only built once a call is escalated
+    if entity == "Profanity Detection":
+        from task1_profanity.hybrid_detector import ProfanityHybridDetector
+        return ProfanityHybridDetector(regex_detector=get_regex_detector(entity), api_key=api_key)
+    from task2_privacy.hybrid_detector import ComplianceHybridDetector
+    return ComplianceHybridDetector(regex_detector=get_regex_detector(entity), api_key=api_key)
+
+
+@st.cache_data(show_spinner=False)
+def run_detector(file_hash: str, entity: str, approach: str, api_key: str, _convo):
+    # Cached on the uploaded file's hash; _convo is excluded from the cache key.
+    # The third value says whether a Hybrid run escalated to the LLM.
+    escalated = None
+    if approach == "Pattern Matching":
+        result = get_regex_detector(entity).analyze_conversation(_convo)
+    elif approach == "Hybrid":
+        result = get_hybrid_detector(entity, api_key).analyze_conversation_detailed(_convo)
+        escalated = result["escalated"]
+    else:
+        result = get_llm_detector(entity, api_key).analyze_conversation(_convo)
+    if "error" in result:
+        # Raised rather than returned so a failed LLM request is not cached
+        raise RuntimeError(result["error"])
+
+    if entity == "Profanity Detection":
+        return result.get("agent_profanity"), result.get("borrower_profanity"), escalated
+    return result.get("privacy_violation"), None, escalated
+
+
+@st.cache_resource
+def get_worker_pool():
+    # Warm worker processes with the detectors already built, shared by every
+    # dashboard session
+    return ProcessPoolExecutor(initializer=batch._init_worker)
+
+
+@st.cache_data(show_spinner=False)
+def get_timeline(file_hash: str, _convo):
+    return build_timeline(_convo)
+
+
+def render_call_quality(timeline):
+    # One sweep over the call (see get_timeline) feeds the summary, the
+    # timeline and the stats
+    import matplotlib.pyplot as plt
+    from task3_metrics.timeline_plot import plot_timeline, timeline_chart
+
+    st.header("Call Quality Metrics")
+
+    # Compute true total percentages
+    total = timeline['total_duration']
+    silence = timeline['silence_duration']
+    speaking = total - silence
+    overtalk = timeline['overtalk_duration']
+    solo_speaking = speaking - overtalk
+
+    # Percentages
+    silence_pct = (silence / total) * 100
+    speaking_pct = (solo_speaking / total) * 100
+    overtalk_pct = (overtalk / total) * 100
+    overtalk_within_speaking = (overtalk / speaking) * 100 if speaking > 0 else 0
+
+    # Layout
+    st.markdown("### 🔍 Summary")
+    st.markdown(
+        f"""
+        - 🕒 **Total Call Duration:** `{total:.2f}` seconds  
+        - 🔇 **Silence:** `{silence_pct:.2f}%` of total call  
+        - 🗣️ **Speaking:** `{speaking_pct + overtalk_pct:.2f}%`  
+            - 🔁 **Overtalk:** `{overtalk_pct:.2f}%` of total  
+            - 📊 **Overtalk Share of Speaking:** `{overtalk_within_speaking:.2f}%`
+        """
+    )
+
+    # Pie Chart
+    st.markdown("### 📊 Duration Distribution")
+    labels, sizes, colors = [], [], []
+
+    if silence_pct > 0:
+        labels.append('Silence')
+        sizes.append(silence_pct)
+        colors.append('#ffc107')
+
+    if speaking_pct > 0:
+        labels.append('Speaking (Solo)')
+        sizes.append(speaking_pct)
+        colors.append('#4caf50')
+
+    if overtalk_pct > 0:
+        labels.append('Overtalk')
+        sizes.append(overtalk_pct)
+        colors.append('#f44336')
+
+    if sizes:
+        fig, ax = plt.subplots()
+        ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, colors=colors)
+        ax.axis('equal')
+        st.pyplot(fig)
+    else:
+        st.info("No segments to display in pie chart.")
+
+    st.markdown("### 🕓 Conversation Timeline")
+    interactive = st.toggle(
+        "Interactive view",
+        value=len(timeline["segments"]) > LONG_CALL_SEGMENTS,
+        help="Zoomable chart, downsampled for long calls"
+    )
+    if interactive:
+        st.altair_chart(timeline_chart(timeline))
+    else:
+        st.pyplot(plot_timeline(timeline))
+
+    # Additional statistics
+    def calculate_conversation_stats(timeline):
+        total_duration = timeline["total_duration"]
+        
+        # Speaker, overlap and silence totals all come from the same sweep
+        agent_time = timeline["speaker_talk_time"].get("Agent", 0.0)
+        customer_time = timeline["speaker_talk_time"].get("Customer", 0.0)
+        total_overlap_time = timeline["overtalk_duration"]
+        silence_time = timeline["silence_duration"]
+        
+        # Create a table of stats
+        stats = {
+            "Agent Speaking Time": f"{agent_time:.1f}s ({agent_time/total_duration*100:.1f}%)",
+            "Customer Speaking Time": f"{customer_time:.1f}s ({customer_time/total_duration*100:.1f}%)",
+            "Overlap Time": f"{total_overlap_time:.1f}s ({total_overlap_time/total_duration*100:.1f}%)",
+            "Silence Time": f"{silence_time:.1f}s ({silence_time/total_duration*100:.1f}%)",
+            "Total Call Duration": f"{total_duration:.1f}s"
+        }
+        
+        # Display as a Streamlit metric grid
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Agent Speaking", f"{agent_time:.1f}s", f"{agent_time/total_duration*100:.1f}%")
+        col2.metric("Customer Speaking", f"{customer_time:.1f}s", f"{customer_time/total_duration*100:.1f}%")
+        col3.metric("Total Duration", f"{total_duration:.1f}s")
+        
+        col1, col2 = st.columns(2)
+        col1.metric("Overlapping Speech", f"{total_overlap_time:.1f}s", f"{total_overlap_time/total_duration*100:.1f}%")
+        col2.metric("Silence Time", f"{silence_time:.1f}s", f"{silence_time/total_duration*100:.1f}%")
+        
+        return stats
+
+    # Call the stats function
+    calculate_conversation_stats(timeline)
+
+
+DASHBOARD_COLUMNS = [
+    "file", "agent_profanity", "borrower_profanity", "privacy_violation",
+    "total_duration", "overtalk_percentage", "silence_percentage", "error"
+]
+
+
+def dashboard_row(row):
+    """
+    A result row restricted to DASHBOARD_COLUMNS, with the overtalk and
+    silence percentages of the total duration computed from the durations.
+    """
+    table_row = {key: row.get(key) for key in DASHBOARD_COLUMNS}
+    total = row.get("total_duration")
+    if total:
+        table_row["overtalk_percentage"] = round(row["overtalk_duration"] / total * 100, 2)
+        table_row["silence_percentage"] = round(row["silence_duration"] / total * 100, 2)
+    return table_row
+
+
+def load_dashboard_files():
+    """
+    Returns (name, raw bytes) for every call picked in the dashboard, either
+    uploaded or read from a directory on the server.
+    """
+    source = st.radio("Source", ["Upload files", "Server directory"], horizontal=True)
+    if source == "Upload files":
+        uploaded = st.file_uploader("Upload conversation JSON files", type=["json"], accept_multiple_files=True)
+        return [(f.name, f.getvalue()) for f in uploaded or []]
+
+    directory = st.text_input("Directory of conversation JSON files", "All_Conversations")
+    if not os.path.isdir(directory):
+        st.warning(f"Directory not found: {directory}")
+        return []
+    files = []
+    for fname in sorted(os.listdir(directory)):
+        if fname.endswith(".json"):
+            with open(os.path.join(directory, fname), "rb") as f:
+                files.append((fname, f.read()))
+    return files
+
+
+def analyze_dashboard_files(files):
+    """
+    Runs every call not analyzed yet in this session through the worker pool
+    and returns the result rows in `files` order. Rows are kept in
+    st.session_state by file hash, so reruns and drill-downs reuse them.
+    """
+    results = st.session_state.setdefault("dashboard_results", {})
+    hashes = [hashlib.sha256(raw).hexdigest() for _, raw in files]
+
+    todo = {}
+    for (name, raw), file_hash in zip(files, hashes):
+        if file_hash not in results:
+            todo[file_hash] = (name, raw)
+
+    if todo:
+        progress = st.progress(0.0, text=f"Analyzing {len(todo)} calls...")
+        pool = get_worker_pool()
+        futures = {pool.submit(batch.analyze_bytes, name, raw): file_hash for file_hash, (name, raw) in todo.items()}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            progress.progress(done / len(todo), text=f"Analyzed {done}/{len(todo)} calls")
+        progress.empty()
+
+    return [(dict(results[file_hash], file=name), file_hash) for (name, _), file_hash in zip(files, hashes)]
+
+
+def render_dashboard():
+    st.header("Dashboard")
+    files = load_dashboard_files()
+    if not files:
+        st.info("Upload conversation files or pick a directory to analyze them all at once.")
+        return
+
+    rows = analyze_dashboard_files(files)
+    flagged = sum(
+        bool(row.get("agent_profanity") or row.get("borrower_profanity") or row.get("privacy_violation"))
+        for row, _ in rows
+    )
+    errors = sum("error" in row for row, _ in rows)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Calls", len(rows))
+    col2.metric("Flagged", flagged)
+    col3.metric("Errors", errors)
+
+    # Click a column header to sort
+    st.dataframe(
+        [dashboard_row(row) for row, _ in rows],
+        hide_index=True
+    )
+
+    st.subheader("Call Details")
+    index = st.selectbox("Select a call", range(len(rows)), format_func=lambda i: rows[i][0]["file"])
+    row, file_hash = rows[index]
+    if "error" in row:
+        st.error(f"Could not analyze {row['file']}: {row['error']}")
+        return
+
+    st.write("### 🔍 Detection Results (Pattern Matching):")
+    st.write(f"- Agent used profanity: {'✅ Yes' if row['agent_profanity'] else '❌ No'}")
+    st.write(f"- Borrower used profanity: {'✅ Yes' if row['borrower_profanity'] else '❌ No'}")
+    st.write(f"- Privacy Violation Detected: {'⚠️ Yes' if row['privacy_violation'] else '✅ No'}")
+
+    render_call_quality(get_timeline(file_hash, json.loads(files[index][1])))
+
 
 st.title("📞 Call Analysis Tool")
 
 st.sidebar.header("🔑 Gemini API Key")
 gemini_api_key = st.sidebar.text_input("Enter your Gemini API Key", type="password")
+mode = st.sidebar.radio("Mode", ["Single Call", "Dashboard"])
+
+if mode == "Dashboard":
+    render_dashboard()
+    st.stop()
 
 uploaded_file = st.file_uploader("Upload a conversation JSON file", type=["json"])
 if uploaded_file:
-    conversation = json.load(uploaded_file)
+    raw = uploaded_file.getvalue()
+    file_hash = hashlib.sha256(raw).hexdigest()
+    conversation = json.loads(raw)
 
     tab1, tab2 = st.tabs(["🗣️ Entity Detection", "📊 Call Quality Metrics"])
 
     with tab1:
         st.header("Entity Detection")
-        approach = st.selectbox("Select Approach", ["Pattern Matching", "LLM"])
+        approach = st.selectbox("Select Approach", ["Pattern Matching", "LLM", "Hybrid"])
         entity = st.selectbox("Select Entity to Analyze", ["Profanity Detection", "Privacy and Compliance Violation"])
 
-        # Map selection to detector
-        def run_detector(entity: str, approach: str, convo):
-            if entity == "Profanity Detection":
-                if approach == "Pattern Matching":
-                    detector = ProfanityRegexDetector()
-                else:
-                    print(gemini_api_key)
-                    detector = ProfanityLLMDetector(api_key=gemini_api_key)
-                result = detector.analyze_conversation(convo)
-                return result.get("agent_profanity"), result.get("borrower_profanity")
-
-            elif entity == "Privacy and Compliance Violation":
-                if approach == "Pattern Matching":
-                    detector = ComplianceRegexDetector()
-                else:
-                    detector = ComplianceLLMDetector(api_key=gemini_api_key)
-                result = detector.analyze_conversation(convo)
-                return result.get("privacy_violation"), None
-            
-        if approach == "LLM" and not gemini_api_key:
+        if approach in ("LLM", "Hybrid") and not gemini_api_key:
             st.warning("Please enter your Gemini API key in the sidebar.")
         else:
             # Run the selected analysis
             with st.spinner("Analyzing..."):
-                flag1, flag2 = run_detector(entity, approach, conversation)
+                api_key = gemini_api_key if approach != "Pattern Matching" else ""
+                try:
+                    flag1, flag2, escalated = run_detector(file_hash, entity, approach, api_key, conversation)
+                except RuntimeError as e:
+                    flag1 = flag2 = escalated = None
+                    st.error(f"The LLM request failed, so this call could not be scored: {e}")
 
-        # Show results
-        st.success("Analysis complete.")
-        if entity == "Profanity Detection":
-            st.write("### 🔍 Detection Results:")
-            st.write(f"- Agent used profanity: {'✅ Yes' if flag1 else '❌ No'}")
-            st.write(f"- Borrower used profanity: {'✅ Yes' if flag2 else '❌ No'}")
-        elif entity == "Privacy and Compliance Violation":
-            st.write("### 🔐 Compliance Result:")
-            st.write(f"- Privacy Violation Detected: {'⚠️ Yes' if flag1 else '✅ No'}")
+            # Show results
+            if flag1 is not None:
+                st.success("Analysis complete.")
+                if escalated is not None:
+                    st.caption("Escalated to the LLM: the pattern match was ambiguous." if escalated
+                               else "Decided by pattern matching; no LLM call was needed.")
+                if entity == "Profanity Detection":
+                    st.write("### 🔍 Detection Results:")
+                    st.write(f"- Agent used profanity: {'✅ Yes' if flag1 else '❌ No'}")
+                    st.write(f"- Borrower used profanity: {'✅ Yes' if flag2 else '❌ No'}")
+                elif entity == "Privacy and Compliance Violation":
+                    st.write("### 🔐 Compliance Result:")
+                    st.write(f"- Privacy Violation Detected: {'⚠️ Yes' if flag1 else '✅ No'}")
 
 
     with tab2:
-        st.header("Call Quality Metrics")
-
-        analyzer = CallQualityAnalyzer()
-        result = analyzer.analyze(conversation)
-
-        # Compute true total percentages
-        total = result['total_duration']
-        silence = result['silence_duration']
-        speaking = result['speaking_duration']
-        overtalk = result['overtalk_duration']
-        solo_speaking = speaking - overtalk
-
-        # Percentages
-        silence_pct = (silence / total) * 100
-        speaking_pct = (solo_speaking / total) * 100
-        overtalk_pct = (overtalk / total) * 100
-        overtalk_within_speaking = (overtalk / speaking) * 100 if speaking > 0 else 0
-
-        # Layout
-        st.markdown("### 🔍 Summary")
-        st.markdown(
-            f"""
-            - 🕒 **Total Call Duration:** `{total:.2f}` seconds  
-            - 🔇 **Silence:** `{silence_pct:.2f}%` of total call  
-            - 🗣️ **Speaking:** `{speaking_pct + overtalk_pct:.2f}%`  
-                - 🔁 **Overtalk:** `{overtalk_pct:.2f}%` of total  
-                - 📊 **Overtalk Share of Speaking:** `{overtalk_within_speaking:.2f}%`
-            """
-        )
-
-        # Pie Chart
-        st.markdown("### 📊 Duration Distribution")
-        labels, sizes, colors = [], [], []
-
-        if silence_pct > 0:
-            labels.append('Silence')
-            sizes.append(silence_pct)
-            colors.append('#ffc107')
-
-        if speaking_pct > 0:
-            labels.append('Speaking (Solo)')
-            sizes.append(speaking_pct)
-            colors.append('#4caf50')
-
-        if overtalk_pct > 0:
-            labels.append('Overtalk')
-            sizes.append(overtalk_pct)
-            colors.append('#f44336')
-
-        if sizes:
-            fig, ax = plt.subplots()
-            ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, colors=colors)
-            ax.axis('equal')
-            st.pyplot(fig)
-        else:
-            st.info("No segments to display in pie chart.")
-
-        def create_conversation_timeline(conversation):
-            # Find the total duration of the call
-            total_duration = max([seg["etime"] for seg in conversation])
-            
-            # Create separate entries for each speaker
-            agent_segments = []
-            customer_segments = []
-            silence_segments = []
-            
-            # Track last end time to detect silences
-            last_end_time = 0
-            
-            for i, seg in enumerate(conversation):
-                # Check for silence before this segment
-                if seg["stime"] > last_end_time + 0.5:  # Using 0.5s threshold for silence
-                    silence_segments.append({
-                        'Start': last_end_time,
-                        'End': seg["stime"],
-                    })
-                
-                # Update last end time if this segment ends later
-                last_end_time = max(last_end_time, seg["etime"])
-                
-                # Add to appropriate speaker list
-                if seg["speaker"] == "Agent":
-                    agent_segments.append({
-                        'Start': seg["stime"],
-                        'End': seg["etime"],
-                        'Text': seg["text"]
-                    })
-                else:  # Customer
-                    customer_segments.append({
-                        'Start': seg["stime"],
-                        'End': seg["etime"],
-                        'Text': seg["text"]
-                    })
-            
-            fig, ax = plt.subplots(figsize=(12, 6))
-
-            agent_color = "#4682B4"
-            customer_color = "#6B8E23"
-            overlap_color = "#FF6347" 
-            silence_color = "#DCDCDC"
-            
-            # Plot silences
-            for segment in silence_segments:
-                ax.barh(y=0, width=segment['End'] - segment['Start'], 
-                        left=segment['Start'], height=2, color=silence_color, alpha=0.3)
-            
-            # Plot Agent speech
-            for segment in agent_segments:
-                # Check for overlaps
-                is_overlapping = False
-                for cust_seg in customer_segments:
-                    if (segment['Start'] < cust_seg['End'] and 
-                        segment['End'] > cust_seg['Start']):
-                        is_overlapping = True
-                        break
-                
-                color = overlap_color if is_overlapping else agent_color
-                bar = ax.barh(y=1, width=segment['End'] - segment['Start'], 
-                            left=segment['Start'], height=0.8, color=color)
-                
-                # text annotation
-                if segment['End'] - segment['Start'] > 3:
-                    short_text = segment['Text'][:20] + "..." if len(segment['Text']) > 20 else segment['Text']
-                    ax.text(segment['Start'] + 0.1, 1, short_text, va='center', fontsize=8, color='white')
-            
-            # Plot Customer speech
-            for segment in customer_segments:
-                is_overlapping = False
-                for agent_seg in agent_segments:
-                    if (segment['Start'] < agent_seg['End'] and 
-                        segment['End'] > agent_seg['Start']):
-                        is_overlapping = True
-                        break
-                
-                color = overlap_color if is_overlapping else customer_color
-                bar = ax.barh(y=0, width=segment['End'] - segment['Start'], 
-                            left=segment['Start'], height=0.8, color=color)
-
-                if segment['End'] - segment['Start'] > 3:
-                    short_text = segment['Text'][:20] + "..." if len(segment['Text']) > 20 else segment['Text']
-                    ax.text(segment['Start'] + 0.1, 0, short_text, va='center', fontsize=8, color='white')
-            
-            # Set y-axis ticks and labels
-            ax.set_yticks([0, 1])
-            ax.set_yticklabels(['Customer', 'Agent'])
-            
-            # Set x-axis and title
-            ax.set_xlim(0, total_duration)
-            ax.set_xlabel("Time (seconds)")
-            ax.set_title("Conversation Timeline")
-            
-            ax.grid(axis='x', linestyle='--', alpha=0.6)
-
-            legend_patches = [
-                mpatches.Patch(color=agent_color, label='Agent Speaking'),
-                mpatches.Patch(color=customer_color, label='Customer Speaking'),
-                mpatches.Patch(color=overlap_color, label='Overlapping Speech'),
-                mpatches.Patch(color=silence_color, label='Silence', alpha=0.3),
-            ]
-            ax.legend(handles=legend_patches, loc='upper right')
-            
-            return fig
-
-        # In a Streamlit app, you would use it like:
-        st.markdown("### 🕓 Conversation Timeline")
-        fig = create_conversation_timeline(conversation)
-        st.pyplot(fig)
-
-        # Additional statistics
-        def calculate_conversation_stats(conversation):
-            total_duration = max([seg["etime"] for seg in conversation])
-            
-            # Calculate speaker stats
-            agent_time = sum([seg["etime"] - seg["stime"] for seg in conversation if seg["speaker"] == "Agent"])
-            customer_time = sum([seg["etime"] - seg["stime"] for seg in conversation if seg["speaker"] == "Customer"])
-            
-            # Calculate overlaps
-            overlaps = []
-            for i, seg1 in enumerate(conversation):
-                for j, seg2 in enumerate(conversation[i+1:], i+1):
-                    if seg1["speaker"] != seg2["speaker"]:
-                        # Check if they overlap
-                        if seg1["stime"] < seg2["etime"] and seg1["etime"] > seg2["stime"]:
-                            overlap_start = max(seg1["stime"], seg2["stime"])
-                            overlap_end = min(seg1["etime"], seg2["etime"])
-                            overlaps.append({
-                                "start": overlap_start,
-                                "end": overlap_end,
-                                "duration": overlap_end - overlap_start
-                            })
-            
-            total_overlap_time = sum([o["duration"] for o in overlaps])
-            
-            # Calculate silence
-            silence_time = 0
-            last_end = 0
-            for seg in sorted(conversation, key=lambda x: x["stime"]):
-                if seg["stime"] > last_end + 0.5:  # 0.5s threshold
-                    silence_time += seg["stime"] - last_end
-                last_end = max(last_end, seg["etime"])
-            
-            # Create a table of stats
-            stats = {
-                "Agent Speaking Time": f"{agent_time:.1f}s ({agent_time/total_duration*100:.1f}%)",
-                "Customer Speaking Time": f"{customer_time:.1f}s ({customer_time/total_duration*100:.1f}%)",
-                "Overlap Time": f"{total_overlap_time:.1f}s ({total_overlap_time/total_duration*100:.1f}%)",
-                "Silence Time": f"{silence_time:.1f}s ({silence_time/total_duration*100:.1f}%)",
-                "Total Call Duration": f"{total_duration:.1f}s"
-            }
-            
-            # Display as a Streamlit metric grid
-            col1, col2, col3 = st.columns(3)
-            col1.metric("Agent Speaking", f"{agent_time:.1f}s", f"{agent_time/total_duration*100:.1f}%")
-            col2.metric("Customer Speaking", f"{customer_time:.1f}s", f"{customer_time/total_duration*100:.1f}%")
-            col3.metric("Total Duration", f"{total_duration:.1f}s")
-            
-            col1, col2 = st.columns(2)
-            col1.metric("Overlapping Speech", f"{total_overlap_time:.1f}s", f"{total_overlap_time/total_duration*100:.1f}%")
-            col2.metric("Silence Time", f"{silence_time:.1f}s", f"{silence_time/total_duration*100:.1f}%")
-            
-            return stats
-
-        # Call the stats function
-        calculate_conversation_stats(conversation)
-
+        render_call_quality(get_timeline(file_hash, conversation))
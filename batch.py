@@ -0,0 +1,477 @@
+"""
+Headless batch analysis over a directory of conversation JSON files.
+
+Usage:
+    python -m batch All_Conversations --workers 8 --output results.jsonl
+    python -m batch corpus.pack --workers 8 --output results.jsonl
+
+The input is a directory of call files or a packed corpus made with
+`python -m common.packed_corpus pack`, which workers memory-map instead of
+opening and parsing one file per call.
+
+Every call is run through ProfanityRegexDetector, ComplianceRegexDetector and
+CallQualityAnalyzer in a single pass (common.pipeline), and one JSON row per
+call is written to the output.
+
+With --profanity-pack / --compliance-pack the detectors are built from
+pattern pack files (see common.pattern_packs). Each worker checks the files
+between chunks and switches to an updated pack without interrupting a call.
+"""
+import os
+import sys
+import json
+import argparse
+from functools import partial
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.conversation import Conversation, load_conversation, parse_conversation
+from common.instrumentation import Instrumentation, timed
+from common.packed_corpus import PackedCorpus
+from common.pattern_packs import PatternPackWatcher, load_pack
+from common.pipeline import AnalysisPipeline
+from common.results_store import ResultsStore, config_hash, content_hash
+from task1_profanity.regex_detector import ProfanityRegexDetector, ProfanityStage
+from task2_privacy.regex_detector import ComplianceRegexDetector, ComplianceStage
+from task3_metrics.call_quality import METRICS_VERSION, CallQualityAnalyzer, CallQualityStage
+
+# Detectors are built once per worker process by _init_worker
+_profanity_detector = None
+_compliance_detector = None
+_quality_analyzer = None
+_pipeline = None
+_instrumentation = None
+_detector_version = None
+# Packed corpora opened by this process, by path
+_packed_corpora: Dict[str, PackedCorpus] = {}
+# Pattern pack watchers, when the detectors come from pack files
+_profanity_watcher = None
+_compliance_watcher = None
+
+
+def _init_worker(
+    instrumentation: Optional[Instrumentation] = None,
+    profanity_pack: Optional[str] = None,
+    compliance_pack: Optional[str] = None
+):
+    global _profanity_detector, _compliance_detector, _quality_analyzer, _instrumentation
+    global _profanity_watcher, _compliance_watcher, _detector_version, _pipeline
+    _instrumentation = instrumentation
+    _profanity_watcher = _compliance_watcher = None
+    if profanity_pack:
+        _profanity_watcher = PatternPackWatcher(
+            profanity_pack, partial(ProfanityRegexDetector.from_pack, instrumentation=instrumentation)
+        )
+        _profanity_detector = _profanity_watcher.current
+    else:
+        _profanity_detector = ProfanityRegexDetector(instrumentation=instrumentation)
+    if compliance_pack:
+        _compliance_watcher = PatternPackWatcher(
+            compliance_pack, partial(ComplianceRegexDetector.from_pack, instrumentation=instrumentation)
+        )
+        _compliance_detector = _compliance_watcher.current
+    else:
+        _compliance_detector = ComplianceRegexDetector(instrumentation=instrumentation)
+    _quality_analyzer = CallQualityAnalyzer(instrumentation=instrumentation)
+    _detector_version = detector_version(_profanity_detector, _compliance_detector, _quality_analyzer)
+    _pipeline = build_pipeline(_profanity_detector, _compliance_detector, _quality_analyzer, instrumentation)
+
+
+def build_pipeline(
+    profanity_detector: ProfanityRegexDetector,
+    compliance_detector: ComplianceRegexDetector,
+    quality_analyzer: CallQualityAnalyzer,
+    instrumentation: Optional[Instrumentation] = None
+) -> AnalysisPipeline:
+    """
+    One pass over a call that yields the same row fields as running the
+    three analyzers one after another.
+    """
+    return (
+        AnalysisPipeline(instrumentation)
+        .add("profanity", partial(ProfanityStage, profanity_detector))
+        .add("compliance", partial(ComplianceStage, compliance_detector))
+        .add("call_quality", partial(CallQualityStage, quality_analyzer))
+    )
+
+
+def _init_pool_worker(instrumented: bool, profanity_pack: Optional[str], compliance_pack: Optional[str]):
+    _init_worker(Instrumentation() if instrumented else None, profanity_pack, compliance_pack)
+
+
+def _refresh_packs():
+    """
+    Switches to updated pattern packs, if any. Called between chunks, so no
+    call ever sees two different packs.
+    """
+    global _profanity_detector, _compliance_detector, _detector_version, _pipeline
+    swapped = False
+    if _profanity_watcher is not None and _profanity_watcher.refresh():
+        _profanity_detector = _profanity_watcher.current
+        swapped = True
+    if _compliance_watcher is not None and _compliance_watcher.refresh():
+        _compliance_detector = _compliance_watcher.current
+        swapped = True
+    if swapped:
+        _detector_version = detector_version(_profanity_detector, _compliance_detector, _quality_analyzer)
+        _pipeline = build_pipeline(_profanity_detector, _compliance_detector, _quality_analyzer, _instrumentation)
+
+
+def iter_conversation_files(directory: str) -> Iterator[str]:
+    """
+    Streams the paths of conversation files in a directory without listing
+    the whole directory up front.
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".json"):
+                yield entry.path
+
+
+def _analyze(name: str, load: Callable[[], Conversation]) -> Dict:
+    if _profanity_detector is None:
+        _init_worker()
+
+    row = {"file": name}
+    try:
+        with timed(_instrumentation, "load", detector="batch"):
+            conversation = load()
+        row.update(_pipeline.analyze_merged(conversation))
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def analyze_file(path: str, with_hash: bool = False) -> Dict:
+    """
+    One result row for a call file. With `with_hash` the row also carries
+    the "content_hash" of the file and the "detector_version" that produced
+    it, for the results store.
+    """
+    if not with_hash:
+        return _analyze(os.path.basename(path), lambda: load_conversation(path))
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return {"file": os.path.basename(path), "error": f"{type(e).__name__}: {e}"}
+    row = analyze_bytes(os.path.basename(path), data)
+    row["content_hash"] = content_hash(data)
+    row["detector_version"] = _detector_version
+    return row
+
+
+def analyze_bytes(name: str, data: bytes) -> Dict:
+    """
+    Same row as analyze_file, for a call that is already in memory (e.g. an
+    upload).
+    """
+    return _analyze(name, lambda: parse_conversation(data))
+
+
+def _analyze_chunk(paths: List[str], with_hash: bool = False) -> Tuple[List[Dict], Optional[Dict]]:
+    _refresh_packs()
+    rows = [analyze_file(path, with_hash) for path in paths]
+    if _instrumentation is None:
+        return rows, None
+    # Hand this chunk's metrics back to the parent and start afresh
+    snapshot = _instrumentation.snapshot()
+    _instrumentation.reset()
+    return rows, snapshot
+
+
+def _packed_corpus(path: str) -> PackedCorpus:
+    corpus = _packed_corpora.get(path)
+    if corpus is None:
+        corpus = _packed_corpora[path] = PackedCorpus(path)
+    return corpus
+
+
+def analyze_packed_call(path: str, index: int) -> Dict:
+    """
+    One result row for call `index` of a packed corpus.
+    """
+    corpus = _packed_corpus(path)
+    return _analyze(corpus.names[index], lambda: corpus[index])
+
+
+def _analyze_packed_chunk(path: str, indices: List[int]) -> Tuple[List[Dict], Optional[Dict]]:
+    _refresh_packs()
+    rows = [analyze_packed_call(path, index) for index in indices]
+    if _instrumentation is None:
+        return rows, None
+    snapshot = _instrumentation.snapshot()
+    _instrumentation.reset()
+    return rows, snapshot
+
+
+def _chunked(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def detector_version(
+    profanity: Optional[ProfanityRegexDetector] = None,
+    compliance: Optional[ComplianceRegexDetector] = None,
+    quality: Optional[CallQualityAnalyzer] = None
+) -> str:
+    """
+    Hash of everything that decides a result row: the profanity and
+    compliance pattern lists, and the call quality tolerance and metric
+    definitions. Defaults to the built-in patterns.
+    """
+    profanity = profanity or ProfanityRegexDetector()
+    compliance = compliance or ComplianceRegexDetector()
+    quality = quality or CallQualityAnalyzer()
+    return config_hash({
+        "profanity": [profanity.profanity_patterns, profanity.obfuscated_patterns, profanity.contextual_patterns],
+        "compliance": [compliance.sensitive_patterns, compliance.verification_patterns],
+        "call_quality": [quality.tolerance, METRICS_VERSION]
+    })
+
+
+def analyze_paths(
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+    max_pending: Optional[int] = None,
+    instrumentation: Optional[Instrumentation] = None,
+    with_hash: bool = False,
+    profanity_pack: Optional[str] = None,
+    compliance_pack: Optional[str] = None
+) -> Iterator[Dict]:
+    """
+    Yields one result row per call file, in completion order.
+
+    Files are submitted in chunks of `chunk_size` paths, and at most
+    `max_pending` chunks are in flight at once, so memory stays bounded no
+    matter how many files there are. With workers=1 everything runs in the
+    calling process.
+
+    With `instrumentation`, every worker records its own timings and
+    counters and they are merged into it as chunks complete.
+
+    With pack paths, the detectors are built from those pattern packs and
+    pick up changes to them between chunks.
+    """
+    return _run_chunks(
+        _chunked(paths, chunk_size),
+        partial(analyze_file, with_hash=with_hash),
+        partial(_analyze_chunk, with_hash=with_hash),
+        workers, max_pending, instrumentation, profanity_pack, compliance_pack
+    )
+
+
+def analyze_packed(
+    path: str,
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+    max_pending: Optional[int] = None,
+    instrumentation: Optional[Instrumentation] = None,
+    profanity_pack: Optional[str] = None,
+    compliance_pack: Optional[str] = None
+) -> Iterator[Dict]:
+    """
+    Like analyze_paths for every call of a packed corpus. Only call indices
+    are sent to the workers; each one maps the corpus file itself.
+    """
+    with PackedCorpus(path) as corpus:
+        calls = len(corpus)
+    return _run_chunks(
+        _chunked(range(calls), chunk_size),
+        partial(analyze_packed_call, path),
+        partial(_analyze_packed_chunk, path),
+        workers, max_pending, instrumentation, profanity_pack, compliance_pack
+    )
+
+
+def _run_chunks(
+    chunks: Iterator[List],
+    analyze_one: Callable,
+    analyze_chunk: Callable,
+    workers: Optional[int],
+    max_pending: Optional[int],
+    instrumentation: Optional[Instrumentation],
+    profanity_pack: Optional[str],
+    compliance_pack: Optional[str]
+) -> Iterator[Dict]:
+    def collect(result: Tuple[List[Dict], Optional[Dict]]) -> List[Dict]:
+        rows, snapshot = result
+        if snapshot is not None:
+            instrumentation.merge(snapshot)
+        return rows
+
+    if workers == 1:
+        _init_worker(instrumentation, profanity_pack, compliance_pack)
+        for chunk in chunks:
+            _refresh_packs()
+            for item in chunk:
+                yield analyze_one(item)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    initargs = (instrumentation is not None, profanity_pack, compliance_pack)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker, initargs=initargs) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(analyze_chunk, chunk))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from collect(future.result())
+
+        for future in pending:
+            yield from collect(future.result())
+
+
+def run_batch(
+    directory: str,
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+    max_pending: Optional[int] = None,
+    instrumentation: Optional[Instrumentation] = None,
+    profanity_pack: Optional[str] = None,
+    compliance_pack: Optional[str] = None
+) -> Iterator[Dict]:
+    """
+    Yields one result row per call in the directory, in completion order.
+    See analyze_paths.
+    """
+    return analyze_paths(
+        iter_conversation_files(directory), workers, chunk_size, max_pending, instrumentation,
+        profanity_pack=profanity_pack, compliance_pack=compliance_pack
+    )
+
+
+def run_incremental(
+    directory: str,
+    store: ResultsStore,
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+    instrumentation: Optional[Instrumentation] = None,
+    profanity_pack: Optional[str] = None,
+    compliance_pack: Optional[str] = None
+) -> Iterator[Dict]:
+    """
+    Like run_batch, but skips calls the store already holds for the current
+    detector version with the same file size and mtime, and records every
+    new row in the store. Yields only the rows analyzed in this run.
+
+    If a pattern pack changes mid-run, rows are recorded under the version
+    that actually produced them.
+    """
+    _init_worker(profanity_pack=profanity_pack, compliance_pack=compliance_pack)
+    version = _detector_version
+    known = store.index(version)
+
+    stale = {}
+    for path in iter_conversation_files(directory):
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        if known.get(key) != (stat.st_size, stat.st_mtime_ns):
+            stale[os.path.basename(path)] = (key, stat)
+
+    paths = [key for key, _ in stale.values()]
+    try:
+        rows = analyze_paths(
+            paths, workers, chunk_size, instrumentation=instrumentation, with_hash=True,
+            profanity_pack=profanity_pack, compliance_pack=compliance_pack
+        )
+        for row in rows:
+            key, stat = stale[row["file"]]
+            row_version = row.pop("detector_version", version)
+            if "content_hash" in row:
+                store.record(key, stat.st_size, stat.st_mtime_ns, row_version, row)
+            yield row
+    finally:
+        store.commit()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Analyze every conversation file in a directory.")
+    parser.add_argument("directory", help="Directory of conversation JSON files, or a packed corpus file")
+    parser.add_argument("--output", "-o", help="Path of the JSON lines output (default: stdout)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Files per submitted task")
+    parser.add_argument("--metrics", help="Write stage timings and pattern hits here in Prometheus text format")
+    parser.add_argument("--store", help="SQLite results store; only new or changed calls are analyzed")
+    parser.add_argument("--profanity-pack", help="Profanity pattern pack file, e.g. patterns/profanity.json")
+    parser.add_argument("--compliance-pack", help="Compliance pattern pack file, e.g. patterns/compliance.json")
+    args = parser.parse_args(argv)
+
+    instrumentation = Instrumentation() if args.metrics else None
+
+    for path, name in ((args.profanity_pack, "profanity"), (args.compliance_pack, "compliance")):
+        if path:
+            try:
+                load_pack(path, expected_name=name)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] {e}", file=sys.stderr)
+                return 1
+
+    packed = os.path.isfile(args.directory)
+    if packed and args.store:
+        print("[ERROR] --store needs a directory of call files, not a packed corpus", file=sys.stderr)
+        return 1
+
+    store = ResultsStore(args.store) if args.store else None
+    out = open(args.output, "w") if args.output else sys.stdout
+    calls, errors = 0, 0
+    try:
+        if store is not None:
+            rows = run_incremental(
+                args.directory, store,
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+                instrumentation=instrumentation,
+                profanity_pack=args.profanity_pack,
+                compliance_pack=args.compliance_pack
+            )
+        elif packed:
+            rows = analyze_packed(
+                args.directory,
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+                instrumentation=instrumentation,
+                profanity_pack=args.profanity_pack,
+                compliance_pack=args.compliance_pack
+            )
+        else:
+            rows = run_batch(
+                args.directory,
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+                instrumentation=instrumentation,
+                profanity_pack=args.profanity_pack,
+                compliance_pack=args.compliance_pack
+            )
+        for row in rows:
+            out.write(json.dumps(row) + "\n")
+            calls += 1
+            errors += "error" in row
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if store is not None:
+            store.close()
+
+    if instrumentation is not None:
+        instrumentation.count("calls", calls, detector="batch")
+        instrumentation.count("errors", errors, detector="batch")
+        with open(args.metrics, "w") as f:
+            f.write(instrumentation.prometheus_text())
+
+    print(f"Analyzed {calls} calls ({errors} errors)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
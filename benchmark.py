@@ -0,0 +1,252 @@
+"""
+Repeatable throughput and latency benchmarks for the detectors and metrics.
+
+Usage:
+    python -m benchmark All_Conversations --output bench.json
+    python -m benchmark All_Conversations --save-baseline benchmark_baseline.json
+    python -m benchmark All_Conversations --baseline benchmark_baseline.json
+
+Each run covers the bundled corpus plus synthetic corpora with calls made
+longer (more utterances per call) or more numerous. LLM detectors are timed
+against a local fake Gemini server with configurable latency. With
+--baseline, the run exits non-zero if any metric regressed by more than
+--threshold.
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+from statistics import quantiles
+from typing import Callable, Dict, List, Tuple
+
+from common.conversation import Conversation, iter_conversations
+from common.fake_gemini import FakeGeminiServer
+from common.gemini_client import AsyncGeminiClient, http_transport
+from common.llm_batching import estimate_tokens
+from task1_profanity.regex_detector import ProfanityRegexDetector
+from task2_privacy.regex_detector import ComplianceRegexDetector
+from task3_metrics.call_quality import CallQualityAnalyzer
+
+# name -> (utterance length factor, call count factor)
+DEFAULT_SCALES = {
+    "1x": (1, 1),
+    "10x_length": (10, 1),
+    "10x_count": (1, 10),
+    "100x_length": (100, 1),
+    "100x_count": (1, 100)
+}
+
+
+def scale_corpus(conversations: List[Conversation], length_factor: int, count_factor: int) -> List[Conversation]:
+    """
+    Builds a synthetic corpus. Each call is made `length_factor` times longer
+    by replaying its utterances shifted past the previous end, and the set of
+    calls is repeated `count_factor` times.
+    """
+    scaled = []
+    for conv in conversations:
+        if length_factor == 1 or not len(conv):
+            scaled.append(conv)
+            continue
+
+        span = max(conv.etime) - min(conv.stime)
+        records = []
+        for rep in range(length_factor):
+            offset = rep * span
+            records.extend(
+                {"speaker": utt.speaker, "text": utt.text, "stime": utt.stime + offset, "etime": utt.etime + offset}
+                for utt in conv
+            )
+        scaled.append(Conversation.from_records(records))
+    return scaled * count_factor
+
+
+def _throughput(conversations: List[Conversation], run: Callable, repeat: int) -> Dict[str, float]:
+    utterances = sum(len(conv) for conv in conversations)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for conv in conversations:
+            run(conv)
+        best = min(best, time.perf_counter() - started)
+    best = max(best, 1e-9)
+    return {
+        "calls_per_second": len(conversations) / best,
+        "utterances_per_second": utterances / best
+    }
+
+
+def _latency(conversations: List[Conversation], run: Callable) -> Dict[str, float]:
+    samples = []
+    for conv in conversations:
+        started = time.perf_counter()
+        run(conv)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    if len(samples) < 2:
+        samples = samples * 2
+    cuts = quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": cuts[49],
+        "p90_ms": cuts[89],
+        "p99_ms": cuts[98],
+        "calls_per_second": len(samples) / max(sum(samples) / 1000, 1e-9)
+    }
+
+
+def bench_local(conversations: List[Conversation], repeat: int) -> Dict[str, Dict[str, float]]:
+    profanity = ProfanityRegexDetector()
+    compliance = ComplianceRegexDetector()
+    quality = CallQualityAnalyzer()
+    return {
+        "profanity_regex": _throughput(conversations, profanity.analyze_conversation, repeat),
+        "compliance_regex": _throughput(conversations, compliance.analyze_conversation, repeat),
+        "call_quality": _latency(conversations, quality.analyze)
+    }
+
+
+def bench_llm(
+    conversations: List[Conversation],
+    latency: float,
+    concurrency: int
+) -> Dict[str, Dict[str, float]]:
+    # Imported here so the regex benchmarks run without the Gemini SDK
+    from task1_profanity.llm_detector import ProfanityLLMDetector
+    from task2_privacy.llm_detector import ComplianceLLMDetector
+
+    results = {}
+    with FakeGeminiServer(latency=latency) as server:
+        for name, detector_cls in (("profanity_llm", ProfanityLLMDetector), ("compliance_llm", ComplianceLLMDetector)):
+            client = AsyncGeminiClient(
+                transport=http_transport(api_key="benchmark", base_url=server.base_url),
+                max_concurrency=concurrency
+            )
+            detector = detector_cls(api_key="benchmark", client=client)
+            build_prompts = getattr(detector, "build_prompts", lambda conv: [detector.build_prompt(conv)])
+            prompt_tokens = sum(
+                estimate_tokens(prompt) for conv in conversations for prompt in build_prompts(conv)
+            )
+
+            started = time.perf_counter()
+            asyncio.run(detector.analyze_conversations_async(conversations))
+            elapsed = max(time.perf_counter() - started, 1e-9)
+            results[name] = {
+                "calls_per_second": len(conversations) / elapsed,
+                "requests": client.stats["requests"],
+                "prompt_tokens_per_call": prompt_tokens / max(len(conversations), 1)
+            }
+    return results
+
+
+def run_benchmarks(
+    directory: str,
+    scales: Dict[str, Tuple[int, int]],
+    repeat: int = 3,
+    llm_latency: float = 0.05,
+    llm_concurrency: int = 16,
+    skip_llm: bool = False
+) -> Dict:
+    corpus = [conv for _, conv in iter_conversations(directory)]
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "corpus_calls": len(corpus),
+            "repeat": repeat
+        },
+        "scales": {}
+    }
+
+    for name, (length_factor, count_factor) in scales.items():
+        scaled = scale_corpus(corpus, length_factor, count_factor)
+        results["scales"][name] = bench_local(scaled, repeat)
+
+    if not skip_llm:
+        results["llm"] = bench_llm(corpus, llm_latency, llm_concurrency)
+        results["meta"]["llm_latency_s"] = llm_latency
+        results["meta"]["llm_concurrency"] = llm_concurrency
+
+    return results
+
+
+def _flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+
+def compare_to_baseline(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Returns a description of each metric that regressed by more than
+    `threshold` (a fraction). Rates (*_per_second) must not drop and
+    latencies (*_ms) must not grow; other counters are not compared.
+    """
+    current, previous = _flatten(results), _flatten(baseline)
+    regressions = []
+    for path, old in previous.items():
+        new = current.get(path)
+        if new is None or not old:
+            continue
+        if path.endswith("_per_second") and new < old * (1 - threshold):
+            regressions.append(f"{path}: {old:.1f} -> {new:.1f} ({(new / old - 1) * 100:+.1f}%)")
+        elif path.endswith("_ms") and new > old * (1 + threshold):
+            regressions.append(f"{path}: {old:.3f} -> {new:.3f} ({(new / old - 1) * 100:+.1f}%)")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the detectors and call quality metrics.")
+    parser.add_argument("directory", nargs="?", default="All_Conversations")
+    parser.add_argument("--output", "-o", help="Write the JSON results here (default: stdout)")
+    parser.add_argument("--scales", default=",".join(DEFAULT_SCALES), help="Comma separated scale names")
+    parser.add_argument("--repeat", type=int, default=3, help="Rounds per throughput measurement; the best is kept")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake Gemini response latency in seconds")
+    parser.add_argument("--llm-concurrency", type=int, default=16)
+    parser.add_argument("--skip-llm", action="store_true")
+    parser.add_argument("--baseline", help="Compare against a stored baseline and fail on regressions")
+    parser.add_argument("--save-baseline", help="Store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed regression as a fraction")
+    args = parser.parse_args(argv)
+
+    scales = {name: DEFAULT_SCALES[name] for name in args.scales.split(",") if name}
+    results = run_benchmarks(
+        args.directory, scales,
+        repeat=args.repeat,
+        llm_latency=args.llm_latency,
+        llm_concurrency=args.llm_concurrency,
+        skip_llm=args.skip_llm
+    )
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare_to_baseline(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"[REGRESSION] {line}", file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
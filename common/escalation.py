@@ -0,0 +1,143 @@
+"""
+Tiered detection: a regex detector decides every call and only the calls it
+is unsure about are sent to an LLM detector.
+
+Subclasses supply `ambiguity_reasons`, which names what made a call
+ambiguous (a near-miss wording, a weak match, ...). Each reason carries a
+confidence weight; a call's confidence is the lowest weight among its
+reasons (1.0 when there are none) and the call is escalated when that falls
+below `threshold`. threshold=0 never escalates and threshold>1 always does.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+
+class EscalationStats:
+    def __init__(self):
+        self.calls = 0
+        self.escalated = 0
+        self.reasons = Counter()
+
+    @property
+    def rate(self) -> float:
+        return self.escalated / self.calls if self.calls else 0.0
+
+    def record(self, escalated: bool, reasons: List[str]):
+        self.calls += 1
+        self.escalated += escalated
+        self.reasons.update(reasons)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "escalated": self.escalated,
+            "escalation_rate": self.rate,
+            "reasons": dict(self.reasons)
+        }
+
+
+class HybridDetector(ABC):
+    # reason -> confidence weight; subclasses fill this in
+    DEFAULT_WEIGHTS: Dict[str, float] = {}
+
+    def __init__(
+        self,
+        regex_detector,
+        llm_detector=None,
+        api_key: str = None,
+        threshold: float = 0.5,
+        weights: Dict[str, float] = None
+    ):
+        self.regex_detector = regex_detector
+        # Built on first escalation when not given, so calls that never
+        # escalate need neither the Gemini SDK nor an API key
+        self.llm_detector = llm_detector
+        self.api_key = api_key
+        self.threshold = threshold
+        self.weights = dict(self.DEFAULT_WEIGHTS, **(weights or {}))
+        self.stats = EscalationStats()
+
+    @abstractmethod
+    def build_llm_detector(self):
+        """
+        Returns the LLM detector escalated calls are sent to.
+        """
+
+    @abstractmethod
+    def ambiguity_reasons(self, conversation) -> Tuple[Dict[str, bool], List[str]]:
+        """
+        Returns the regex verdict and the reasons, possibly none, why it might
+        be wrong.
+        """
+
+    def _llm(self):
+        if self.llm_detector is None:
+            self.llm_detector = self.build_llm_detector()
+        return self.llm_detector
+
+    @staticmethod
+    def _escalated_verdict(regex_verdict: Dict[str, bool], llm_verdict: Dict) -> Dict:
+        # A failed LLM request leaves the regex verdict standing, with the
+        # error kept so the call can be told apart and retried
+        if "error" in llm_verdict:
+            return dict(regex_verdict, error=llm_verdict["error"])
+        return llm_verdict
+
+    def assess(self, conversation) -> Dict[str, Any]:
+        """
+        Regex pass only: the verdict, its confidence, the reasons and whether
+        the call should be escalated. Does not touch the LLM or the stats.
+        """
+        verdict, reasons = self.ambiguity_reasons(conversation)
+        confidence = min((self.weights.get(reason, 0.0) for reason in reasons), default=1.0)
+        return {
+            "verdict": verdict,
+            "confidence": confidence,
+            "reasons": reasons,
+            "escalate": confidence < self.threshold
+        }
+
+    def analyze_conversation_detailed(self, conversation) -> Dict[str, Any]:
+        """
+        Same verdict as analyze_conversation, plus "escalated", "confidence"
+        and "reasons".
+        """
+        assessment = self.assess(conversation)
+        verdict = assessment["verdict"]
+        if assessment["escalate"]:
+            verdict = self._escalated_verdict(verdict, self._llm().analyze_conversation(conversation))
+        self.stats.record(assessment["escalate"], assessment["reasons"])
+        return dict(
+            verdict,
+            escalated=assessment["escalate"],
+            confidence=assessment["confidence"],
+            reasons=assessment["reasons"]
+        )
+
+    def analyze_conversation(self, conversation) -> Dict[str, bool]:
+        result = self.analyze_conversation_detailed(conversation)
+        return {key: result[key] for key in result if key not in ("escalated", "confidence", "reasons")}
+
+    async def analyze_conversations_async(self, conversations: Dict[str, Any]) -> Dict[str, Dict[str, bool]]:
+        """
+        Decides every call with the regex detector and sends only the
+        escalated ones to the LLM, concurrently.
+        """
+        results, escalated = {}, []
+        for call_id, conversation in conversations.items():
+            assessment = self.assess(conversation)
+            self.stats.record(assessment["escalate"], assessment["reasons"])
+            results[call_id] = assessment["verdict"]
+            if assessment["escalate"]:
+                escalated.append(call_id)
+
+        if escalated:
+            llm = self._llm()
+            verdicts = await asyncio.gather(
+                *(llm.analyze_conversation_async(conversations[call_id]) for call_id in escalated)
+            )
+            for call_id, verdict in zip(escalated, verdicts):
+                results[call_id] = self._escalated_verdict(results[call_id], verdict)
+        return {call_id: results[call_id] for call_id in conversations}
@@ -0,0 +1,92 @@
+"""
+Local stand-in for the Gemini REST endpoint, for benchmarks and load tests
+that must not touch the network. Point common.gemini_client.http_transport at
+`server.base_url`.
+"""
+import re
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_CALL_ID = re.compile(r"^### Call ID: (.+)$", re.MULTILINE)
+
+NEGATIVE_VERDICT = {
+    "agent_profanity": False,
+    "borrower_profanity": False,
+    "privacy_violation": False
+}
+
+
+class FakeGeminiServer:
+    """
+    Serves generateContent requests after `latency` seconds. A share of
+    requests given by `error_rate` fail with HTTP 429 or 503 so retry paths
+    get exercised. Batched prompts get one verdict per call ID back.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with fake._lock:
+                    fake.requests += 1
+
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake.error_rate and random.random() < fake.error_rate:
+                    self.send_error(random.choice((429, 503)))
+                    return
+
+                prompt = body["contents"][0]["parts"][0]["text"]
+                call_ids = _CALL_ID.findall(prompt)
+                if call_ids:
+                    verdict = [dict(NEGATIVE_VERDICT, call_id=call_id) for call_id in call_ids]
+                else:
+                    verdict = NEGATIVE_VERDICT
+
+                payload = json.dumps({
+                    "candidates": [{"content": {"parts": [{"text": json.dumps(verdict)}]}}]
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeGeminiServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import urllib.request
+import urllib.error
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+# Seconds before a request is abandoned
+DEFAULT_TIMEOUT = 30.0
+
+# A transport takes a prompt and returns the raw text of the model response
+Transport = Callable[[str], Awaitable[str]]
+
+
+class GeminiHTTPError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"HTTP {code}: {message}")
+        self.code = code
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Rate limits (429), server errors (5xx), timeouts and network failures
+    (unreachable host, reset or dropped connection) are worth retrying. Both
+    the google SDK exceptions and GeminiHTTPError carry the HTTP status in a
+    `code` attribute.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(exc, urllib.error.URLError) and not isinstance(exc, urllib.error.HTTPError):
+        return True
+    code = getattr(exc, "code", None)
+    if callable(code):  # grpc style exceptions expose code() instead
+        return False
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+
+class TokenBucket:
+    """
+    Async token bucket: allows `rate` acquisitions per second on average,
+    with bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def sdk_transport(api_key: str = None, model_name: str = DEFAULT_MODEL) -> Transport:
+    """
+    Transport backed by the google-generativeai SDK.
+    """
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+    model = genai.GenerativeModel(model_name)
+
+    async def send(prompt: str) -> str:
+        response = await model.generate_content_async(prompt)
+        return response.text
+
+    return send
+
+
+def http_transport(
+    api_key: str = None,
+    model_name: str = DEFAULT_MODEL,
+    base_url: str = DEFAULT_BASE_URL,
+    timeout: float = DEFAULT_TIMEOUT
+) -> Transport:
+    """
+    Transport speaking the Gemini REST API directly. Pointing `base_url` at a
+    local fake server allows load testing without network access.
+
+    `timeout` bounds the socket operations of each request. It should match
+    the client's timeout: AsyncGeminiClient can only stop waiting for the
+    worker thread, and the thread stays blocked in the read until this
+    timeout ends it.
+    """
+    api_key = api_key or os.getenv("GEMINI_API_KEY") or ""
+    url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}:generateContent?key={api_key}"
+
+    def post(prompt: str) -> str:
+        body = json.dumps({"contents": [{"parts": [{"text": prompt}]}]}).encode("utf-8")
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                payload = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise GeminiHTTPError(e.code, e.reason) from e
+        return payload["candidates"][0]["content"]["parts"][0]["text"]
+
+    async def send(prompt: str) -> str:
+        return await asyncio.to_thread(post, prompt)
+
+    return send
+
+
+class AsyncGeminiClient:
+    """
+    Shared async client for the LLM detectors. Bounds the number of in-flight
+    requests, rate limits with a token bucket, applies a per-request timeout
+    and retries 429/5xx responses with exponential backoff and jitter.
+    """
+
+    def __init__(
+        self,
+        api_key: str = None,
+        model_name: str = DEFAULT_MODEL,
+        transport: Transport = None,
+        max_concurrency: int = 8,
+        requests_per_second: Optional[float] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0
+    ):
+        self.model_name = model_name
+        self.transport = transport or sdk_transport(api_key, model_name)
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+        # Bound to the event loop they were created on; see _limits
+        self._loop = None
+        self._semaphore = None
+        self._bucket = None
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _limits(self) -> Tuple[asyncio.Semaphore, Optional[TokenBucket]]:
+        # asyncio primitives only work on one event loop, so a client reused
+        # from a second asyncio.run() gets a fresh semaphore and bucket
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._bucket = TokenBucket(self.requests_per_second) if self.requests_per_second else None
+        return self._semaphore, self._bucket
+
+    async def generate(self, prompt: str) -> str:
+        semaphore, bucket = self._limits()
+
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    if bucket is not None:
+                        await bucket.acquire()
+                    self.stats["requests"] += 1
+                    return await asyncio.wait_for(self.transport(prompt), self.timeout)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self.stats)
+
+
+def check_client(calls: int = 20) -> List[str]:
+    """
+    Regression check against a local FakeGeminiServer: one client used from
+    two asyncio.run() calls, with a rate limit, and a transport whose first
+    attempt per prompt fails with a connection reset. Returns the problems.
+    """
+    from common.fake_gemini import FakeGeminiServer
+
+    problems = []
+    with FakeGeminiServer() as server:
+        client = AsyncGeminiClient(
+            transport=http_transport(api_key="test", base_url=server.base_url),
+            requests_per_second=1000.0,
+            backoff_base=0.01
+        )
+
+        async def run_all(run: int) -> int:
+            results = await asyncio.gather(
+                *(client.generate(f"run {run} call {i}") for i in range(calls)), return_exceptions=True
+            )
+            return sum(isinstance(result, Exception) for result in results)
+
+        for run in range(2):
+            failed = asyncio.run(run_all(run))
+            if failed:
+                problems.append(f"event loop {run + 1}: {failed} of {calls} calls failed")
+
+    seen = set()
+
+    async def flaky(prompt: str) -> str:
+        if prompt not in seen:
+            seen.add(prompt)
+            raise ConnectionResetError("connection reset by peer")
+        return "{}"
+
+    async def run_flaky() -> int:
+        flaky_client = AsyncGeminiClient(transport=flaky, backoff_base=0.01)
+        results = await asyncio.gather(*(flaky_client.generate(str(i)) for i in range(calls)), return_exceptions=True)
+        return sum(isinstance(result, Exception) for result in results)
+
+    failed = asyncio.run(run_flaky())
+    if failed:
+        problems.append(f"connection resets: {failed} of {calls} calls were not retried")
+    return problems
+
+
+if __name__ == "__main__":
+    problems = check_client()
+    for problem in problems:
+        print(f"[ERROR] {problem}")
+    print(f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,149 @@
+"""
+Timings and counters shared by the detectors, the call quality analyzer and
+the batch runner.
+
+Pass an Instrumentation to a detector's `instrumentation` argument to record:
+- per-stage timings ("load", "format", "regex_scan", "llm_request",
+  "batch_request", "parse", "analyze", "pipeline" for a fused single pass,
+  and "call" for a whole LLM verdict), labelled by detector
+- verdict outcomes ("ok", "cache_hit", "error") and fallbacks
+- per-pattern hit counts of the regex detectors
+
+Read the results with snapshot() or prometheus_text(), or pass a callback
+that is invoked on every event. Detectors built without one skip all of it,
+so the disabled path costs a single `is None` check per call.
+"""
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+# callback(kind, name, value, labels) with kind "timing" or "counter"
+Callback = Callable[[str, str, float, Dict[str, str]], None]
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, str]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Instrumentation:
+    def __init__(self, callback: Callback = None, prefix: str = "call_analysis"):
+        self.callback = callback
+        self.prefix = prefix
+        # The sync LLM path scores transcript windows on a thread pool
+        self._lock = threading.Lock()
+        # (stage, labels) -> [count, total seconds, max seconds]
+        self.timings: Dict[_Key, list] = {}
+        # (name, labels) -> value
+        self.counters: Dict[_Key, float] = {}
+
+    def observe(self, stage: str, seconds: float, **labels):
+        key = _key(stage, labels)
+        with self._lock:
+            stats = self.timings.get(key)
+            if stats is None:
+                self.timings[key] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+        if self.callback is not None:
+            self.callback("timing", stage, seconds, labels)
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        if self.callback is not None:
+            self.callback("counter", name, value, labels)
+
+    @contextmanager
+    def timer(self, stage: str, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict[str, list]:
+        with self._lock:
+            return {
+                "timings": [
+                    {"stage": stage, "labels": dict(labels), "count": count, "sum": total, "max": peak}
+                    for (stage, labels), (count, total, peak) in self.timings.items()
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ]
+            }
+
+    def merge(self, snapshot: Dict[str, list]):
+        """
+        Adds a snapshot taken elsewhere, e.g. in a worker process. Callbacks
+        are not replayed.
+        """
+        with self._lock:
+            for item in snapshot["timings"]:
+                key = _key(item["stage"], item["labels"])
+                stats = self.timings.setdefault(key, [0, 0.0, 0.0])
+                stats[0] += item["count"]
+                stats[1] += item["sum"]
+                stats[2] = max(stats[2], item["max"])
+            for item in snapshot["counters"]:
+                key = _key(item["name"], item["labels"])
+                self.counters[key] = self.counters.get(key, 0) + item["value"]
+
+    def reset(self):
+        with self._lock:
+            self.timings.clear()
+            self.counters.clear()
+
+    def prometheus_text(self) -> str:
+        """
+        Prometheus text exposition: stage timings as a summary
+        (<prefix>_stage_seconds_count/_sum) plus a _max gauge, and every
+        counter as <prefix>_<name>_total.
+        """
+        metric = f"{self.prefix}_stage_seconds"
+        lines = []
+        with self._lock:
+            if self.timings:
+                lines.append(f"# TYPE {metric} summary")
+                for (stage, labels), (count, total, _) in sorted(self.timings.items()):
+                    label_text = _format_labels(labels + (("stage", stage),))
+                    lines.append(f"{metric}_count{label_text} {count}")
+                    lines.append(f"{metric}_sum{label_text} {total:.9f}")
+                lines.append(f"# TYPE {metric}_max gauge")
+                for (stage, labels), (_, _, peak) in sorted(self.timings.items()):
+                    lines.append(f"{metric}_max{_format_labels(labels + (('stage', stage),))} {peak:.9f}")
+
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f"{self.prefix}_{name}_total{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def timed(instrumentation: Optional[Instrumentation], stage: str, **labels):
+    """
+    instrumentation.timer(...), or a no-op context when instrumentation is
+    None.
+    """
+    if instrumentation is None:
+        return nullcontext()
+    return instrumentation.timer(stage, **labels)
@@ -0,0 +1,170 @@
+"""
+Packs several conversations into one Gemini prompt and splits the JSON array
+that comes back into per-call verdicts. Used by the LLM detectors'
+analyze_conversations_batched methods. Calls that a windowing detector would
+split into several prompts are not packed; they are scored on their own.
+"""
+import json
+import asyncio
+from typing import Dict, List, Tuple
+
+from common.instrumentation import timed
+
+# Rough characters-per-token ratio for English text on Gemini tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def pack_batches(
+    items: List[Tuple[str, str]],
+    token_budget: int,
+    max_batch_size: int
+) -> List[List[Tuple[str, str]]]:
+    """
+    Greedily groups (call_id, transcript) pairs so that each group stays
+    within `token_budget` estimated tokens and `max_batch_size` calls. A
+    transcript larger than the budget gets a batch of its own.
+    """
+    batches, current, used = [], [], 0
+    for call_id, transcript in items:
+        tokens = estimate_tokens(transcript)
+        if current and (used + tokens > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, used = [], 0
+        current.append((call_id, transcript))
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def format_batch(batch: List[Tuple[str, str]]) -> str:
+    return "\n\n".join(f"### Call ID: {call_id}\n{transcript}" for call_id, transcript in batch)
+
+
+def parse_batch_response(text: str, call_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Returns the verdict objects keyed by call ID. Entries for unknown IDs are
+    ignored; IDs missing from the response are simply absent from the result.
+    """
+    json_text = text.strip().strip("```json").strip("```").strip()
+    parsed = json.loads(json_text)
+    if not isinstance(parsed, list):
+        raise ValueError("Expected a JSON array of verdicts")
+
+    wanted = set(call_ids)
+    verdicts = {}
+    for item in parsed:
+        if isinstance(item, dict) and str(item.get("call_id")) in wanted:
+            verdicts[str(item["call_id"])] = item
+    return verdicts
+
+
+def _split_cached(detector, conversations: Dict[str, object]):
+    # Cached verdicts, (call_id, transcript) pairs to pack, and the calls
+    # that need more than one window (detectors with build_prompts)
+    results, pending, windowed = {}, [], []
+    build_prompts = getattr(detector, "build_prompts", None)
+    for call_id, conversation in conversations.items():
+        prompts = build_prompts(conversation) if build_prompts is not None else None
+        if prompts is not None and len(prompts) > 1:
+            windowed.append(call_id)
+            continue
+        if detector.cache is not None:
+            prompt = prompts[0] if prompts else detector.build_prompt(conversation)
+            cached = detector.cache.get(detector._cache_key(prompt))
+            if cached is not None:
+                results[call_id] = cached
+                continue
+        pending.append((call_id, detector.format_transcript(conversation)))
+    return results, pending, windowed
+
+
+def _record_fallback(detector, reason: str):
+    instrumentation = getattr(detector, "instrumentation", None)
+    if instrumentation is not None:
+        instrumentation.count("fallbacks", detector=detector.INSTRUMENTATION_LABEL, reason=reason)
+
+
+def _store(detector, conversation, verdict: Dict) -> Dict:
+    result = detector.to_verdict(verdict)
+    if detector.cache is not None:
+        detector.cache.set(detector._cache_key(detector.build_prompt(conversation)), result)
+    return result
+
+
+def analyze_batched(
+    detector,
+    conversations: Dict[str, object],
+    token_budget: int,
+    max_batch_size: int
+) -> Dict[str, Dict[str, bool]]:
+    results, pending, windowed = _split_cached(detector, conversations)
+
+    for call_id in windowed:
+        results[call_id] = detector.analyze_conversation(conversations[call_id])
+
+    for batch in pack_batches(pending, token_budget, max_batch_size):
+        call_ids = [call_id for call_id, _ in batch]
+        try:
+            instrumentation, label = getattr(detector, "instrumentation", None), detector.INSTRUMENTATION_LABEL
+            with timed(instrumentation, "batch_request", detector=label):
+                response = detector.model.generate_content(detector.build_batch_prompt(batch))
+            with timed(instrumentation, "parse", detector=label):
+                verdicts = parse_batch_response(response.text, call_ids)
+            reason = "missing_verdict"
+        except Exception as e:
+            print(f"[ERROR] Gemini batched request failed, falling back to per-call requests: {e}")
+            verdicts = {}
+            reason = "batch_error"
+
+        for call_id in call_ids:
+            if call_id in verdicts:
+                results[call_id] = _store(detector, conversations[call_id], verdicts[call_id])
+            else:
+                _record_fallback(detector, reason)
+                results[call_id] = detector.analyze_conversation(conversations[call_id])
+
+    return results
+
+
+async def analyze_batched_async(
+    detector,
+    conversations: Dict[str, object],
+    token_budget: int,
+    max_batch_size: int
+) -> Dict[str, Dict[str, bool]]:
+    results, pending, windowed = _split_cached(detector, conversations)
+
+    async def run_windowed(call_id: str):
+        results[call_id] = await detector.analyze_conversation_async(conversations[call_id])
+
+    async def run(batch: List[Tuple[str, str]]):
+        call_ids = [call_id for call_id, _ in batch]
+        try:
+            instrumentation, label = getattr(detector, "instrumentation", None), detector.INSTRUMENTATION_LABEL
+            with timed(instrumentation, "batch_request", detector=label):
+                text = await detector.client.generate(detector.build_batch_prompt(batch))
+            with timed(instrumentation, "parse", detector=label):
+                verdicts = parse_batch_response(text, call_ids)
+            reason = "missing_verdict"
+        except Exception as e:
+            print(f"[ERROR] Gemini batched request failed, falling back to per-call requests: {e}")
+            verdicts = {}
+            reason = "batch_error"
+
+        for call_id in call_ids:
+            if call_id in verdicts:
+                results[call_id] = _store(detector, conversations[call_id], verdicts[call_id])
+            else:
+                _record_fallback(detector, reason)
+                results[call_id] = await detector.analyze_conversation_async(conversations[call_id])
+
+    await asyncio.gather(
+        *(run_windowed(call_id) for call_id in windowed),
+        *(run(batch) for batch in pack_batches(pending, token_budget, max_batch_size))
+    )
+    return results
@@ -0,0 +1,109 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = ".llm_cache.sqlite"
+
+
+class LLMResultCache:
+    """
+    Persistent cache of LLM detector verdicts, keyed on a hash of the prompt,
+    model name and prompt version. Entries older than `ttl_seconds` are
+    dropped on read, and the least recently used entries are evicted once
+    the cache holds more than `max_entries`.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = 100_000,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._size = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def make_key(prompt: str, model_name: str, prompt_version: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model_name, prompt_version, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            value, created = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size -= 1
+                self.stats["evictions"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self.stats["hits"] += 1
+            return json.loads(value)
+
+    def set(self, key: str, value: Dict):
+        now = time.time()
+        with self._lock:
+            existed = self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            if not existed:
+                self._size += 1
+            if self._size > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        # Other processes may share the file, so recount before trimming
+        self._size = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        excess = self._size - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access LIMIT ?)",
+            (excess,)
+        )
+        self._size -= excess
+        self.stats["evictions"] += excess
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self.stats, entries=self._size)
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,299 @@
+"""
+Packed corpus: a whole directory of conversation JSON files in one binary
+file that is memory-mapped and read without parsing.
+
+Layout (native byte order, recorded in the header; every section 8-byte
+aligned):
+- header: magic, version, byte order, call/utterance/speaker counts and the
+  (offset, size) of each section
+- text: every utterance's UTF-8 text back to back, with
+  text_offsets (uint64, one per utterance plus one) into it
+- stime / etime: float64 arrays, one entry per utterance
+- speaker_ids: uint32 per utterance into the speaker table
+- call_starts: uint64 per call plus one, the call's first utterance
+- names / speakers: small string tables (offsets plus UTF-8 blob)
+
+PackedCorpus hands out Conversation objects whose time columns are slices of
+the mapped file and whose texts are decoded on access, so opening a corpus
+and taking a call costs no I/O beyond the pages actually touched. Worker
+processes can each open the same file; the OS shares the pages between them,
+and a PackedCorpus pickles as its path.
+
+    python -m common.packed_corpus pack All_Conversations corpus.pack
+    python -m common.packed_corpus info corpus.pack
+"""
+import os
+import sys
+import mmap
+import struct
+import argparse
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterator, List, Tuple, Union
+
+from common.conversation import Conversation, load_conversation
+
+MAGIC = b"CALLPACK"
+VERSION = 1
+SECTIONS = ["text", "text_offsets", "stime", "etime", "speaker_ids", "call_starts", "names", "speakers"]
+_HEADER = struct.Struct("<8sII3Q" + "2Q" * len(SECTIONS))
+_BYTE_ORDER = {"little": 1, "big": 2}
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _string_table(strings: List[str]) -> bytes:
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = array("Q", [0])
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    # offset count, offsets, then the blob
+    return struct.pack("<Q", len(offsets)) + offsets.tobytes() + b"".join(encoded)
+
+
+def _read_string_table(view: memoryview) -> List[str]:
+    count = struct.unpack_from("<Q", view)[0]
+    offsets = view[8:8 + count * 8].cast("Q")
+    blob = view[8 + count * 8:]
+    return [str(blob[offsets[i]:offsets[i + 1]], "utf-8") for i in range(count - 1)]
+
+
+def pack_directory(directory: str, path: str) -> Dict[str, int]:
+    """
+    Packs every *.json call in `directory` (in name order) into `path`.
+    Texts are streamed to the file as calls are read; only the numeric
+    columns are held in memory. Returns the call and utterance counts.
+    """
+    names, speakers = [], []
+    speaker_index: Dict[str, int] = {}
+    text_offsets = array("Q", [0])
+    stime, etime = array("d"), array("d")
+    speaker_ids = array("I")
+    call_starts = array("Q", [0])
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as out:
+        out.write(b"\0" * _HEADER.size)
+        text_start = _align(_HEADER.size)
+        out.write(b"\0" * (text_start - _HEADER.size))
+
+        for fname in sorted(os.listdir(directory)):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                conversation = load_conversation(os.path.join(directory, fname))
+            except Exception as e:
+                print(f"[ERROR] Skipping {fname}: {e}", file=sys.stderr)
+                continue
+
+            names.append(fname)
+            for speaker, text in zip(conversation.speakers, conversation.texts):
+                encoded = text.encode("utf-8")
+                out.write(encoded)
+                text_offsets.append(text_offsets[-1] + len(encoded))
+                if speaker not in speaker_index:
+                    speaker_index[speaker] = len(speakers)
+                    speakers.append(speaker)
+                speaker_ids.append(speaker_index[speaker])
+            stime.extend(conversation.stime)
+            etime.extend(conversation.etime)
+            call_starts.append(len(stime))
+
+        sections = {"text": (text_start, text_offsets[-1])}
+        offset = text_start + text_offsets[-1]
+        blobs = {
+            "text_offsets": text_offsets.tobytes(),
+            "stime": stime.tobytes(),
+            "etime": etime.tobytes(),
+            "speaker_ids": speaker_ids.tobytes(),
+            "call_starts": call_starts.tobytes(),
+            "names": _string_table(names),
+            "speakers": _string_table(speakers)
+        }
+        for name in SECTIONS[1:]:
+            aligned = _align(offset)
+            out.write(b"\0" * (aligned - offset))
+            out.write(blobs[name])
+            sections[name] = (aligned, len(blobs[name]))
+            offset = aligned + len(blobs[name])
+
+        out.seek(0)
+        out.write(_HEADER.pack(
+            MAGIC, VERSION, _BYTE_ORDER[sys.byteorder], len(names), len(stime), len(speakers),
+            *(value for name in SECTIONS for value in sections[name])
+        ))
+    os.replace(tmp, path)
+    return {"calls": len(names), "utterances": len(stime)}
+
+
+class _TextColumn(Sequence):
+    """
+    A call's texts, decoded from the mapped UTF-8 blob when accessed.
+    """
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, blob: memoryview, offsets: memoryview):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        blob, offsets = self.blob, self.offsets
+        start = offsets[0]
+        for end in offsets[1:]:
+            yield str(blob[start:end], "utf-8")
+            start = end
+
+
+class _SpeakerColumn(Sequence):
+    """
+    A call's speaker labels, looked up in the corpus speaker table.
+    """
+    __slots__ = ("table", "ids")
+
+    def __init__(self, table: List[str], ids: memoryview):
+        self.table = table
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self.table[i] for i in self.ids[index]]
+        return self.table[self.ids[index]]
+
+    def __iter__(self) -> Iterator[str]:
+        return map(self.table.__getitem__, self.ids)
+
+
+class PackedCorpus(Sequence):
+    """
+    Read-only, memory-mapped view of a packed corpus. corpus[i] is the i-th
+    call as a Conversation; names[i] is its original file name.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = self._view = memoryview(self._mmap)
+
+        fields = _HEADER.unpack_from(view)
+        magic, version, byte_order, calls, utterances, speakers = fields[:6]
+        if magic != MAGIC:
+            raise ValueError(f"{self.path}: not a packed corpus")
+        if version != VERSION:
+            raise ValueError(f"{self.path}: unsupported packed corpus version {version}")
+        if byte_order != _BYTE_ORDER[sys.byteorder]:
+            raise ValueError(f"{self.path}: packed on a machine with a different byte order")
+
+        sections = {
+            name: view[offset:offset + size]
+            for name, offset, size in zip(SECTIONS, fields[6::2], fields[7::2])
+        }
+        self.text = sections["text"]
+        self.text_offsets = sections["text_offsets"].cast("Q")
+        self.stime = sections["stime"].cast("d")
+        self.etime = sections["etime"].cast("d")
+        self.speaker_ids = sections["speaker_ids"].cast("I")
+        self.call_starts = sections["call_starts"].cast("Q")
+        self.names = _read_string_table(sections["names"])
+        self.speakers = [sys.intern(s) for s in _read_string_table(sections["speakers"])]
+        self.utterances = utterances
+        if len(self.names) != calls or len(self.speakers) != speakers:
+            raise ValueError(f"{self.path}: corrupt packed corpus")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, index: int) -> Conversation:
+        start, end = self.call_starts[index], self.call_starts[index + 1]
+        return Conversation(
+            _SpeakerColumn(self.speakers, self.speaker_ids[start:end]),
+            _TextColumn(self.text, self.text_offsets[start:end + 1]),
+            self.stime[start:end],
+            self.etime[start:end]
+        )
+
+    def __iter__(self) -> Iterator[Conversation]:
+        return (self[i] for i in range(len(self)))
+
+    def items(self) -> Iterator[Tuple[str, Conversation]]:
+        return ((self.names[i], self[i]) for i in range(len(self)))
+
+    def close(self):
+        """
+        Unmaps the file. Conversations taken from the corpus point into the
+        map, so they must be gone first; otherwise this raises BufferError.
+        """
+        if self._view is not None:
+            for view in (
+                self.text, self.text_offsets, self.stime, self.etime,
+                self.speaker_ids, self.call_starts, self._view
+            ):
+                view.release()
+            self.text = self.text_offsets = self.stime = self.etime = None
+            self.speaker_ids = self.call_starts = self._view = None
+        self._mmap.close()
+
+    def __enter__(self) -> "PackedCorpus":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self) -> Dict:
+        return {"path": self.path}
+
+    def __setstate__(self, state: Dict):
+        self.path = state["path"]
+        self._open()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pack a directory of calls into one memory-mappable file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="Pack a directory of conversation JSON files")
+    pack.add_argument("directory")
+    pack.add_argument("output")
+    info = commands.add_parser("info", help="Summarize a packed corpus")
+    info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        counts = pack_directory(args.directory, args.output)
+        print(f"Packed {counts['calls']} calls ({counts['utterances']} utterances) into {args.output}")
+        return 0
+
+    try:
+        corpus = PackedCorpus(args.path)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    with corpus:
+        print(
+            f"{args.path}: {len(corpus)} calls, {corpus.utterances} utterances, "
+            f"{len(corpus.speakers)} speakers, {len(corpus.text)} text bytes"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Intra-call parallelism for the regex detectors on very long transcripts.
+
+A transcript's utterances are split into contiguous chunks that are scanned
+on an executor. Results are collected as chunks finish, and the remaining
+chunks are cancelled as soon as the verdict can no longer change, so a call
+that is flagged early does not pay for scanning the rest of it.
+
+Python's regex engine holds the GIL, so a ProcessPoolExecutor is what gives
+a speed-up; worker tasks receive pattern lists rather than detectors and
+reuse the per-process compiled patterns. A ThreadPoolExecutor also works,
+e.g. on a free-threaded build. The verdicts are identical to the sequential
+scan either way.
+"""
+import os
+import atexit
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Calls shorter than this are scanned sequentially; below it, handing chunks
+# to other processes costs more than the scan itself
+MIN_PARALLEL_UTTERANCES = 5000
+DEFAULT_CHUNK_SIZE = 2000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def shared_executor() -> Executor:
+    """
+    A process pool shared by every detector in this process, started on
+    first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+            atexit.register(_executor.shutdown, cancel_futures=True)
+        return _executor
+
+
+def columns(conversation: Any) -> Tuple[List[str], List[str]]:
+    """
+    Speakers and texts of a Conversation or a list of utterance dicts.
+    """
+    if hasattr(conversation, "texts"):
+        return conversation.speakers, conversation.texts
+    return (
+        [con.get("speaker", "") for con in conversation],
+        [con.get("text", "") for con in conversation]
+    )
+
+
+def chunk_bounds(length: int, chunk_size: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + chunk_size, length)) for start in range(0, length, chunk_size)]
+
+
+def run_chunks(
+    executor: Executor,
+    fn: Callable,
+    tasks: Sequence[Tuple],
+    settled: Callable[[int, Any], bool]
+) -> Dict[int, Any]:
+    """
+    Submits fn(*task) for every task and returns {task index: result} for
+    the tasks that finished. After each result, `settled(index, result)`
+    decides whether the rest can be skipped; tasks not yet started are
+    cancelled.
+    """
+    futures = {executor.submit(fn, *task): index for index, task in enumerate(tasks)}
+    results = {}
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            results[index] = future.result()
+            if settled(index, results[index]):
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+    return results
+
+
+def use_parallel(length: int, executor: Optional[Executor], min_utterances: Optional[int]) -> bool:
+    threshold = MIN_PARALLEL_UTTERANCES if min_utterances is None else min_utterances
+    return length >= threshold and (executor is not None or (os.cpu_count() or 1) > 1)
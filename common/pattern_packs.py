@@ -0,0 +1,158 @@
+"""
+Versioned pattern packs: the regex detectors' pattern lists kept in JSON
+files (see patterns/) so they can be updated without a code change.
+
+    {"name": "profanity", "version": "3", "patterns": {"profanity": [...], ...}}
+
+Detectors built from the same pattern lists share one set of compiled
+regexes per process, so rebuilding a detector for a pack that is already
+loaded costs nothing.
+
+A long-running worker holds a PatternPackWatcher and calls refresh() between
+calls. When the file has changed, the new pack is loaded and validated, a
+detector is built from it, and both are published with a single assignment.
+Calls already running keep the detector they started with; a broken pack is
+reported and ignored, keeping the previous one.
+"""
+import os
+import re
+import json
+import time
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+PATTERNS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "patterns")
+PROFANITY_PACK = os.path.join(PATTERNS_DIR, "profanity.json")
+COMPLIANCE_PACK = os.path.join(PATTERNS_DIR, "compliance.json")
+
+# Pattern groups each kind of pack must provide
+PACK_GROUPS = {
+    "profanity": ["profanity", "obfuscated", "contextual"],
+    "compliance": ["sensitive", "verification"],
+}
+
+
+class PatternPack(NamedTuple):
+    name: str
+    version: str
+    patterns: Dict[str, List[str]]
+    path: Optional[str] = None
+
+
+def load_pack(path: str, expected_name: str = None) -> PatternPack:
+    """
+    Reads and validates a pattern pack. Raises ValueError if it is not a
+    known pack, lacks a group, or contains a pattern that does not compile.
+    Contextual profanity terms are plain words and are not compiled here.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{path}: invalid JSON: {e}")
+
+    name = data.get("name")
+    if expected_name is not None and name != expected_name:
+        raise ValueError(f"{path}: expected a {expected_name!r} pack, got {name!r}")
+    if name not in PACK_GROUPS:
+        raise ValueError(f"{path}: unknown pack name {name!r}")
+    if "version" not in data:
+        raise ValueError(f"{path}: missing version")
+
+    patterns = data.get("patterns") or {}
+    for group in PACK_GROUPS[name]:
+        values = patterns.get(group)
+        if not isinstance(values, list) or not values or not all(isinstance(v, str) for v in values):
+            raise ValueError(f"{path}: {group!r} must be a non-empty list of strings")
+        if group == "contextual":
+            continue
+        for pattern in values:
+            try:
+                re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"{path}: bad {group} pattern {pattern!r}: {e}")
+
+    return PatternPack(name, str(data["version"]), {g: patterns[g] for g in PACK_GROUPS[name]}, path)
+
+
+def save_pack(pack: PatternPack, path: str):
+    """
+    Writes a pack next to its destination and renames it into place, so a
+    watcher never reads a half-written file.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"name": pack.name, "version": pack.version, "patterns": pack.patterns}, f, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+class PatternPackWatcher:
+    """
+    Keeps a detector built from the pattern pack at `path` and rebuilds it
+    when the file changes. `build` turns a PatternPack into a detector,
+    e.g. ProfanityRegexDetector.from_pack.
+    """
+
+    def __init__(self, path: str, build: Callable[[PatternPack], Any], poll_interval: float = 2.0):
+        self.path = path
+        self.build = build
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._stat = self._file_stat()
+        pack = load_pack(path)
+        # (pack, detector), replaced as one object so readers never see a mix
+        self._state: Tuple[PatternPack, Any] = (pack, build(pack))
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    @property
+    def current(self) -> Any:
+        """
+        The detector for the latest good pack. Take it once per call and use
+        that object for the whole call.
+        """
+        return self._state[1]
+
+    @property
+    def pack(self) -> PatternPack:
+        return self._state[0]
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Reloads the pack if the file changed since the last check (checked at
+        most every poll_interval seconds unless force). Returns True if a new
+        pack was swapped in.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.poll_interval:
+            return False
+        # One thread reloads; others keep using the current detector
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked_at = now
+            stat = self._file_stat()
+            if stat is None or (stat == self._stat and not force):
+                return False
+            self._stat = stat
+
+            try:
+                pack = load_pack(self.path, expected_name=self.pack.name)
+                detector = self.build(pack)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] Keeping {self.pack.name} pack v{self.pack.version}: {e}")
+                return False
+
+            if pack == self.pack:
+                return False
+            self._state = (pack, detector)
+            return True
+        finally:
+            self._lock.release()
@@ -0,0 +1,129 @@
+"""
+Single-pass analysis of a conversation by any number of analyzers.
+
+Instead of every detector walking the utterances and re-reading speaker and
+text on its own, AnalysisPipeline walks them once, derives the features the
+detectors share (UtteranceFeatures) and hands each utterance's features to
+every registered stage. A stage is a small stateful object, like the
+Incremental* detectors used for streaming:
+
+    update(features)   consume one utterance
+    is_final           True once nothing later can change the result
+    finalize()         the stage's result dict
+
+Stages that are final stop receiving utterances, and the walk ends early once
+every stage is final. A new analyzer plugs in with add(name, factory), where
+factory() returns a fresh stage for each conversation.
+"""
+import re
+from typing import Any, Callable, Dict, List, Tuple
+
+from common.instrumentation import Instrumentation, timed
+
+_DIGIT_RE = re.compile(r"\d")
+
+
+def speaker_role(speaker: str) -> str:
+    """
+    "agent", "borrower" or "customer" if the label contains that word
+    (checked in that order, as the detectors always have), else "other".
+    """
+    speaker = speaker.lower()
+    for role in ("agent", "borrower", "customer"):
+        if role in speaker:
+            return role
+    return "other"
+
+
+class UtteranceFeatures:
+    """
+    Everything the stages need from one utterance, computed once:
+    - role: normalized speaker role (see speaker_role)
+    - text / folded: the raw and lower-cased text; is_ascii tells whether
+      substring tests on `folded` agree with case-insensitive regexes
+    - has_digit: whether the text contains a digit
+    - contains(keyword): substring test against `folded`
+    - stime / etime: timing
+    """
+    __slots__ = ("index", "speaker", "role", "text", "folded", "is_ascii", "has_digit", "contains", "stime", "etime")
+
+    def __init__(self, index: int, speaker: str, role: str, text: str, stime: float, etime: float):
+        self.index = index
+        self.speaker = speaker
+        self.role = role
+        self.text = text
+        self.folded = text.lower()
+        self.is_ascii = text.isascii()
+        self.has_digit = _DIGIT_RE.search(text) is not None
+        self.contains = self.folded.__contains__
+        self.stime = stime
+        self.etime = etime
+
+
+def _rows(conversation: Any) -> Any:
+    if isinstance(conversation, dict):
+        conversation = [conversation]
+    if hasattr(conversation, "texts"):
+        # Conversation columns, without building Utterance objects
+        return zip(conversation.speakers, conversation.texts, conversation.stime, conversation.etime)
+    return (
+        (con.get("speaker", ""), con.get("text", ""), con.get("stime"), con.get("etime"))
+        for con in conversation
+    )
+
+
+class AnalysisPipeline:
+    def __init__(self, instrumentation: Instrumentation = None):
+        self.stages: List[Tuple[str, Callable[[], Any]]] = []
+        # Optional common.instrumentation.Instrumentation for per-call timings
+        self.instrumentation = instrumentation
+
+    def add(self, name: str, factory: Callable[[], Any]) -> "AnalysisPipeline":
+        """
+        Registers a stage under `name`; factory() must return a fresh stage
+        object (see module docstring). Returns self for chaining.
+        """
+        if any(existing == name for existing, _ in self.stages):
+            raise ValueError(f"Duplicate pipeline stage: {name}")
+        self.stages.append((name, factory))
+        return self
+
+    def analyze(self, conversation: Any) -> Dict[str, Dict]:
+        """
+        Runs every stage over the conversation in one pass and returns
+        {stage name: result}.
+        """
+        with timed(self.instrumentation, "pipeline", detector="pipeline"):
+            return self._run(conversation)
+
+    def analyze_merged(self, conversation: Any) -> Dict[str, Any]:
+        """
+        The stage results merged into one flat dict, e.g. a batch row.
+        """
+        merged = {}
+        for result in self.analyze(conversation).values():
+            merged.update(result)
+        return merged
+
+    def _run(self, conversation: Any) -> Dict[str, Dict]:
+        stages = [(name, factory()) for name, factory in self.stages]
+        active = [stage for _, stage in stages if not stage.is_final]
+        roles: Dict[str, str] = {}
+
+        for index, (speaker, text, stime, etime) in enumerate(_rows(conversation)):
+            if not active:
+                break
+            role = roles.get(speaker)
+            if role is None:
+                role = roles[speaker] = speaker_role(speaker)
+            features = UtteranceFeatures(index, speaker, role, text, stime, etime)
+
+            finished = False
+            for stage in active:
+                stage.update(features)
+                finished = finished or stage.is_final
+            if finished:
+                active = [stage for stage in active if not stage.is_final]
+
+        return {name: stage.finalize() for name, stage in stages}
+
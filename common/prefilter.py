@@ -0,0 +1,189 @@
+"""
+Cheap prefilter for sets of regexes.
+
+Each pattern is parsed once to find a factor it cannot match without: a set
+of literal strings (at least one must occur in the text) or a digit. Before
+running a pattern, the text is checked for its factor with plain substring
+tests, so utterances that cannot possibly match skip the regex entirely.
+"""
+import re
+from functools import lru_cache
+from typing import FrozenSet, List, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# Sentinel member of a factor meaning "any digit"
+DIGIT = "\\d"
+
+# Cap on the cross product when joining alternatives into literal runs
+_MAX_EXPANSION = 64
+
+_DIGIT_RE = re.compile(r"\d")
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+def _score(factor: FrozenSet[str]) -> Tuple[int, int]:
+    if "" in factor:
+        return (0, 0)
+    # Digits are rare in conversational text, so a digit counts as selective.
+    # Past six characters a literal is selective enough that fewer members
+    # (fewer substring tests) matter more than length.
+    shortest = min(4 if member == DIGIT else len(member) for member in factor)
+    return (min(shortest, 6), -len(factor))
+
+
+def _minimize(factor: FrozenSet[str]) -> FrozenSet[str]:
+    # A member containing another member is implied by it and never needed
+    return frozenset(
+        member for member in factor
+        if member == DIGIT or not any(other != member and other != DIGIT and other in member for other in factor)
+    )
+
+
+def _best(factors: List[FrozenSet[str]]) -> Optional[FrozenSet[str]]:
+    useful = [_minimize(f) for f in factors if _score(f)[0] > 0]
+    return max(useful, key=_score) if useful else None
+
+
+def _factors(items) -> Tuple[Optional[FrozenSet[str]], List[FrozenSet[str]]]:
+    """
+    Returns (exact, factors): `exact` is the set of strings the sequence can
+    match when it is purely literal (else None), and `factors` every required
+    factor found along the way.
+    """
+    factors = []
+    run = {""}
+    exact = True
+
+    def flush():
+        nonlocal run
+        if run != {""}:
+            factors.append(frozenset(run))
+        run = {""}
+
+    for op, av in items:
+        if op is sre_constants.LITERAL and av < 128:
+            run = {prefix + chr(av).lower() for prefix in run}
+        elif op is sre_constants.AT:
+            continue  # zero width, so literals on either side stay contiguous
+        elif op is sre_constants.BRANCH or op is sre_constants.SUBPATTERN:
+            alternatives = av[1] if op is sre_constants.BRANCH else [av[-1]]
+            results = [_factors(alt) for alt in alternatives]
+            if all(exact_alt is not None for exact_alt, _ in results):
+                options = set().union(*(exact_alt for exact_alt, _ in results))
+                if len(run) * len(options) <= _MAX_EXPANSION:
+                    run = {prefix + option for prefix in run for option in options}
+                    continue
+            exact = False
+            flush()
+            # Whichever alternative matches must supply its own factor
+            best = [_best(sub) for _, sub in results]
+            if all(best):
+                factors.append(frozenset().union(*best))
+        elif op in _REPEATS:
+            low, _, item = av
+            exact = False
+            flush()
+            if low >= 1:
+                best = _best(_factors(item)[1])
+                if best:
+                    factors.append(best)
+        elif op is sre_constants.IN and list(av) == [(sre_constants.CATEGORY, sre_constants.CATEGORY_DIGIT)]:
+            exact = False
+            flush()
+            factors.append(frozenset([DIGIT]))
+        else:
+            exact = False
+            flush()
+
+    if exact:
+        return frozenset(run), factors + [frozenset(run)]
+    flush()
+    return None, factors
+
+
+def required_factor(pattern: str, flags: int = re.IGNORECASE) -> Optional[FrozenSet[str]]:
+    """
+    Returns the most selective factor `pattern` requires, or None when no
+    factor could be derived and the pattern must always run.
+    """
+    return _best(_factors(sre_parse.parse(pattern, flags))[1])
+
+
+class PrefilteredPatterns:
+    """
+    An ordered list of regexes searched with a prefilter gate in front of
+    each one. Results are identical to searching every regex: the gate is
+    skipped for non-ASCII text, where case-insensitive matching can equate
+    characters that str.lower() does not.
+    """
+
+    def __init__(self, patterns: List[str], flags: int = re.IGNORECASE):
+        self.patterns = list(patterns)
+        self.regexes = [re.compile(pat, flags) for pat in self.patterns]
+        self.factors = [required_factor(pat, flags) for pat in self.patterns]
+        # (literals, digit allowed) per pattern; None means always run
+        self._gates = [
+            None if factor is None else (tuple(sorted(factor - {DIGIT})), DIGIT in factor)
+            for factor in self.factors
+        ]
+
+    def first_match(self, text: str) -> Optional[int]:
+        """
+        Index of the first pattern (in list order) that matches, or None.
+        """
+        if not text.isascii():
+            return self._search_all(text)
+        return self._search_gated(text, text.lower().__contains__, None)
+
+    def first_match_features(self, features) -> Optional[int]:
+        """
+        Same as first_match, reusing the lower-cased text and digit check of
+        a common.pipeline.UtteranceFeatures.
+        """
+        if not features.is_ascii:
+            return self._search_all(features.text)
+        return self._search_gated(features.text, features.contains, features.has_digit)
+
+    def _search_all(self, text: str) -> Optional[int]:
+        for index, regex in enumerate(self.regexes):
+            if regex.search(text):
+                return index
+        return None
+
+    def _search_gated(self, text: str, contains, has_digit: Optional[bool]) -> Optional[int]:
+        for index, (regex, gate) in enumerate(zip(self.regexes, self._gates)):
+            if gate is not None:
+                literals, digit = gate
+                if not any(map(contains, literals)):
+                    if not digit:
+                        continue
+                    if has_digit is None:
+                        has_digit = _DIGIT_RE.search(text) is not None
+                    if not has_digit:
+                        continue
+            if regex.search(text):
+                return index
+        return None
+
+
+@lru_cache(maxsize=32)
+def _shared(patterns: Tuple[str, ...], flags: int) -> PrefilteredPatterns:
+    return PrefilteredPatterns(list(patterns), flags)
+
+
+def shared_patterns(patterns: List[str], flags: int = re.IGNORECASE) -> PrefilteredPatterns:
+    """
+    PrefilteredPatterns compiled once per process for each distinct pattern
+    list; detectors built from the same list share it. It is never mutated
+    after construction, so sharing is safe.
+    """
+    return _shared(tuple(patterns), flags)
@@ -0,0 +1,184 @@
+"""
+Persistent, indexed store of per-call detector and metric results.
+
+Each row is keyed on the call file's path, a hash of its content and the
+detector version (a hash of the detectors' configuration, see config_hash),
+and also records the file's size and mtime so an incremental run can tell
+unchanged files apart with a stat call instead of reading them.
+
+Query from the command line:
+    python -m common.results_store results.sqlite --agent-profanity --since-days 7
+"""
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_STORE_PATH = ".results.sqlite"
+
+FLAG_COLUMNS = ["agent_profanity", "borrower_profanity", "privacy_violation"]
+METRIC_COLUMNS = ["total_duration", "overtalk_duration", "silence_duration", "speaking_duration"]
+
+
+def config_hash(config: Any) -> str:
+    """
+    Short stable hash of any JSON-serializable configuration, e.g. a
+    detector's pattern lists.
+    """
+    encoded = json.dumps(config, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultsStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(
+            [f"{col} INTEGER" for col in FLAG_COLUMNS] + [f"{col} REAL" for col in METRIC_COLUMNS]
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " path TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " detector_version TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " analyzed_at REAL NOT NULL,"
+            f" {columns},"
+            " error TEXT,"
+            " PRIMARY KEY (path, content_hash, detector_version))"
+        )
+        # "Flagged calls in a time range" queries; mtime stands in for when the call happened
+        for col in FLAG_COLUMNS:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS results_{col} ON results (detector_version, {col}, mtime_ns)"
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_mtime ON results (detector_version, mtime_ns)")
+        self._conn.commit()
+
+    def index(self, detector_version: str) -> Dict[str, Tuple[int, int]]:
+        """
+        path -> (size, mtime_ns) of every call already analyzed with this
+        detector version.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns FROM results WHERE detector_version = ?", (detector_version,)
+            ).fetchall()
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def record(self, path: str, size: int, mtime_ns: int, detector_version: str, row: Dict[str, Any]):
+        """
+        Stores one call's result row (as produced by batch.analyze_file, with
+        a "content_hash"). Rows for an older content of the same path and
+        detector version are replaced.
+        """
+        values = [row.get(col) for col in FLAG_COLUMNS + METRIC_COLUMNS]
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM results WHERE path = ? AND detector_version = ? AND content_hash != ?",
+                (path, detector_version, row["content_hash"])
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, "
+                + ", ".join("?" * len(values)) + ", ?)",
+                [path, row["content_hash"], detector_version, size, mtime_ns, time.time()] + values + [row.get("error")]
+            )
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def latest_version(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT detector_version FROM results ORDER BY analyzed_at DESC LIMIT 1"
+            ).fetchone()
+        return row[0] if row else None
+
+    def query(
+        self,
+        detector_version: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        **flags: bool
+    ) -> List[Dict[str, Any]]:
+        """
+        Rows of one detector version (default: the most recently analyzed),
+        optionally limited to file times in [since, until) as Unix timestamps
+        and to the given flag values, e.g. query(agent_profanity=True).
+        """
+        detector_version = detector_version or self.latest_version()
+        clauses, params = ["detector_version = ?"], [detector_version]
+        for col, value in flags.items():
+            if col not in FLAG_COLUMNS:
+                raise ValueError(f"Unknown flag column: {col}")
+            clauses.append(f"{col} = ?")
+            params.append(int(value))
+        if since is not None:
+            clauses.append("mtime_ns >= ?")
+            params.append(int(since * 1e9))
+        if until is not None:
+            clauses.append("mtime_ns < ?")
+            params.append(int(until * 1e9))
+
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT * FROM results WHERE {' AND '.join(clauses)} ORDER BY mtime_ns", params
+            )
+            names = [d[0] for d in cursor.description]
+            rows = [dict(zip(names, values)) for values in cursor.fetchall()]
+
+        for row in rows:
+            for col in FLAG_COLUMNS:
+                if row[col] is not None:
+                    row[col] = bool(row[col])
+        return rows
+
+    def prune(self, detector_version: str) -> int:
+        """
+        Deletes rows from every other detector version; returns how many.
+        """
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM results WHERE detector_version != ?", (detector_version,)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Query stored per-call results.")
+    parser.add_argument("store", nargs="?", default=DEFAULT_STORE_PATH)
+    parser.add_argument("--detector-version", help="Default: the most recently analyzed version")
+    parser.add_argument("--since-days", type=float, help="Only calls whose file changed in the last N days")
+    for col in FLAG_COLUMNS:
+        parser.add_argument(f"--{col.replace('_', '-')}", dest=col, action="store_true")
+    args = parser.parse_args(argv)
+
+    store = ResultsStore(args.store)
+    since = time.time() - args.since_days * 86400 if args.since_days is not None else None
+    flags = {col: True for col in FLAG_COLUMNS if getattr(args, col)}
+    for row in store.query(args.detector_version, since=since, **flags):
+        print(json.dumps(row))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
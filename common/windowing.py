@@ -0,0 +1,40 @@
+"""
+Splits long transcripts into overlapping windows that fit a token budget, so
+an hour-long call becomes several small prompts scored in parallel instead
+of one huge one.
+"""
+from typing import List
+
+from common.llm_batching import estimate_tokens
+
+
+def window_lines(lines: List[str], max_tokens: int, overlap_tokens: int = 0) -> List[List[str]]:
+    """
+    Groups transcript lines into consecutive windows of at most `max_tokens`
+    estimated tokens. Each window after the first starts with the trailing
+    lines of the previous one, up to `overlap_tokens`, so a remark that
+    depends on the line before it is still seen in context. A single line
+    larger than the budget gets a window of its own.
+    """
+    if not lines:
+        return [[]]
+
+    tokens = [estimate_tokens(line) for line in lines]
+    windows = []
+    start = 0
+    while start < len(lines):
+        end, used = start, 0
+        while end < len(lines) and (end == start or used + tokens[end] <= max_tokens):
+            used += tokens[end]
+            end += 1
+        windows.append(lines[start:end])
+        if end == len(lines):
+            break
+
+        # Step back over the overlap, but always move forward
+        next_start, carried = end, 0
+        while next_start - 1 > start and carried + tokens[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            carried += tokens[next_start]
+        start = next_start
+    return windows
@@ -0,0 +1,99 @@
+"""
+Escalation report for the hybrid regex-then-LLM detectors.
+
+Usage:
+    python -m hybrid All_Conversations
+    python -m hybrid All_Conversations --threshold 0.35
+    python -m hybrid All_Conversations --evaluate
+
+Without --evaluate only the regex pass runs, so the escalation rate and the
+reasons behind it are reported without any LLM calls. With --evaluate every
+call is also scored by the LLM detector (GEMINI_API_KEY, or --base-url for
+another endpoint such as common.fake_gemini) and the report adds how often
+the regex-only and hybrid verdicts agree with the LLM on every call.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+from typing import Dict, List
+
+from common.conversation import iter_conversations
+from common.gemini_client import AsyncGeminiClient, http_transport
+from task1_profanity.hybrid_detector import ProfanityHybridDetector
+from task2_privacy.hybrid_detector import ComplianceHybridDetector
+
+
+def _agreement(verdicts: List[Dict], reference: List[Dict]) -> float:
+    # Calls the LLM failed to score say nothing either way
+    pairs = [(v, r) for v, r in zip(verdicts, reference) if "error" not in r]
+    return sum(v == r for v, r in pairs) / len(pairs) if pairs else 1.0
+
+
+def evaluate(
+    directory: str,
+    threshold: float = 0.5,
+    run_llm: bool = False,
+    api_key: str = None,
+    base_url: str = None,
+    concurrency: int = 8
+) -> Dict[str, Dict]:
+    corpus = [conv for _, conv in iter_conversations(directory)]
+    report = {}
+
+    for name, hybrid_cls in (("profanity", ProfanityHybridDetector), ("compliance", ComplianceHybridDetector)):
+        hybrid = hybrid_cls(api_key=api_key, threshold=threshold)
+        assessments = [hybrid.assess(conv) for conv in corpus]
+        for assessment in assessments:
+            hybrid.stats.record(assessment["escalate"], assessment["reasons"])
+        report[name] = hybrid.stats.snapshot()
+
+        if run_llm:
+            llm = hybrid.build_llm_detector()
+            transport = http_transport(api_key=api_key, base_url=base_url) if base_url else None
+            llm.client = AsyncGeminiClient(api_key=api_key, transport=transport, max_concurrency=concurrency)
+            reference = asyncio.run(llm.analyze_conversations_async(corpus))
+
+            regex_verdicts = [assessment["verdict"] for assessment in assessments]
+            hybrid_verdicts = [
+                ref if assessment["escalate"] else assessment["verdict"]
+                for assessment, ref in zip(assessments, reference)
+            ]
+            report[name]["llm_agreement"] = {
+                "regex": _agreement(regex_verdicts, reference),
+                "hybrid": _agreement(hybrid_verdicts, reference),
+                "llm_errors": sum("error" in ref for ref in reference)
+            }
+
+    return report
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Report how often the hybrid detectors escalate to the LLM.")
+    parser.add_argument("directory", nargs="?", default="All_Conversations")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Escalate calls with a confidence below this")
+    parser.add_argument("--evaluate", action="store_true", help="Also score every call with the LLM and compare")
+    parser.add_argument("--base-url", help="Gemini REST endpoint to use instead of the public API")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent LLM requests with --evaluate")
+    args = parser.parse_args(argv)
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if args.evaluate and not api_key and not args.base_url:
+        print("[ERROR] --evaluate needs GEMINI_API_KEY or --base-url", file=sys.stderr)
+        return 1
+
+    report = evaluate(
+        args.directory,
+        threshold=args.threshold,
+        run_llm=args.evaluate,
+        api_key=api_key,
+        base_url=args.base_url,
+        concurrency=args.concurrency
+    )
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
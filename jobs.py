@@ -0,0 +1,588 @@
+"""
+Sharded, resumable scoring of a whole corpus, e.g. an overnight LLM re-score
+of the archive.
+
+Usage:
+    python -m jobs init rescore.sqlite All_Conversations --approach llm --shard-size 100
+    python -m jobs run rescore.sqlite --workers 4
+    python -m jobs status rescore.sqlite
+    python -m jobs export rescore.sqlite --output results.jsonl
+    python -m jobs retry rescore.sqlite
+
+`init` records the corpus (a directory of call files or a packed corpus), the
+approach and one row per call in a job database, grouped into shards. `run`
+starts worker processes that each claim a shard, score the calls in it that
+are not done yet and checkpoint their results every few seconds, so a crash
+or an outage loses at most the calls since the last checkpoint. Running the
+same command again resumes the job.
+
+A claim is a lease that the worker renews at every checkpoint; the shard of a
+worker that died is claimed again once its lease runs out. Several `run`
+commands can work on one job at once, on one machine or on machines that
+share the corpus and the job database over a filesystem with working file
+locks (and clocks in sync, for the leases).
+
+A call whose LLM verdict carries an "error" (the LLM detectors'
+error_verdict) or that could not be loaded is recorded as an error, not as a
+negative, and only those calls are retried on a later pass over the shard,
+up to --max-attempts times. `retry` gives the calls that ran out of attempts
+another round.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import argparse
+import multiprocessing
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import batch
+from common.conversation import load_conversation
+from common.packed_corpus import PackedCorpus
+
+DEFAULT_SHARD_SIZE = 100
+DEFAULT_LEASE = 300.0
+DEFAULT_RETRY_DELAY = 60.0
+DEFAULT_MAX_ATTEMPTS = 3
+CHECKPOINT_INTERVAL = 2.0
+APPROACHES = ["regex", "llm", "hybrid"]
+
+# Call statuses: pending (never scored), done, error (will be retried) and
+# failed (out of attempts). Shard statuses: pending, running and done.
+
+
+class LeaseLost(Exception):
+    """
+    The shard was claimed by another worker after this worker's lease ran out.
+    """
+
+
+class JobQueue:
+    """
+    Job database shared by all workers of one job. Every state change runs in
+    an IMMEDIATE transaction, so two workers never claim the same shard.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shards ("
+            " shard_id INTEGER PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " worker TEXT,"
+            " lease_expires REAL,"
+            " not_before REAL NOT NULL DEFAULT 0,"
+            " passes INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            " name TEXT PRIMARY KEY,"
+            " shard_id INTEGER NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT,"
+            " error TEXT,"
+            " updated_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS calls_shard ON calls (shard_id, status)")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+
+    def config(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+
+    def create(self, source: str, names: List[str], approach: str, shard_size: int, max_attempts: int):
+        """
+        Records a new job over `names` (call file names, in corpus order).
+        """
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta").fetchone():
+                raise ValueError(f"{self.path} already holds a job")
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("source", os.path.abspath(source)),
+                ("packed", "1" if os.path.isfile(source) else "0"),
+                ("approach", approach),
+                ("max_attempts", str(max_attempts)),
+                ("created", str(time.time()))
+            ])
+            conn.executemany(
+                "INSERT INTO calls (name, shard_id, position, status) VALUES (?, ?, ?, 'pending')",
+                ((name, position // shard_size, position) for position, name in enumerate(names))
+            )
+            conn.executemany(
+                "INSERT INTO shards (shard_id, status) VALUES (?, 'pending')",
+                ((shard_id,) for shard_id in range((len(names) + shard_size - 1) // shard_size))
+            )
+
+    def claim(self, worker: str, lease: float) -> Optional[int]:
+        """
+        Claims the next pending shard, or a running one whose lease ran out.
+        Returns its ID, or None when nothing can be claimed right now.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT shard_id FROM shards"
+                " WHERE (status = 'pending' AND not_before <= ?) OR (status = 'running' AND lease_expires < ?)"
+                " ORDER BY shard_id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE shards SET status = 'running', worker = ?, lease_expires = ? WHERE shard_id = ?",
+                (worker, now + lease, row[0])
+            )
+        return row[0]
+
+    def next_claim_in(self) -> Optional[float]:
+        """
+        Seconds until a shard may become claimable (a retry delay or a lease
+        running out), or None when every shard is done.
+        """
+        row = self._conn.execute(
+            "SELECT MIN(CASE status WHEN 'pending' THEN not_before ELSE lease_expires END)"
+            " FROM shards WHERE status != 'done'"
+        ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def open_calls(self, shard_id: int) -> List[Tuple[str, int]]:
+        """
+        (name, position) of the calls of a shard that still need scoring.
+        """
+        return self._conn.execute(
+            "SELECT name, position FROM calls WHERE shard_id = ? AND status IN ('pending', 'error')"
+            " ORDER BY position",
+            (shard_id,)
+        ).fetchall()
+
+    def checkpoint(self, shard_id: int, worker: str, rows: List[Dict], lease: float, max_attempts: int):
+        """
+        Records scored rows and renews the lease. A row with an "error" marks
+        its call for a retry, or as failed once it is out of attempts.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            renewed = conn.execute(
+                "UPDATE shards SET lease_expires = ? WHERE shard_id = ? AND worker = ? AND status = 'running'",
+                (now + lease, shard_id, worker)
+            ).rowcount
+            if not renewed:
+                raise LeaseLost(f"Shard {shard_id} was claimed by another worker")
+            for row in rows:
+                conn.execute(
+                    "UPDATE calls SET"
+                    " status = CASE WHEN ? IS NULL THEN 'done' WHEN attempts + 1 >= ? THEN 'failed' ELSE 'error' END,"
+                    " attempts = attempts + 1, result = ?, error = ?, updated_at = ?"
+                    " WHERE name = ?",
+                    (row.get("error"), max_attempts, json.dumps(row), row.get("error"), now, row["file"])
+                )
+
+    def finish(self, shard_id: int, worker: str, retry_delay: float):
+        """
+        Marks a shard done, or puts it back for another pass after
+        `retry_delay` seconds (doubling with every pass) if calls in it still
+        need a retry.
+        """
+        with self._transaction() as conn:
+            remaining = conn.execute(
+                "SELECT COUNT(*) FROM calls WHERE shard_id = ? AND status IN ('pending', 'error')", (shard_id,)
+            ).fetchone()[0]
+            if remaining:
+                conn.execute(
+                    "UPDATE shards SET status = 'pending', worker = NULL, lease_expires = NULL,"
+                    " not_before = ? * (1 << MIN(passes, 6)) + ?, passes = passes + 1"
+                    " WHERE shard_id = ? AND worker = ?",
+                    (retry_delay, time.time(), shard_id, worker)
+                )
+            else:
+                conn.execute(
+                    "UPDATE shards SET status = 'done', worker = NULL, lease_expires = NULL"
+                    " WHERE shard_id = ? AND worker = ?",
+                    (shard_id, worker)
+                )
+
+    def release(self, shard_id: int, worker: str):
+        """
+        Hands a claimed shard back right away, e.g. when its worker is stopped.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE shards SET status = 'pending', worker = NULL, lease_expires = NULL"
+                " WHERE shard_id = ? AND worker = ? AND status = 'running'",
+                (shard_id, worker)
+            )
+
+    def retry_failed(self) -> int:
+        """
+        Gives calls that ran out of attempts a new round. Returns how many.
+        """
+        with self._transaction() as conn:
+            count = conn.execute(
+                "UPDATE calls SET status = 'error', attempts = 0 WHERE status = 'failed'"
+            ).rowcount
+            conn.execute(
+                "UPDATE shards SET status = 'pending', not_before = 0, passes = 0"
+                " WHERE status = 'done' AND shard_id IN (SELECT shard_id FROM calls WHERE status = 'error')"
+            )
+        return count
+
+    def status(self) -> Dict[str, Dict[str, int]]:
+        calls = dict(self._conn.execute("SELECT status, COUNT(*) FROM calls GROUP BY status").fetchall())
+        shards = dict(self._conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+        workers = [row[0] for row in self._conn.execute(
+            "SELECT DISTINCT worker FROM shards WHERE status = 'running' AND lease_expires >= ?", (time.time(),)
+        )]
+        return {"calls": calls, "shards": shards, "active_workers": workers}
+
+    def results(self) -> Iterator[Dict]:
+        """
+        The latest result row of every scored call, in corpus order.
+        """
+        for (result,) in self._conn.execute(
+            "SELECT result FROM calls WHERE result IS NOT NULL ORDER BY position"
+        ):
+            yield json.loads(result)
+
+
+class _Checkpointer:
+    """
+    Buffers scored rows and writes them to the job database every
+    CHECKPOINT_INTERVAL seconds, and once more at the end of the shard.
+    """
+
+    def __init__(self, queue: JobQueue, shard_id: int, worker: str, lease: float, max_attempts: int):
+        self.queue = queue
+        self.shard_id = shard_id
+        self.worker = worker
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.rows: List[Dict] = []
+        self.last_flush = time.monotonic()
+
+    def add(self, row: Dict):
+        self.rows.append(row)
+        if time.monotonic() - self.last_flush >= CHECKPOINT_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.queue.checkpoint(self.shard_id, self.worker, self.rows, self.lease, self.max_attempts)
+            self.rows = []
+        self.last_flush = time.monotonic()
+
+
+def _loader(config: Dict[str, str]) -> Callable[[str, int], Callable]:
+    """
+    For the job's corpus, a function from (name, position) to a zero-argument
+    loader of the call's Conversation.
+    """
+    source = config["source"]
+    if config["packed"] == "1":
+        corpus = PackedCorpus(source)
+        return lambda name, position: lambda: corpus[position]
+    return lambda name, position: lambda: load_conversation(os.path.join(source, name))
+
+
+class _RegexScorer:
+    """
+    The same rows as `python -m batch`; only unreadable calls are errors.
+    """
+
+    def __init__(self, config: Dict[str, str]):
+        batch._init_worker()
+        self.load = _loader(config)
+
+    def score(self, calls: List[Tuple[str, int]], checkpoint: _Checkpointer):
+        for name, position in calls:
+            checkpoint.add(batch._analyze(name, self.load(name, position)))
+
+
+class _LLMScorer:
+    """
+    LLM (or hybrid) verdicts plus the call quality metrics. Calls are scored
+    in groups of `group_size`, all groups of a shard concurrently within the
+    client's limits, and every group is checkpointed as soon as it is done.
+    """
+
+    def __init__(
+        self,
+        config: Dict[str, str],
+        api_key: str = None,
+        base_url: str = None,
+        concurrency: int = 8,
+        cache_path: str = None,
+        group_size: int = 20
+    ):
+        from common.gemini_client import AsyncGeminiClient, http_transport
+        from common.llm_cache import LLMResultCache
+        from task1_profanity.llm_detector import ProfanityLLMDetector
+        from task1_profanity.hybrid_detector import ProfanityHybridDetector
+        from task2_privacy.llm_detector import ComplianceLLMDetector
+        from task2_privacy.hybrid_detector import ComplianceHybridDetector
+        from task3_metrics.call_quality import CallQualityAnalyzer
+
+        self.load = _loader(config)
+        self.approach = config["approach"]
+        self.group_size = group_size
+        transport = http_transport(api_key=api_key, base_url=base_url) if base_url else None
+        client = AsyncGeminiClient(api_key=api_key, transport=transport, max_concurrency=concurrency)
+        # With a cache, a retry only repeats the requests that failed
+        cache = LLMResultCache(cache_path) if cache_path else None
+        self.profanity = ProfanityLLMDetector(api_key=api_key, client=client, cache=cache)
+        self.compliance = ComplianceLLMDetector(api_key=api_key, client=client, cache=cache)
+        if self.approach == "hybrid":
+            self.profanity_hybrid = ProfanityHybridDetector(llm_detector=self.profanity)
+            self.compliance_hybrid = ComplianceHybridDetector(llm_detector=self.compliance)
+        self.quality = CallQualityAnalyzer()
+        # One loop for the worker's lifetime: the client's limits bind to it
+        self.loop = asyncio.new_event_loop()
+
+    async def _verdicts(self, conversations: Dict[str, List[Dict]]) -> List[Dict[str, Dict]]:
+        if self.approach == "hybrid":
+            return await asyncio.gather(
+                self.profanity_hybrid.analyze_conversations_async(conversations),
+                self.compliance_hybrid.analyze_conversations_async(conversations)
+            )
+        return await asyncio.gather(
+            self.profanity.analyze_conversations_batched_async(conversations),
+            self.compliance.analyze_conversations_batched_async(conversations)
+        )
+
+    async def _score_group(self, calls: List[Tuple[str, int]]) -> List[Dict]:
+        rows, conversations = {}, {}
+        for name, position in calls:
+            try:
+                conversations[name] = self.load(name, position)().to_records()
+            except Exception as e:
+                rows[name] = {"file": name, "error": f"{type(e).__name__}: {e}"}
+
+        if conversations:
+            results = await self._verdicts(conversations)
+            for name, conversation in conversations.items():
+                row, errors = {"file": name}, []
+                for result in results:
+                    verdict = dict(result[name])
+                    if "error" in verdict:
+                        errors.append(verdict.pop("error"))
+                    row.update(verdict)
+                row.update(self.quality.analyze(conversation))
+                if errors:
+                    row["error"] = "; ".join(errors)
+                rows[name] = row
+        return [rows[name] for name, _ in calls]
+
+    async def _score(self, calls: List[Tuple[str, int]], checkpoint: _Checkpointer):
+        tasks = [
+            asyncio.ensure_future(self._score_group(calls[i:i + self.group_size]))
+            for i in range(0, len(calls), self.group_size)
+        ]
+        try:
+            for done in asyncio.as_completed(tasks):
+                for row in await done:
+                    checkpoint.add(row)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def score(self, calls: List[Tuple[str, int]], checkpoint: _Checkpointer):
+        self.loop.run_until_complete(self._score(calls, checkpoint))
+
+
+def work(
+    path: str,
+    worker: Optional[str] = None,
+    lease: float = DEFAULT_LEASE,
+    retry_delay: float = DEFAULT_RETRY_DELAY,
+    api_key: str = None,
+    base_url: str = None,
+    concurrency: int = 8,
+    cache_path: str = None
+) -> int:
+    """
+    Claims and scores shards until every shard of the job is done. Returns
+    the number of shards this worker processed.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(path)
+    config = queue.config()
+    max_attempts = int(config["max_attempts"])
+    if config["approach"] == "regex":
+        scorer = _RegexScorer(config)
+    else:
+        scorer = _LLMScorer(config, api_key, base_url, concurrency, cache_path)
+
+    processed = 0
+    try:
+        while True:
+            shard_id = queue.claim(worker, lease)
+            if shard_id is None:
+                wait = queue.next_claim_in()
+                if wait is None:
+                    return processed
+                # Another worker holds the rest, or retries are waiting out their delay
+                time.sleep(min(max(wait, 0.1), 1.0))
+                continue
+
+            checkpoint = _Checkpointer(queue, shard_id, worker, lease, max_attempts)
+            try:
+                scorer.score(queue.open_calls(shard_id), checkpoint)
+                checkpoint.flush()
+            except LeaseLost as e:
+                print(f"[ERROR] {e}; moving on", file=sys.stderr)
+                continue
+            except BaseException:
+                # Keep what was scored and let another worker have the rest now
+                try:
+                    checkpoint.flush()
+                finally:
+                    queue.release(shard_id, worker)
+                raise
+            queue.finish(shard_id, worker, retry_delay)
+            processed += 1
+    finally:
+        queue.close()
+
+
+def _work_process(kwargs: Dict):
+    try:
+        work(**kwargs)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sharded, resumable scoring of a whole corpus.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init = commands.add_parser("init", help="Create a job over a directory or packed corpus")
+    init.add_argument("database")
+    init.add_argument("source", help="Directory of call files, or a packed corpus")
+    init.add_argument("--approach", default="llm", choices=APPROACHES)
+    init.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE)
+    init.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="Tries per call before giving up")
+
+    run = commands.add_parser("run", help="Work on a job until every shard is done")
+    run.add_argument("database")
+    run.add_argument("--workers", type=int, default=1, help="Worker processes on this machine")
+    run.add_argument("--lease", type=float, default=DEFAULT_LEASE, help="Seconds a claim lasts without a checkpoint")
+    run.add_argument("--retry-delay", type=float, default=DEFAULT_RETRY_DELAY,
+                     help="Seconds before a shard with errors gets its next pass (doubles every pass)")
+    run.add_argument("--base-url", help="Gemini REST endpoint to use instead of the public API")
+    run.add_argument("--concurrency", type=int, default=8, help="Concurrent LLM requests per worker")
+    run.add_argument("--llm-cache", help="LLMResultCache database shared by the workers")
+
+    status = commands.add_parser("status", help="Summarize a job's progress")
+    status.add_argument("database")
+
+    export = commands.add_parser("export", help="Write the latest result of every scored call as JSON lines")
+    export.add_argument("database")
+    export.add_argument("--output", help="Output file (default: stdout)")
+
+    retry = commands.add_parser("retry", help="Give calls that ran out of attempts another round")
+    retry.add_argument("database")
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        if args.shard_size < 1 or args.max_attempts < 1:
+            print("[ERROR] --shard-size and --max-attempts must be at least 1", file=sys.stderr)
+            return 1
+        try:
+            if os.path.isfile(args.source):
+                with PackedCorpus(args.source) as corpus:
+                    names = corpus.names
+            else:
+                names = sorted(os.path.basename(p) for p in batch.iter_conversation_files(args.source))
+            queue = JobQueue(args.database)
+            queue.create(args.source, names, args.approach, args.shard_size, args.max_attempts)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            return 1
+        shards = (len(names) + args.shard_size - 1) // args.shard_size
+        print(f"Created a {args.approach} job over {len(names)} calls in {shards} shards: {args.database}")
+        return 0
+
+    if not os.path.exists(args.database):
+        print(f"[ERROR] No job database at {args.database}", file=sys.stderr)
+        return 1
+    queue = JobQueue(args.database)
+    if not queue.config():
+        print(f"[ERROR] {args.database} holds no job; create one with `init`", file=sys.stderr)
+        return 1
+
+    if args.command == "run":
+        api_key = os.getenv("GEMINI_API_KEY")
+        if queue.config()["approach"] != "regex" and not api_key and not args.base_url:
+            print("[ERROR] An llm/hybrid job needs GEMINI_API_KEY or --base-url", file=sys.stderr)
+            return 1
+        kwargs = dict(
+            path=args.database,
+            lease=args.lease,
+            retry_delay=args.retry_delay,
+            api_key=api_key,
+            base_url=args.base_url,
+            concurrency=args.concurrency,
+            cache_path=args.llm_cache
+        )
+        if args.workers <= 1:
+            try:
+                work(**kwargs)
+            except KeyboardInterrupt:
+                return 130
+        else:
+            processes = [multiprocessing.Process(target=_work_process, args=(kwargs,)) for _ in range(args.workers)]
+            for process in processes:
+                process.start()
+            try:
+                for process in processes:
+                    process.join()
+            except KeyboardInterrupt:
+                for process in processes:
+                    process.join()
+                return 130
+            if any(process.exitcode for process in processes):
+                print("[ERROR] A worker exited with an error; run again to resume", file=sys.stderr)
+                return 1
+
+    if args.command == "retry":
+        print(f"Queued {queue.retry_failed()} failed calls for another round")
+        return 0
+
+    if args.command == "export":
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            for row in queue.results():
+                out.write(json.dumps(row) + "\n")
+        finally:
+            if args.output:
+                out.close()
+        return 0
+
+    # status, and a summary at the end of run
+    print(json.dumps(queue.status(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
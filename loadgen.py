@@ -0,0 +1,171 @@
+"""
+Load generator for the scoring service: replays the call files of a
+directory as concurrent POST /score requests and reports latency
+percentiles and throughput.
+
+Usage:
+    python -m loadgen All_Conversations --concurrency 16 --requests 2000
+    python -m loadgen All_Conversations --url http://127.0.0.1:8080
+    python -m loadgen All_Conversations --approach llm --fake-llm-latency 0.2
+
+Without --url a service is started in this process on a free localhost port
+(with --fake-llm-latency, backed by a local fake Gemini server, so no API key
+or network access is needed). Each of the --concurrency clients sends its
+next request as soon as the previous one is answered, over a keep-alive
+connection. Refused requests (503) are counted, not retried.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+from contextlib import ExitStack
+from statistics import quantiles
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from common.fake_gemini import FakeGeminiServer
+from service import ScoringService
+
+
+def load_payloads(directory: str) -> List[bytes]:
+    payloads = []
+    for fname in sorted(os.listdir(directory)):
+        if fname.endswith(".json"):
+            with open(os.path.join(directory, fname), "rb") as f:
+                payloads.append(f.read())
+    return payloads
+
+
+def replay(
+    url: str,
+    payloads: List[bytes],
+    requests: int,
+    concurrency: int = 16,
+    approach: str = "regex"
+) -> Dict[str, float]:
+    """
+    Sends `requests` requests, cycling through `payloads`, from
+    `concurrency` clients and returns latency and throughput figures.
+    """
+    target = urlsplit(url)
+    path = f"/score?approach={approach}"
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+    next_index = iter(range(requests))
+
+    def client():
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=120)
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                break
+            started = time.perf_counter()
+            try:
+                conn.request("POST", path, body=payloads[index % len(payloads)],
+                             headers={"Content-Type": "application/json", "X-Call-ID": str(index)})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port, timeout=120)
+                status = 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed * 1000)
+        conn.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    report = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": statuses.get(200, 0),
+        "rejected": statuses.get(503, 0),
+        "failed": requests - statuses.get(200, 0) - statuses.get(503, 0),
+        "seconds": seconds,
+        "requests_per_second": statuses.get(200, 0) / max(seconds, 1e-9)
+    }
+    if latencies:
+        samples = latencies * 2 if len(latencies) < 2 else latencies
+        cuts = quantiles(samples, n=100, method="inclusive")
+        report.update({"p50_ms": cuts[49], "p90_ms": cuts[89], "p99_ms": cuts[98], "max_ms": max(latencies)})
+    return report
+
+
+def _batch_stats(service: ScoringService) -> Dict[str, float]:
+    counters = {}
+    for item in service.instrumentation.snapshot()["counters"]:
+        if item["name"] in ("batches", "batched_requests"):
+            lane = item["labels"]["lane"]
+            counters.setdefault(lane, {})[item["name"]] = item["value"]
+    return {
+        lane: values.get("batched_requests", 0) / values["batches"]
+        for lane, values in counters.items() if values.get("batches")
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay call files against the scoring service.")
+    parser.add_argument("directory", nargs="?", default="All_Conversations")
+    parser.add_argument("--url", help="Service to load (default: start one in this process)")
+    parser.add_argument("--approach", default="regex", choices=["regex", "llm", "hybrid"])
+    parser.add_argument("--requests", type=int, default=None, help="Total requests (default: 4 passes over the files)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes of an in-process service")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue", type=int, default=1024)
+    parser.add_argument("--fake-llm-latency", type=float, default=None,
+                        help="Back an in-process service with a fake Gemini server answering after this many seconds")
+    args = parser.parse_args(argv)
+
+    payloads = load_payloads(args.directory)
+    if not payloads:
+        print(f"[ERROR] No conversation files in {args.directory}", file=sys.stderr)
+        return 1
+    requests = args.requests or len(payloads) * 4
+
+    with ExitStack() as stack:
+        service: Optional[ScoringService] = None
+        url = args.url
+        if url is None:
+            base_url = None
+            if args.fake_llm_latency is not None:
+                base_url = stack.enter_context(FakeGeminiServer(latency=args.fake_llm_latency)).base_url
+            elif args.approach != "regex" and not os.getenv("GEMINI_API_KEY"):
+                print("[ERROR] --approach llm/hybrid needs GEMINI_API_KEY or --fake-llm-latency", file=sys.stderr)
+                return 1
+            service = stack.enter_context(ScoringService(
+                port=0,
+                workers=args.workers,
+                max_batch_size=args.max_batch_size,
+                max_wait=args.max_wait_ms / 1000,
+                max_queue=args.max_queue,
+                gemini_base_url=base_url
+            ))
+            url = service.base_url
+
+        report = replay(url, payloads, requests, args.concurrency, args.approach)
+        if service is not None:
+            report["mean_batch_size"] = _batch_stats(service)
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,473 @@
+"""
+HTTP scoring service for systems that want verdicts for a transcript over
+the network.
+
+Usage:
+    python -m service --port 8080 --workers 4
+    GEMINI_API_KEY=... python -m service --port 8080
+    python -m service --gemini-base-url http://127.0.0.1:9999   # e.g. common.fake_gemini
+
+POST a call's JSON (any format the call files use) to /score and get its
+profanity and privacy verdicts and call quality metrics back:
+
+    curl --data-binary @All_Conversations/<call>.json "http://127.0.0.1:8080/score?approach=regex"
+
+`approach` is "regex" (default), or "llm" / "hybrid" when a Gemini key or
+--gemini-base-url is configured. An X-Call-ID header is echoed back as
+"call_id". GET /health reports queue depths and GET /metrics serves
+Prometheus text.
+
+Concurrent requests are coalesced into micro-batches: a batch is dispatched
+once it holds --max-batch-size requests or --max-wait-ms after its first
+request, whichever comes first. Pattern-matching batches run on a pool of
+worker processes whose detectors are compiled at start-up; LLM batches are
+packed into multi-call prompts. Once --max-queue requests are waiting, new
+ones are refused with 503 and a Retry-After header.
+
+An upload that cannot be parsed, or whose Content-Length is missing a
+number, gets 400; one larger than --max-body-mb gets 413 without being read.
+A call whose LLM request failed
+gets 503 with Retry-After, and its row carries the "error" and
+"upstream_error": true, so clients know to try again.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import asyncio
+import argparse
+import threading
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import batch
+from common.conversation import parse_conversation
+from common.instrumentation import Instrumentation
+from task3_metrics.call_quality import CallQualityAnalyzer
+
+# (call ID, raw request body)
+Item = Tuple[str, bytes]
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MicroBatcher:
+    """
+    Coalesces submitted items into batches for `process`, which takes a list
+    of items and returns a Future of the list of their results.
+
+    At most `max_in_flight` batches are processed at once. While that many
+    are running the dispatcher waits, so requests pile up in the queue, and
+    submit() raises QueueFull once `max_queue` are waiting.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[Item]], Future],
+        max_batch_size: int = 32,
+        max_wait: float = 0.005,
+        max_queue: int = 1024,
+        max_in_flight: int = 4,
+        instrumentation: Instrumentation = None,
+        name: str = "regex"
+    ):
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue(max_queue)
+        self.instrumentation = instrumentation
+        self.name = name
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"batcher-{name}")
+
+    def start(self) -> "MicroBatcher":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.queue.put(None)
+        self._thread.join()
+
+    def submit(self, item: Item) -> Future:
+        future = Future()
+        try:
+            self.queue.put_nowait((item, future, time.perf_counter()))
+        except queue.Full:
+            raise QueueFull(self.name) from None
+        return future
+
+    def _collect(self) -> List:
+        first = self.queue.get()
+        if first is None:
+            self._stopping = True
+            return []
+
+        pending = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._stopping = True
+                break
+            pending.append(entry)
+        return pending
+
+    def _run(self):
+        while not self._stopping:
+            pending = self._collect()
+            if not pending:
+                continue
+
+            self._in_flight.acquire()
+            if self.instrumentation is not None:
+                now = time.perf_counter()
+                self.instrumentation.count("batches", lane=self.name)
+                self.instrumentation.count("batched_requests", len(pending), lane=self.name)
+                for _, _, queued_at in pending:
+                    self.instrumentation.observe("queue_wait", now - queued_at, lane=self.name)
+
+            try:
+                result = self.process([item for item, _, _ in pending])
+            except Exception as e:
+                self._in_flight.release()
+                for _, future, _ in pending:
+                    future.set_exception(e)
+                continue
+            result.add_done_callback(partial(self._finish, pending))
+
+    def _finish(self, pending: List, result: Future):
+        self._in_flight.release()
+        try:
+            rows = result.result()
+        except Exception as e:
+            for _, future, _ in pending:
+                future.set_exception(e)
+            return
+        for (_, future, _), row in zip(pending, rows):
+            future.set_result(row)
+
+
+def _warm(_: int) -> int:
+    return os.getpid()
+
+
+def _score_regex_batch(items: List[Item]) -> List[Dict]:
+    rows = []
+    for call_id, data in items:
+        row = batch.analyze_bytes(call_id, data)
+        del row["file"]
+        rows.append(dict(call_id=call_id, **row))
+    return rows
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under a burst of clients
+    request_queue_size = 1024
+
+
+class ScoringService:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        workers: Optional[int] = None,
+        max_batch_size: int = 32,
+        max_wait: float = 0.005,
+        max_queue: int = 1024,
+        request_timeout: float = 60.0,
+        max_body_size: int = 10 * 1024 * 1024,
+        api_key: str = None,
+        gemini_base_url: str = None,
+        llm_concurrency: int = 8
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.request_timeout = request_timeout
+        # Largest request body read, in bytes; bigger uploads get 413 unread
+        self.max_body_size = max_body_size
+        self.instrumentation = Instrumentation(prefix="scoring_service")
+        self._ids = 0
+        self._ids_lock = threading.Lock()
+
+        # Each worker compiles its detectors once, in batch._init_worker
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=batch._init_worker)
+        lane = partial(
+            MicroBatcher,
+            max_batch_size=max_batch_size,
+            max_wait=max_wait,
+            max_queue=max_queue,
+            instrumentation=self.instrumentation
+        )
+        self.lanes = {"regex": lane(self._score_regex, max_in_flight=self.workers * 2, name="regex")}
+
+        self._loop = None
+        if api_key or gemini_base_url or os.getenv("GEMINI_API_KEY"):
+            self._build_llm(api_key, gemini_base_url, llm_concurrency)
+            self.lanes["llm"] = lane(self._score_llm, max_in_flight=llm_concurrency, name="llm")
+            self.lanes["hybrid"] = lane(self._score_hybrid, max_in_flight=llm_concurrency, name="hybrid")
+
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    def _build_llm(self, api_key: str, gemini_base_url: str, concurrency: int):
+        from common.gemini_client import AsyncGeminiClient, http_transport
+        from task1_profanity.llm_detector import ProfanityLLMDetector
+        from task1_profanity.hybrid_detector import ProfanityHybridDetector
+        from task2_privacy.llm_detector import ComplianceLLMDetector
+        from task2_privacy.hybrid_detector import ComplianceHybridDetector
+
+        transport = http_transport(api_key=api_key, base_url=gemini_base_url) if gemini_base_url else None
+        client = AsyncGeminiClient(api_key=api_key, transport=transport, max_concurrency=concurrency)
+        self.profanity_llm = ProfanityLLMDetector(api_key=api_key, client=client)
+        self.compliance_llm = ComplianceLLMDetector(api_key=api_key, client=client)
+        self.profanity_hybrid = ProfanityHybridDetector(llm_detector=self.profanity_llm)
+        self.compliance_hybrid = ComplianceHybridDetector(llm_detector=self.compliance_llm)
+        self.quality = CallQualityAnalyzer()
+
+        # All LLM requests share one event loop, so the client's limits hold
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True, name="llm-loop").start()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_call_id(self) -> str:
+        with self._ids_lock:
+            self._ids += 1
+            return f"call-{self._ids}"
+
+    def _score_regex(self, items: List[Item]) -> Future:
+        return self.pool.submit(_score_regex_batch, items)
+
+    def _score_llm(self, items: List[Item]) -> Future:
+        return asyncio.run_coroutine_threadsafe(self._score_with(items, self._llm_verdicts), self._loop)
+
+    def _score_hybrid(self, items: List[Item]) -> Future:
+        return asyncio.run_coroutine_threadsafe(self._score_with(items, self._hybrid_verdicts), self._loop)
+
+    async def _llm_verdicts(self, conversations: Dict[str, List[Dict]]) -> List[Dict[str, Dict]]:
+        return await asyncio.gather(
+            self.profanity_llm.analyze_conversations_batched_async(conversations),
+            self.compliance_llm.analyze_conversations_batched_async(conversations)
+        )
+
+    async def _hybrid_verdicts(self, conversations: Dict[str, List[Dict]]) -> List[Dict[str, Dict]]:
+        return await asyncio.gather(
+            self.profanity_hybrid.analyze_conversations_async(conversations),
+            self.compliance_hybrid.analyze_conversations_async(conversations)
+        )
+
+    async def _score_with(self, items: List[Item], verdicts: Callable) -> List[Dict]:
+        # Keyed by position, since clients may reuse call IDs
+        rows, conversations = {}, {}
+        for index, (call_id, data) in enumerate(items):
+            key = str(index)
+            try:
+                conversations[key] = parse_conversation(data).to_records()
+            except Exception as e:
+                rows[key] = {"call_id": call_id, "error": f"{type(e).__name__}: {e}"}
+
+        if conversations:
+            results = await verdicts(conversations)
+            for key, conversation in conversations.items():
+                row, errors = {"call_id": items[int(key)][0]}, []
+                for result in results:
+                    verdict = dict(result[key])
+                    if "error" in verdict:
+                        errors.append(verdict.pop("error"))
+                    row.update(verdict)
+                row.update(self.quality.analyze(conversation))
+                if errors:
+                    # The upload was fine; Gemini failed, so the call can be retried
+                    row["error"] = "; ".join(errors)
+                    row["upstream_error"] = True
+                rows[key] = row
+        return [rows[str(index)] for index in range(len(items))]
+
+    def metrics_text(self) -> str:
+        lines = [f"# TYPE {self.instrumentation.prefix}_queue_depth gauge"]
+        for name, lane in self.lanes.items():
+            lines.append(f'{self.instrumentation.prefix}_queue_depth{{lane="{name}"}} {lane.queue.qsize()}')
+        return self.instrumentation.prometheus_text() + "\n".join(lines) + "\n"
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so a client can send many requests on one connection
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle on, every
+            # response on a kept-alive connection waits out a delayed ACK
+            disable_nagle_algorithm = True
+
+            def _send(self, status: int, payload: bytes, content_type: str = "application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_json(self, status: int, body: Dict, headers=None):
+                self._send(status, json.dumps(body).encode("utf-8"), headers=headers)
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if path == "/health":
+                    self._send_json(200, {
+                        "status": "ok",
+                        "workers": service.workers,
+                        "queue_depth": {name: lane.queue.qsize() for name, lane in service.lanes.items()}
+                    })
+                elif path == "/metrics":
+                    self._send(200, service.metrics_text().encode("utf-8"), "text/plain; version=0.0.4")
+                else:
+                    self._send_json(404, {"error": "Not found"})
+
+            def _body_length(self) -> Optional[int]:
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    return None
+                return length if length >= 0 else None
+
+            def do_POST(self):
+                length = self._body_length()
+                # An unread body would be taken for the next request, so the
+                # connection is closed after refusing it
+                if length is None:
+                    self._send_json(400, {"error": "Invalid Content-Length"}, headers={"Connection": "close"})
+                    return
+                if length > service.max_body_size:
+                    self._send_json(
+                        413,
+                        {"error": f"Body larger than {service.max_body_size} bytes"},
+                        headers={"Connection": "close"}
+                    )
+                    return
+                body = self.rfile.read(length)
+                url = urlsplit(self.path)
+                if url.path != "/score":
+                    self._send_json(404, {"error": "Not found"})
+                    return
+
+                approach = parse_qs(url.query).get("approach", ["regex"])[0]
+                lane = service.lanes.get(approach)
+                if lane is None:
+                    self._send_json(400, {"error": f"Approach not available: {approach}"})
+                    return
+
+                started = time.perf_counter()
+                call_id = self.headers.get("X-Call-ID") or service.next_call_id()
+                try:
+                    row = lane.submit((call_id, body)).result(timeout=service.request_timeout)
+                except QueueFull:
+                    service.instrumentation.count("rejected", approach=approach)
+                    self._send_json(503, {"error": "Queue full, retry later"}, headers={"Retry-After": "1"})
+                    return
+                except FutureTimeoutError:
+                    service.instrumentation.count("timeouts", approach=approach)
+                    self._send_json(504, {"error": "Timed out"})
+                    return
+                except Exception as e:
+                    print(f"[ERROR] Scoring failed: {e}", file=sys.stderr)
+                    self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+                    return
+
+                headers = None
+                if row.get("upstream_error"):
+                    status, headers = 503, {"Retry-After": "5"}
+                else:
+                    status = 400 if "error" in row else 200
+                service.instrumentation.observe("request", time.perf_counter() - started, approach=approach)
+                service.instrumentation.count("responses", approach=approach, status=status)
+                self._send_json(status, row, headers=headers)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "ScoringService":
+        # Start every worker now so no request pays for process start-up
+        list(self.pool.map(_warm, range(self.workers)))
+        for lane in self.lanes.values():
+            lane.start()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        for lane in self.lanes.values():
+            lane.stop()
+        self.pool.shutdown(cancel_futures=True)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def __enter__(self) -> "ScoringService":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve call scoring over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--max-batch-size", type=int, default=32, help="Requests per micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Longest a request waits for its batch to fill")
+    parser.add_argument("--max-queue", type=int, default=1024, help="Waiting requests before refusing with 503")
+    parser.add_argument("--max-body-mb", type=float, default=10.0, help="Largest request body accepted, in MiB")
+    parser.add_argument("--gemini-base-url", help="Gemini REST endpoint to use instead of the public API")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="Concurrent LLM requests")
+    args = parser.parse_args(argv)
+
+    service = ScoringService(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        max_queue=args.max_queue,
+        max_body_size=int(args.max_body_mb * 1024 * 1024),
+        api_key=os.getenv("GEMINI_API_KEY"),
+        gemini_base_url=args.gemini_base_url,
+        llm_concurrency=args.llm_concurrency
+    )
+    print(f"Serving on {service.base_url} (approaches: {', '.join(service.lanes)})", file=sys.stderr)
+    service.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Scores calls while they are still in progress.
+
+Input is newline-delimited JSON, one utterance per line, tagged with the call
+it belongs to; a line with "event": "end" closes a call:
+
+    {"call_id": "c1", "speaker": "Agent", "text": "...", "stime": 0, "etime": 4.5}
+    {"call_id": "c1", "event": "end"}
+
+Usage:
+    python -m stream < utterances.ndjson
+    python -m stream --listen 127.0.0.1:9000
+
+A verdict line is written as soon as a detector's verdict is final (e.g. the
+first privacy violation), and the remaining verdicts when the call ends.
+
+Utterances of a call may arrive in any order. A live ASR feed typically
+emits each one when it ends, so an interjection comes before the turn it
+interrupts. The profanity and compliance detectors read utterances in
+arrival order. The call quality metrics are exact for any order: they are
+kept running while start times increase, and recomputed from the call's
+collected times when the call ends if a record arrived late.
+
+With --profanity-pack / --compliance-pack the detectors are built from
+pattern pack files (see common.pattern_packs) and reloaded when the files
+change. Calls already in progress finish on the pack they started with.
+"""
+import sys
+import json
+import socket
+import argparse
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from common.pattern_packs import PatternPackWatcher, load_pack
+from task1_profanity.regex_detector import ProfanityRegexDetector, IncrementalProfanityDetector
+from task2_privacy.regex_detector import ComplianceRegexDetector, IncrementalComplianceDetector
+from task3_metrics.call_quality import UnorderedCallQualityAnalyzer
+
+
+class CallState:
+    """
+    Per-call detector state. Holds running flags and totals, plus the
+    speaker and times of each utterance for call quality, never the texts.
+    """
+
+    def __init__(self, profanity_detector: ProfanityRegexDetector, compliance_detector: ComplianceRegexDetector):
+        self.utterances = 0
+        self.profanity = IncrementalProfanityDetector(profanity_detector)
+        self.compliance = IncrementalComplianceDetector(compliance_detector)
+        self.quality = UnorderedCallQualityAnalyzer()
+        self.emitted = set()
+
+
+def _verdict(call_id: str, detector: str, result: Dict, state: CallState, final: bool) -> Dict:
+    state.emitted.add(detector)
+    return {
+        "call_id": call_id,
+        "detector": detector,
+        "result": result,
+        "utterances_seen": state.utterances,
+        "call_ended": final
+    }
+
+
+def record_problem(record) -> Optional[str]:
+    """
+    Why a record cannot be consumed, or None if it is well formed. An
+    utterance needs numeric "stime" and "etime"; "speaker" and "text", when
+    present, must be strings.
+    """
+    if not isinstance(record, dict):
+        return f"expected a JSON object, got {type(record).__name__}"
+    if record.get("event") == "end":
+        return None
+    for key in ("stime", "etime"):
+        value = record.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"utterance needs a numeric {key!r}"
+    for key in ("speaker", "text"):
+        if not isinstance(record.get(key, ""), str):
+            return f"{key!r} must be a string"
+    return None
+
+
+def stream_verdicts(
+    records: Iterable[Dict],
+    profanity_watcher: Optional[PatternPackWatcher] = None,
+    compliance_watcher: Optional[PatternPackWatcher] = None
+) -> Iterator[Dict]:
+    """
+    Consumes utterance records from any number of interleaved calls and
+    yields verdict events. Compiled detectors are shared by all calls.
+
+    With pattern pack watchers, packs are checked for changes whenever a new
+    call starts; each call keeps the detectors it started with. Malformed
+    records are reported and skipped without touching any call's state.
+    """
+    profanity_detector = ProfanityRegexDetector()
+    compliance_detector = ComplianceRegexDetector()
+    active: Dict[str, CallState] = {}
+
+    def new_call() -> CallState:
+        nonlocal profanity_detector, compliance_detector
+        if profanity_watcher is not None:
+            profanity_watcher.refresh()
+            profanity_detector = profanity_watcher.current
+        if compliance_watcher is not None:
+            compliance_watcher.refresh()
+            compliance_detector = compliance_watcher.current
+        return CallState(profanity_detector, compliance_detector)
+
+    for record in records:
+        problem = record_problem(record)
+        if problem is not None:
+            print(f"[ERROR] Skipping malformed record: {problem}", file=sys.stderr)
+            continue
+        call_id = str(record.get("call_id", ""))
+
+        if record.get("event") == "end":
+            # A call that ends without utterances still gets its verdicts
+            state = active.pop(call_id, None) or new_call()
+            if "profanity" not in state.emitted:
+                yield _verdict(call_id, "profanity", state.profanity.finalize(), state, True)
+            if "compliance" not in state.emitted:
+                yield _verdict(call_id, "compliance", state.compliance.finalize(), state, True)
+            yield _verdict(call_id, "call_quality", state.quality.finalize(), state, True)
+            continue
+
+        state = active.get(call_id)
+        if state is None:
+            state = active[call_id] = new_call()
+        state.utterances += 1
+
+        result = state.profanity.update(record)
+        if result is not None:
+            yield _verdict(call_id, "profanity", result, state, False)
+
+        result = state.compliance.update(record)
+        if result is not None:
+            yield _verdict(call_id, "compliance", result, state, False)
+
+        state.quality.update(record)
+
+
+def parse_lines(lines: Iterable[str]) -> Iterator[Dict]:
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"[ERROR] Skipping malformed line: {e}", file=sys.stderr)
+
+
+def socket_lines(host: str, port: int) -> Iterator[str]:
+    """
+    Accepts connections one after another and yields the lines each sends.
+    """
+    with socket.create_server((host, port)) as server:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("r", encoding="utf-8") as reader:
+                yield from reader
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Score calls from a stream of NDJSON utterances.")
+    parser.add_argument("--listen", metavar="HOST:PORT", help="Read from a TCP socket instead of stdin")
+    parser.add_argument("--profanity-pack", help="Profanity pattern pack file, reloaded when it changes")
+    parser.add_argument("--compliance-pack", help="Compliance pattern pack file, reloaded when it changes")
+    args = parser.parse_args(argv)
+
+    watchers = {}
+    packs = (
+        ("profanity", args.profanity_pack, ProfanityRegexDetector.from_pack),
+        ("compliance", args.compliance_pack, ComplianceRegexDetector.from_pack)
+    )
+    for name, path, build in packs:
+        if not path:
+            continue
+        try:
+            load_pack(path, expected_name=name)
+            watchers[name] = PatternPackWatcher(path, build)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            return 1
+
+    if args.listen:
+        host, port = args.listen.rsplit(":", 1)
+        lines = socket_lines(host, int(port))
+    else:
+        lines = sys.stdin
+
+    events = stream_verdicts(parse_lines(lines), watchers.get("profanity"), watchers.get("compliance"))
+    for event in events:
+        sys.stdout.write(json.dumps(event) + "\n")
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
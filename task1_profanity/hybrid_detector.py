@@ -0,0 +1,96 @@
+import re
+from typing import List, Dict, Union, Tuple
+from common.escalation import HybridDetector
+from task1_profanity.regex_detector import ProfanityRegexDetector
+
+# Mild terms that are often used without intent to offend, so a hit on them
+# alone is not conclusive
+MILD_PROFANITY_TERMS = {"hell", "damn", "crap"}
+
+# Wording close to profanity that none of the regex patterns cover
+NEAR_MISS_PROFANITY_PATTERNS = [
+    r'\bfreak(?:ing|in)?\b', r'\bfrick(?:ing|in)?\b', r'\beffing\b', r'\bfudge\b',
+    r'\bheck\b', r'\bdarn\b', r'\bdang\b', r'\bcrud\b', r'\bbloody\b', r'\bpissed\b',
+    r'\bjerk\b', r'\bmoron\b', r'\bscrew(?:ed)?\b', r'\bsucks?\b', r'\bbs\b',
+    r'\bpathetic\b', r'\buseless\b', r'\bincompetent\b'
+]
+
+
+class ProfanityHybridDetector(HybridDetector):
+    """
+    ProfanityRegexDetector first; a call is escalated to ProfanityLLMDetector
+    when a speaker's flag rests only on a mild, obfuscated or contextual
+    match, or when a speaker with no match used near-miss wording.
+    """
+
+    DEFAULT_WEIGHTS = {
+        "weak_match": 0.3,
+        "near_miss": 0.4
+    }
+
+    def __init__(
+        self,
+        regex_detector: ProfanityRegexDetector = None,
+        llm_detector=None,
+        api_key: str = None,
+        threshold: float = 0.5,
+        weights: Dict[str, float] = None,
+        near_miss_patterns: List[str] = None
+    ):
+        super().__init__(regex_detector or ProfanityRegexDetector(), llm_detector, api_key, threshold, weights)
+        self.near_miss_patterns = near_miss_patterns or NEAR_MISS_PROFANITY_PATTERNS
+        self.near_miss_regex = re.compile("|".join(self.near_miss_patterns), re.IGNORECASE)
+
+    def build_llm_detector(self):
+        from task1_profanity.llm_detector import ProfanityLLMDetector
+        return ProfanityLLMDetector(api_key=self.api_key)
+
+    @staticmethod
+    def _strong(match) -> bool:
+        return match.category == "profanity" and match.text.lower() not in MILD_PROFANITY_TERMS
+
+    def _has_strong_match(self, text: str) -> bool:
+        # find_profanity only reports the leftmost match, so "hell no, shit"
+        # would otherwise look mild
+        return any(
+            term.group().lower() not in MILD_PROFANITY_TERMS
+            for compiled in self.regex_detector.compiled_profanity
+            for term in compiled.finditer(text)
+        )
+
+    def ambiguity_reasons(self, conversation: Union[List[Dict], Dict]) -> Tuple[Dict[str, bool], List[str]]:
+        if isinstance(conversation, dict):
+            conversation = [conversation]
+
+        # Per flag: did a strong match, a weak match or near-miss wording occur
+        strong = {"agent_profanity": False, "borrower_profanity": False}
+        weak = dict(strong)
+        near = dict(strong)
+
+        for con in conversation:
+            speaker = con.get("speaker", "").lower()
+            if "agent" in speaker:
+                flag = "agent_profanity"
+            elif "borrower" in speaker:
+                flag = "borrower_profanity"
+            else:
+                continue
+            if strong[flag]:
+                continue
+
+            text = con.get("text", "")
+            match = self.regex_detector.find_profanity(text)
+            if match is None:
+                near[flag] = near[flag] or self.near_miss_regex.search(text) is not None
+            elif self._strong(match) or self._has_strong_match(text):
+                strong[flag] = True
+            else:
+                weak[flag] = True
+
+        verdict = {flag: strong[flag] or weak[flag] for flag in strong}
+        reasons = []
+        if any(weak[flag] and not strong[flag] for flag in strong):
+            reasons.append("weak_match")
+        if any(near[flag] and not verdict[flag] for flag in strong):
+            reasons.append("near_miss")
+        return verdict, reasons
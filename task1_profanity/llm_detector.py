@@ -1,32 +1,82 @@
 import os
 import json
-from typing import Dict, Union, List
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Union, List, Tuple
 import google.generativeai as genai
+from common.gemini_client import AsyncGeminiClient
+from common.llm_cache import LLMResultCache
+from common.instrumentation import Instrumentation, timed
+from common.llm_batching import analyze_batched, analyze_batched_async, format_batch
+from common.windowing import window_lines
 
 
 class ProfanityLLMDetector:
-    def __init__(self, api_key: str = None):
+    # Detector label on common.instrumentation metrics
+    INSTRUMENTATION_LABEL = "profanity_llm"
+    # Bump whenever build_prompt changes so cached verdicts are not reused
+    PROMPT_VERSION = "1"
+
+    def __init__(
+        self,
+        api_key: str = None,
+        client=None,
+        cache=None,
+        instrumentation: Instrumentation = None,
+        window_tokens: int = 4000,
+        window_overlap_tokens: int = 200
+    ):
         self.api_key = api_key
+        self.model_name = "gemini-2.0-flash"
         genai.configure(api_key=self.api_key or os.getenv("GEMINI_API_KEY"))
-        self.model = genai.GenerativeModel("gemini-2.0-flash")
+        self.model = genai.GenerativeModel(self.model_name)
+        # AsyncGeminiClient for the async path; pass one instance to both detectors to share limits
+        self.client = client
+        # Optional common.llm_cache.LLMResultCache consulted before every request
+        self.cache = cache
+        # Optional common.instrumentation.Instrumentation for stage timings and outcomes
+        self.instrumentation = instrumentation
+        # Transcripts longer than this are split into overlapping windows that
+        # are scored in parallel; profanity in any window flags the call
+        self.window_tokens = window_tokens
+        self.window_overlap_tokens = window_overlap_tokens
 
-    def format_conversation(self, utterances: List[Dict]) -> str:
+    def format_lines(self, utterances: List[Dict]) -> List[str]:
         formatted = []
         for utt in utterances:
             speaker = utt.get("speaker", "unknown")
             text = utt.get("text", "").strip().replace("\n", " ")
             formatted.append(f"{speaker}: {text}")
-        return "\n".join(formatted)
+        return formatted
 
-    def analyze_conversation(self, conversation: Union[Dict, List[Dict]]) -> Dict[str, bool]:
+    def format_conversation(self, utterances: List[Dict]) -> str:
+        return "\n".join(self.format_lines(utterances))
+
+    def _utterances(self, conversation: Union[Dict, List[Dict]]) -> List[Dict]:
         if isinstance(conversation, dict):
-            utterances = list(conversation.values())[0] if len(conversation) == 1 else conversation.get("utterances", [])
-        else:
-            utterances = conversation
+            return list(conversation.values())[0] if len(conversation) == 1 else conversation.get("utterances", [])
+        return conversation
+
+    def format_transcript(self, conversation: Union[Dict, List[Dict]]) -> str:
+        return self.format_conversation(self._utterances(conversation))
 
-        input_text = self.format_conversation(utterances)
+    def build_prompt(self, conversation: Union[Dict, List[Dict]]) -> str:
+        return self.prompt_for(self.format_transcript(conversation))
+
+    def build_prompts(self, conversation: Union[Dict, List[Dict]]) -> List[str]:
+        """
+        One prompt per transcript window; a single prompt identical to
+        build_prompt when the call fits within `window_tokens`.
+        """
+        windows = window_lines(
+            self.format_lines(self._utterances(conversation)),
+            self.window_tokens,
+            self.window_overlap_tokens
+        )
+        return [self.prompt_for("\n".join(lines)) for lines in windows]
 
-        prompt = (
+    def prompt_for(self, input_text: str) -> str:
+        return (
             "You are a conversation compliance checker. "
             "Analyze the following dialogue between a debt collection agent and a borrower. "
             "Return a JSON object with two fields: "
@@ -37,18 +87,149 @@ class ProfanityLLMDetector:
             '{\n  "agent_profanity": true/false,\n  "borrower_profanity": true/false\n}'
         )
 
+    def build_batch_prompt(self, batch: List[Tuple[str, str]]) -> str:
+        return (
+            "You are a conversation compliance checker. "
+            "Analyze each of the following dialogues between a debt collection agent and a borrower. "
+            "Return a JSON array with one object per call, each with three fields: "
+            "`call_id`, and `agent_profanity` and `borrower_profanity`, both set to true or false "
+            "depending on whether profanity was used by that speaker in that call.\n\n"
+            f"Conversations:\n{format_batch(batch)}\n\n"
+            "Response format:\n"
+            '[\n  {"call_id": "...", "agent_profanity": true/false, "borrower_profanity": true/false}\n]'
+        )
+
+    def to_verdict(self, result: Dict) -> Dict[str, bool]:
+        # Sanitize result to be safe
+        return {
+            "agent_profanity": bool(result.get("agent_profanity", False)),
+            "borrower_profanity": bool(result.get("borrower_profanity", False))
+        }
+
+    def parse_response(self, text: str) -> Dict[str, bool]:
+        json_text = text.strip("```json").strip("```").strip()
+        return self.to_verdict(json.loads(json_text))
+
+    def _cache_key(self, prompt: str) -> str:
+        return LLMResultCache.make_key(prompt, self.model_name, self.PROMPT_VERSION)
+
+    def error_verdict(self, error: Exception) -> Dict:
+        """
+        All-negative verdict for a request that failed. The "error" entry
+        tells it apart from a genuine negative, and it is never cached, so
+        the call can be retried.
+        """
+        return {
+            "agent_profanity": False,
+            "borrower_profanity": False,
+            "error": f"{type(error).__name__}: {error}"
+        }
+
+    def merge_verdicts(self, verdicts: List[Dict[str, bool]]) -> Dict[str, bool]:
+        # Profanity anywhere in the call flags the speaker
+        merged = {
+            "agent_profanity": any(v["agent_profanity"] for v in verdicts),
+            "borrower_profanity": any(v["borrower_profanity"] for v in verdicts)
+        }
+        # A failed window leaves the whole call unscored
+        errors = [v["error"] for v in verdicts if "error" in v]
+        if errors:
+            merged["error"] = errors[0]
+        return merged
+
+    def _record(self, outcome: str):
+        if self.instrumentation is not None:
+            self.instrumentation.count("llm_results", detector=self.INSTRUMENTATION_LABEL, outcome=outcome)
+
+    def _score_prompt(self, prompt: str) -> Dict[str, bool]:
+        if self.cache is not None:
+            key = self._cache_key(prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record("cache_hit")
+                return cached
+
         try:
-            response = self.model.generate_content(prompt)
-            json_text = response.text.strip("```json").strip("```").strip()
-            result = json.loads(json_text)
-            # Sanitize result to be safe
-            return {
-                "agent_profanity": bool(result.get("agent_profanity", False)),
-                "borrower_profanity": bool(result.get("borrower_profanity", False))
-            }
+            with timed(self.instrumentation, "llm_request", detector=self.INSTRUMENTATION_LABEL):
+                response = self.model.generate_content(prompt)
+            with timed(self.instrumentation, "parse", detector=self.INSTRUMENTATION_LABEL):
+                result = self.parse_response(response.text)
+            if self.cache is not None:
+                self.cache.set(key, result)
+            self._record("ok")
+            return result
         except Exception as e:
             print(f"[ERROR] Gemini LLM failed: {e}")
-            return {
-                "agent_profanity": False,
-                "borrower_profanity": False
-            }
+            self._record("error")
+            return self.error_verdict(e)
+
+    async def _score_prompt_async(self, prompt: str) -> Dict[str, bool]:
+        if self.cache is not None:
+            key = self._cache_key(prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record("cache_hit")
+                return cached
+        if self.client is None:
+            self.client = AsyncGeminiClient(api_key=self.api_key)
+
+        try:
+            with timed(self.instrumentation, "llm_request", detector=self.INSTRUMENTATION_LABEL):
+                text = await self.client.generate(prompt)
+            with timed(self.instrumentation, "parse", detector=self.INSTRUMENTATION_LABEL):
+                result = self.parse_response(text)
+            if self.cache is not None:
+                self.cache.set(key, result)
+            self._record("ok")
+            return result
+        except Exception as e:
+            print(f"[ERROR] Gemini LLM failed: {e}")
+            self._record("error")
+            return self.error_verdict(e)
+
+    def analyze_conversation(self, conversation: Union[Dict, List[Dict]]) -> Dict[str, bool]:
+        with timed(self.instrumentation, "call", detector=self.INSTRUMENTATION_LABEL):
+            with timed(self.instrumentation, "format", detector=self.INSTRUMENTATION_LABEL):
+                prompts = self.build_prompts(conversation)
+            if len(prompts) == 1:
+                return self._score_prompt(prompts[0])
+            with ThreadPoolExecutor(max_workers=min(len(prompts), 8)) as executor:
+                return self.merge_verdicts(list(executor.map(self._score_prompt, prompts)))
+
+    async def analyze_conversation_async(self, conversation: Union[Dict, List[Dict]]) -> Dict[str, bool]:
+        with timed(self.instrumentation, "call", detector=self.INSTRUMENTATION_LABEL):
+            with timed(self.instrumentation, "format", detector=self.INSTRUMENTATION_LABEL):
+                prompts = self.build_prompts(conversation)
+            if len(prompts) == 1:
+                return await self._score_prompt_async(prompts[0])
+            return self.merge_verdicts(await asyncio.gather(*(self._score_prompt_async(p) for p in prompts)))
+
+    async def analyze_conversations_async(self, conversations: List) -> List[Dict[str, bool]]:
+        """
+        Scores many conversations concurrently; the shared client enforces the
+        concurrency and rate limits.
+        """
+        return await asyncio.gather(*(self.analyze_conversation_async(c) for c in conversations))
+
+    def analyze_conversations_batched(
+        self,
+        conversations: Dict[str, Union[Dict, List[Dict]]],
+        token_budget: int = 8000,
+        max_batch_size: int = 20
+    ) -> Dict[str, Dict[str, bool]]:
+        """
+        Packs conversations, keyed by call ID, into as few prompts as the token
+        budget allows. Calls missing from an unparseable or incomplete batched
+        response are retried with per-call requests.
+        """
+        return analyze_batched(self, conversations, token_budget, max_batch_size)
+
+    async def analyze_conversations_batched_async(
+        self,
+        conversations: Dict[str, Union[Dict, List[Dict]]],
+        token_budget: int = 8000,
+        max_batch_size: int = 20
+    ) -> Dict[str, Dict[str, bool]]:
+        if self.client is None:
+            self.client = AsyncGeminiClient(api_key=self.api_key)
+        return await analyze_batched_async(self, conversations, token_budget, max_batch_size)
@@ -1,23 +1,150 @@
 import re
-from typing import List, Dict, Union
+from functools import lru_cache
+from concurrent.futures import Executor
+from typing import List, Dict, Union, NamedTuple, Optional, Tuple
+from common.instrumentation import Instrumentation, timed
+from common.parallel_scan import DEFAULT_CHUNK_SIZE, chunk_bounds, columns, run_chunks, shared_executor, use_parallel
+from common.pattern_packs import PROFANITY_PACK, PatternPack, load_pack
 
-DEFAULT_PROFANITY_LIST = [
-    r'\bass\b', r'\bshit\b', r'\bfuck\b', r'\bdamn\b', r'\bbitch\b',
-    r'\bcrap\b', r'\bhell\b', r'\bmotherfucker\b', r'\bwtf\b', r'\bpiss\b',
-    r'\bdick\b', r'\bcunt\b', r'\bbugger\b', r'\bbastard\b', r'\bslut\b'
-]
+# The built-in lexicon is the bundled pattern pack, so the two cannot drift
+DEFAULT_PACK = load_pack(PROFANITY_PACK, expected_name="profanity")
+DEFAULT_PROFANITY_LIST = DEFAULT_PACK.patterns["profanity"]
+OBFUSCATED_PROFANITY_PATTERNS = DEFAULT_PACK.patterns["obfuscated"]
+CONTEXTUAL_PROFANITY_PATTERNS = DEFAULT_PACK.patterns["contextual"]
 
-OBFUSCATED_PROFANITY_PATTERNS = [
-    r'f\*+', r's\*+', r'b\*+', r'a\*+', r'd\*+',
-    r'f[^a-zA-Z]*u[^a-zA-Z]*c[^a-zA-Z]*k',
-    r's[^a-zA-Z]*h[^a-zA-Z]*i[^a-zA-Z]*t',
-]
 
-CONTEXTUAL_PROFANITY_PATTERNS = [
-    r'shut up', r'go to hell', r'screw you',
-    r'get lost', r'idiot', r'stupid', r'dumb',
-    r'shut the hell up', r'what the hell', r'what the heck'
-]
+class ProfanityMatch(NamedTuple):
+    category: str
+    pattern: str
+    text: str
+
+
+# A whole-word literal such as r'\bdamn\b' or re.escape'd r'\bshut\ up\b'
+_WORD_LITERAL = re.compile(r'^\\b((?:[^\\\[\](){}.*+?^$|]|\\[^A-Za-z0-9])+)\\b$')
+_ESCAPE = re.compile(r'\\(.)')
+
+
+def _has_top_level_branch(pattern: str) -> bool:
+    depth, i, in_class = 0, 0, False
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+            # A ']' right after '[' or '[^' is a literal member
+            i += 2 if pattern[i + 1:i + 2] == "^" else 1
+            if pattern[i:i + 1] == "]":
+                i += 1
+            continue
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def _trie_pattern(node: Dict) -> str:
+    alternatives = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not alternatives:
+        return ""
+    body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    # "" marks a term ending here, so everything below it is optional
+    return f"(?:{body})?" if "" in node else body
+
+
+class CombinedProfanityMatcher:
+    """
+    Compiles every pattern group into one regex, so an utterance is scanned
+    once regardless of how many terms the lexicon holds.
+
+    Whole-word literals are folded into a character trie behind a single
+    leading \\b, other \\b-anchored patterns share that anchor, and the rest
+    are plain alternatives. The pattern that fired is only worked out after
+    a hit, which keeps capturing groups out of the hot path.
+    """
+
+    def __init__(self, pattern_groups: Dict[str, List[str]]):
+        self.terms = []
+        trie = {}
+        word_patterns, other_patterns = [], []
+
+        for category, patterns in pattern_groups.items():
+            for pattern in patterns:
+                self.terms.append((category, pattern, re.compile(pattern, re.IGNORECASE)))
+
+                literal = _WORD_LITERAL.match(pattern)
+                if literal:
+                    node = trie
+                    for ch in _ESCAPE.sub(r"\1", literal.group(1)).lower():
+                        node = node.setdefault(ch, {})
+                    node[""] = {}
+                elif pattern.startswith(r"\b") and not _has_top_level_branch(pattern):
+                    word_patterns.append(pattern[2:])
+                else:
+                    other_patterns.append(pattern)
+
+        word_alternatives = [f"(?:{pat})" for pat in word_patterns]
+        if trie:
+            word_alternatives.insert(0, _trie_pattern(trie) + r"\b")
+
+        alternatives = [f"(?:{pat})" for pat in other_patterns]
+        if word_alternatives:
+            alternatives.insert(0, r"\b(?:" + "|".join(word_alternatives) + ")")
+
+        self.regex = re.compile("|".join(alternatives) or r"(?!)", re.IGNORECASE)
+
+    def search(self, text: str) -> Optional[ProfanityMatch]:
+        match = self.regex.search(text)
+        if match is None:
+            return None
+        start = match.start()
+        for category, pattern, compiled in self.terms:
+            term = compiled.match(text, start)
+            if term is not None:
+                return ProfanityMatch(category, pattern, term.group())
+        # Unreachable: some pattern produced the combined match at `start`
+        return None
+
+
+@lru_cache(maxsize=32)
+def _compile_lexicon(profanity: Tuple[str, ...], obfuscated: Tuple[str, ...], contextual: Tuple[str, ...]):
+    # One compiled lexicon per process per set of pattern lists, shared by
+    # every detector built from them; nothing here is mutated after this
+    return (
+        [re.compile(pat, re.IGNORECASE) for pat in profanity],
+        [re.compile(pat, re.IGNORECASE) for pat in obfuscated],
+        [re.compile(r'\b' + re.escape(pat) + r'\b', re.IGNORECASE) for pat in contextual],
+        CombinedProfanityMatcher({
+            "profanity": list(profanity),
+            "obfuscated": list(obfuscated),
+            "contextual": [r'\b' + re.escape(pat) + r'\b' for pat in contextual],
+        })
+    )
+
+
+def _scan_chunk(lexicon: Tuple[Tuple[str, ...], ...], speakers: List[str], texts: List[str]) -> List[int]:
+    # Positions of the profane utterances in one chunk of a call, up to the
+    # one that sets both speaker flags
+    matcher = _compile_lexicon(*lexicon)[3]
+    hits, agent, borrower = [], False, False
+    for position, (speaker, text) in enumerate(zip(speakers, texts)):
+        if matcher.regex.search(text) is not None:
+            hits.append(position)
+            speaker = speaker.lower()
+            if "agent" in speaker:
+                agent = True
+            elif "borrower" in speaker:
+                borrower = True
+            if agent and borrower:
+                break
+    return hits
 
 
 class ProfanityRegexDetector:
@@ -25,16 +152,43 @@ class ProfanityRegexDetector:
         self,
         profanity_patterns: List[str] = None,
         obfuscated_patterns: List[str] = None,
-        contextual_patterns: List[str] = None
+        contextual_patterns: List[str] = None,
+        instrumentation: Instrumentation = None
     ):
         self.profanity_patterns = profanity_patterns or DEFAULT_PROFANITY_LIST
         self.obfuscated_patterns = obfuscated_patterns or OBFUSCATED_PROFANITY_PATTERNS
         self.contextual_patterns = contextual_patterns or CONTEXTUAL_PROFANITY_PATTERNS
 
-        self.compiled_profanity = [re.compile(pat, re.IGNORECASE) for pat in self.profanity_patterns]
-        self.compiled_obfuscated = [re.compile(pat, re.IGNORECASE) for pat in self.obfuscated_patterns]
-        self.compiled_contextual = [re.compile(r'\b' + re.escape(pat) + r'\b', re.IGNORECASE)
-                                    for pat in self.contextual_patterns]
+        custom = profanity_patterns or obfuscated_patterns or contextual_patterns
+        self.pack_version = None if custom else DEFAULT_PACK.version
+
+        self.compiled_profanity, self.compiled_obfuscated, self.compiled_contextual, self.matcher = _compile_lexicon(
+            tuple(self.profanity_patterns), tuple(self.obfuscated_patterns), tuple(self.contextual_patterns)
+        )
+        # Optional common.instrumentation.Instrumentation for timings and pattern hits
+        self.instrumentation = instrumentation
+
+    @classmethod
+    def from_pack(cls, pack: PatternPack, instrumentation: Instrumentation = None) -> "ProfanityRegexDetector":
+        """
+        Builds a detector from a "profanity" pattern pack (see
+        common.pattern_packs).
+        """
+        detector = cls(
+            profanity_patterns=pack.patterns["profanity"],
+            obfuscated_patterns=pack.patterns["obfuscated"],
+            contextual_patterns=pack.patterns["contextual"],
+            instrumentation=instrumentation
+        )
+        detector.pack_version = pack.version
+        return detector
+
+    def find_profanity(self, text: str) -> Optional[ProfanityMatch]:
+        """
+        Returns the leftmost match across all pattern groups with its category
+        ("profanity", "obfuscated" or "contextual") and the term that fired.
+        """
+        return self.matcher.search(text)
 
     def detect_profanity(self, text: str) -> bool:
         """
@@ -42,11 +196,9 @@ class ProfanityRegexDetector:
         1. Direct profanity
         2. Obfuscated forms
         3. Contextually rude phrases
+        All three groups are checked in a single scan by the combined matcher.
         """
-        for pattern_group in [self.compiled_profanity, self.compiled_obfuscated, self.compiled_contextual]:
-            if any(pattern.search(text) for pattern in pattern_group):
-                return True
-        return False
+        return self.matcher.regex.search(text) is not None
 
     def analyze_conversation(self, conversation: Union[List[Dict], Dict]) -> Dict[str, bool]:
         """
@@ -57,6 +209,68 @@ class ProfanityRegexDetector:
             "borrower_profanity": True/False
         }
         """
+        if self.instrumentation is None:
+            return self._scan(conversation)
+        with self.instrumentation.timer("regex_scan", detector="profanity_regex"):
+            return self._scan(conversation)
+
+    def analyze_conversation_parallel(
+        self,
+        conversation: Union[List[Dict], Dict],
+        executor: Executor = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        min_utterances: int = None
+    ) -> Dict[str, bool]:
+        """
+        Same verdict as analyze_conversation, for very long transcripts: the
+        utterances are scanned in chunks on `executor` (default: a shared
+        process pool), and chunks not yet started are cancelled once both
+        speaker flags are set. Calls shorter than `min_utterances` (default
+        common.parallel_scan.MIN_PARALLEL_UTTERANCES) are scanned in place.
+        """
+        if isinstance(conversation, dict):
+            conversation = [conversation]
+        if not use_parallel(len(conversation), executor, min_utterances):
+            return self.analyze_conversation(conversation)
+
+        with timed(self.instrumentation, "regex_scan", detector="profanity_regex"):
+            return self._scan_parallel(conversation, executor or shared_executor(), chunk_size)
+
+    def _scan_parallel(self, conversation: List[Dict], executor: Executor, chunk_size: int) -> Dict[str, bool]:
+        speakers, texts = columns(conversation)
+        lexicon = (tuple(self.profanity_patterns), tuple(self.obfuscated_patterns), tuple(self.contextual_patterns))
+        bounds = chunk_bounds(len(texts), chunk_size)
+        flags = {
+            "agent_profanity": False,
+            "borrower_profanity": False
+        }
+
+        def apply(start: int, hits: List[int]):
+            for position in hits:
+                speaker = speakers[start + position].lower()
+                if "agent" in speaker:
+                    flags["agent_profanity"] = True
+                elif "borrower" in speaker:
+                    flags["borrower_profanity"] = True
+                if self.instrumentation is not None:
+                    self._record_hit(texts[start + position])
+
+        # Flags are only ever set, so the chunks may be folded in any order
+        def settled(index: int, hits: List[int]) -> bool:
+            apply(bounds[index][0], hits)
+            return all(flags.values())
+
+        tasks = [(lexicon, speakers[start:end], texts[start:end]) for start, end in bounds]
+        run_chunks(executor, _scan_chunk, tasks, settled)
+        return flags
+
+    def _record_hit(self, text: str):
+        match = self.find_profanity(text)
+        self.instrumentation.count(
+            "pattern_hits", detector="profanity_regex", category=match.category, pattern=match.pattern
+        )
+
+    def _scan(self, conversation: Union[List[Dict], Dict]) -> Dict[str, bool]:
         flags = {
             "agent_profanity": False,
             "borrower_profanity": False
@@ -71,6 +285,8 @@ class ProfanityRegexDetector:
             text = con.get("text", "")
 
             if self.detect_profanity(text):
+                if self.instrumentation is not None:
+                    self._record_hit(text)
                 if "agent" in speaker:
                     flags["agent_profanity"] = True
                 elif "borrower" in speaker:
@@ -80,3 +296,64 @@ class ProfanityRegexDetector:
                 break
 
         return flags
+
+
+class IncrementalProfanityDetector:
+    """
+    Stateful profanity check fed one utterance at a time. Holds only the two
+    speaker flags, so memory per call is constant.
+    """
+
+    def __init__(self, detector: ProfanityRegexDetector = None):
+        self.detector = detector or ProfanityRegexDetector()
+        self.flags = {
+            "agent_profanity": False,
+            "borrower_profanity": False
+        }
+
+    @property
+    def is_final(self) -> bool:
+        # Flags only ever go from False to True, so once both are set nothing
+        # later in the call can change the verdict
+        return all(self.flags.values())
+
+    def update(self, utterance: Dict) -> Optional[Dict[str, bool]]:
+        """
+        Consumes one utterance and returns the verdict if it just became
+        final, otherwise None.
+        """
+        if self.is_final:
+            return None
+
+        speaker = utterance.get("speaker", "").lower()
+        if self.detector.detect_profanity(utterance.get("text", "")):
+            if "agent" in speaker:
+                self.flags["agent_profanity"] = True
+            elif "borrower" in speaker:
+                self.flags["borrower_profanity"] = True
+
+        return dict(self.flags) if self.is_final else None
+
+    def finalize(self) -> Dict[str, bool]:
+        return dict(self.flags)
+
+
+class ProfanityStage(IncrementalProfanityDetector):
+    """
+    common.pipeline stage with the same verdict as analyze_conversation,
+    reading the speaker role from the shared utterance features.
+    """
+
+    def update(self, features) -> Optional[Dict[str, bool]]:
+        if self.is_final:
+            return None
+
+        if self.detector.detect_profanity(features.text):
+            if self.detector.instrumentation is not None:
+                self.detector._record_hit(features.text)
+            if features.role == "agent":
+                self.flags["agent_profanity"] = True
+            elif features.role == "borrower":
+                self.flags["borrower_profanity"] = True
+
+        return dict(self.flags) if self.is_final else None
@@ -0,0 +1,73 @@
+import re
+from typing import List, Dict, Union, Tuple
+from common.escalation import HybridDetector
+from task2_privacy.regex_detector import ComplianceRegexDetector
+
+# Identity-check wording that falls short of a full verification pattern,
+# e.g. "can I get your date of birth to verify your identity?"
+NEAR_MISS_VERIFICATION_PATTERNS = [
+    r"\bverif(?:y|ying|ication)\b", r"\bidentity\b", r"\bauthenticat\w*",
+    r"\bdate of birth\b", r"\bDOB\b", r"\bsocial security\b", r"\bSSN\b"
+]
+
+# Amounts the sensitive-info patterns did not tie to an account, e.g.
+# "you owe us over $300"
+NEAR_MISS_SENSITIVE_PATTERNS = [
+    r"\$\s?\d", r"\b\d{1,3}(?:,\d{3})+(?:\.\d\d)?\b", r"\b\d+\.\d\d\b", r"\bdollars\b"
+]
+
+
+class ComplianceHybridDetector(HybridDetector):
+    """
+    ComplianceRegexDetector first; a call is escalated to
+    ComplianceLLMDetector when a flagged disclosure was preceded by
+    identity-check wording the verification patterns missed, or when an
+    unflagged call mentions amounts before any verification.
+    """
+
+    DEFAULT_WEIGHTS = {
+        "verification_near_miss": 0.3,
+        "sensitive_near_miss": 0.3
+    }
+
+    def __init__(
+        self,
+        regex_detector: ComplianceRegexDetector = None,
+        llm_detector=None,
+        api_key: str = None,
+        threshold: float = 0.5,
+        weights: Dict[str, float] = None,
+        verification_near_miss_patterns: List[str] = None,
+        sensitive_near_miss_patterns: List[str] = None
+    ):
+        super().__init__(regex_detector or ComplianceRegexDetector(), llm_detector, api_key, threshold, weights)
+        self.verification_near_miss_patterns = verification_near_miss_patterns or NEAR_MISS_VERIFICATION_PATTERNS
+        self.sensitive_near_miss_patterns = sensitive_near_miss_patterns or NEAR_MISS_SENSITIVE_PATTERNS
+        self.verification_near_miss_regex = re.compile("|".join(self.verification_near_miss_patterns), re.IGNORECASE)
+        self.sensitive_near_miss_regex = re.compile("|".join(self.sensitive_near_miss_patterns), re.IGNORECASE)
+
+    def build_llm_detector(self):
+        from task2_privacy.llm_detector import ComplianceLLMDetector
+        return ComplianceLLMDetector(api_key=self.api_key)
+
+    def ambiguity_reasons(self, conversation: Union[List[Dict], Dict]) -> Tuple[Dict[str, bool], List[str]]:
+        result = self.regex_detector.analyze_conversation_detailed(conversation)
+        verdict = {"privacy_violation": result["privacy_violation"]}
+
+        # Only the agent's turns before the deciding utterance can change it
+        end = result["violation_index"] if result["privacy_violation"] else result["verification_index"]
+        reasons = []
+        for index, con in enumerate(conversation):
+            if end is not None and index >= end:
+                break
+            if "agent" not in con.get("speaker", "").lower():
+                continue
+            text = con.get("text", "")
+            if result["privacy_violation"]:
+                if self.verification_near_miss_regex.search(text):
+                    reasons.append("verification_near_miss")
+                    break
+            elif self.sensitive_near_miss_regex.search(text):
+                reasons.append("sensitive_near_miss")
+                break
+        return verdict, reasons
@@ -1,14 +1,37 @@
 import os
 import json
-from typing import Dict, Union, List
+import asyncio
+from typing import Dict, Union, List, Tuple
 import google.generativeai as genai
+from common.gemini_client import AsyncGeminiClient
+from common.llm_cache import LLMResultCache
+from common.instrumentation import Instrumentation, timed
+from common.llm_batching import analyze_batched, analyze_batched_async, format_batch
 
 
 class ComplianceLLMDetector:
-    def __init__(self, api_key: str = None):
+    # Detector label on common.instrumentation metrics
+    INSTRUMENTATION_LABEL = "compliance_llm"
+    # Bump whenever build_prompt changes so cached verdicts are not reused
+    PROMPT_VERSION = "1"
+
+    def __init__(
+        self,
+        api_key: str = None,
+        client=None,
+        cache=None,
+        instrumentation: Instrumentation = None
+    ):
         self.api_key = api_key
+        self.model_name = "gemini-2.0-flash"
         genai.configure(api_key=self.api_key or os.getenv("GEMINI_API_KEY"))
-        self.model = genai.GenerativeModel("gemini-2.0-flash")
+        self.model = genai.GenerativeModel(self.model_name)
+        # AsyncGeminiClient for the async path; pass one instance to both detectors to share limits
+        self.client = client
+        # Optional common.llm_cache.LLMResultCache consulted before every request
+        self.cache = cache
+        # Optional common.instrumentation.Instrumentation for stage timings and outcomes
+        self.instrumentation = instrumentation
 
     def format_conversation(self, utterances: List[Dict]) -> str:
         formatted = []
@@ -18,10 +41,13 @@ class ComplianceLLMDetector:
             formatted.append(f"{speaker}: {text}")
         return "\n".join(formatted)
 
-    def analyze_conversation(self, conversation: Union[Dict, List[Dict]]) -> Dict[str, bool]:
-        input_text = self.format_conversation(conversation)
+    def format_transcript(self, conversation: Union[Dict, List[Dict]]) -> str:
+        return self.format_conversation(conversation)
+
+    def build_prompt(self, conversation: Union[Dict, List[Dict]]) -> str:
+        input_text = self.format_transcript(conversation)
 
-        prompt = (
+        return (
             "You are a compliance analyst. Review this debt collection call transcript.\n"
             "Check if the AGENT shared any sensitive information (such as account balance or account number) "
             "BEFORE verifying the identity of the borrower using personal information (such as date of birth, address, or SSN).\n\n"
@@ -32,15 +58,126 @@ class ComplianceLLMDetector:
             '{\n  "privacy_violation": true/false\n}'
         )
 
+    def build_batch_prompt(self, batch: List[Tuple[str, str]]) -> str:
+        return (
+            "You are a compliance analyst. Review each of these debt collection call transcripts.\n"
+            "For each call, check if the AGENT shared any sensitive information (such as account balance or account number) "
+            "BEFORE verifying the identity of the borrower using personal information (such as date of birth, address, or SSN).\n\n"
+            "Return your response as a JSON array with one object per call, each with:\n"
+            "`call_id`: the call ID given in the call header.\n"
+            "`privacy_violation`: true if such a violation exists in that call, false otherwise.\n\n"
+            f"Conversations:\n{format_batch(batch)}\n\n"
+            "Response format:\n"
+            '[\n  {"call_id": "...", "privacy_violation": true/false}\n]'
+        )
+
+    def to_verdict(self, result: Dict) -> Dict[str, bool]:
+        return {
+            "privacy_violation": bool(result.get("privacy_violation", False))
+        }
+
+    def parse_response(self, text: str) -> Dict[str, bool]:
+        json_text = text.strip("```json").strip("```").strip()
+        return self.to_verdict(json.loads(json_text))
+
+    def error_verdict(self, error: Exception) -> Dict:
+        # Same shape as ProfanityLLMDetector.error_verdict
+        return {
+            "privacy_violation": False,
+            "error": f"{type(error).__name__}: {error}"
+        }
+
+    def _cache_key(self, prompt: str) -> str:
+        return LLMResultCache.make_key(prompt, self.model_name, self.PROMPT_VERSION)
+
+    def _record(self, outcome: str):
+        if self.instrumentation is not None:
+            self.instrumentation.count("llm_results", detector=self.INSTRUMENTATION_LABEL, outcome=outcome)
+
+    def _score_prompt(self, prompt: str) -> Dict[str, bool]:
+        if self.cache is not None:
+            key = self._cache_key(prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record("cache_hit")
+                return cached
+
+        try:
+            with timed(self.instrumentation, "llm_request", detector=self.INSTRUMENTATION_LABEL):
+                response = self.model.generate_content(prompt)
+            with timed(self.instrumentation, "parse", detector=self.INSTRUMENTATION_LABEL):
+                result = self.parse_response(response.text)
+            if self.cache is not None:
+                self.cache.set(key, result)
+            self._record("ok")
+            return result
+        except Exception as e:
+            print(f"[ERROR] Gemini LLM failed: {e}")
+            self._record("error")
+            return self.error_verdict(e)
+
+    async def _score_prompt_async(self, prompt: str) -> Dict[str, bool]:
+        if self.cache is not None:
+            key = self._cache_key(prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record("cache_hit")
+                return cached
+        if self.client is None:
+            self.client = AsyncGeminiClient(api_key=self.api_key)
+
         try:
-            response = self.model.generate_content(prompt)
-            json_text = response.text.strip("```json").strip("```").strip()
-            result = json.loads(json_text)
-            return {
-                "privacy_violation": bool(result.get("privacy_violation", False))
-            }
+            with timed(self.instrumentation, "llm_request", detector=self.INSTRUMENTATION_LABEL):
+                text = await self.client.generate(prompt)
+            with timed(self.instrumentation, "parse", detector=self.INSTRUMENTATION_LABEL):
+                result = self.parse_response(text)
+            if self.cache is not None:
+                self.cache.set(key, result)
+            self._record("ok")
+            return result
         except Exception as e:
             print(f"[ERROR] Gemini LLM failed: {e}")
-            return {
-                "privacy_violation": False
-            }
+            self._record("error")
+            return self.error_verdict(e)
+
+    def analyze_conversation(self, conversation: Union[Dict, List[Dict]]) -> Dict[str, bool]:
+        with timed(self.instrumentation, "call", detector=self.INSTRUMENTATION_LABEL):
+            with timed(self.instrumentation, "format", detector=self.INSTRUMENTATION_LABEL):
+                prompt = self.build_prompt(conversation)
+            return self._score_prompt(prompt)
+
+    async def analyze_conversation_async(self, conversation: Union[Dict, List[Dict]]) -> Dict[str, bool]:
+        with timed(self.instrumentation, "call", detector=self.INSTRUMENTATION_LABEL):
+            with timed(self.instrumentation, "format", detector=self.INSTRUMENTATION_LABEL):
+                prompt = self.build_prompt(conversation)
+            return await self._score_prompt_async(prompt)
+
+    async def analyze_conversations_async(self, conversations: List) -> List[Dict[str, bool]]:
+        """
+        Scores many conversations concurrently; the shared client enforces the
+        concurrency and rate limits.
+        """
+        return await asyncio.gather(*(self.analyze_conversation_async(c) for c in conversations))
+
+    def analyze_conversations_batched(
+        self,
+        conversations: Dict[str, Union[Dict, List[Dict]]],
+        token_budget: int = 8000,
+        max_batch_size: int = 20
+    ) -> Dict[str, Dict[str, bool]]:
+        """
+        Packs conversations, keyed by call ID, into as few prompts as the token
+        budget allows. Calls missing from an unparseable or incomplete batched
+        response are retried with per-call requests.
+        """
+        return analyze_batched(self, conversations, token_budget, max_batch_size)
+
+    async def analyze_conversations_batched_async(
+        self,
+        conversations: Dict[str, Union[Dict, List[Dict]]],
+        token_budget: int = 8000,
+        max_batch_size: int = 20
+    ) -> Dict[str, Dict[str, bool]]:
+        if self.client is None:
+            self.client = AsyncGeminiClient(api_key=self.api_key)
+        return await analyze_batched_async(self, conversations, token_budget, max_batch_size)
@@ -1,92 +1,114 @@
 import re
-from typing import List, Dict, Union
+from functools import partial
+from concurrent.futures import Executor
+from typing import Callable, List, Dict, Union, Optional, Any, Tuple
+from common.prefilter import shared_patterns
+from common.instrumentation import Instrumentation
+from common.parallel_scan import DEFAULT_CHUNK_SIZE, chunk_bounds, columns, run_chunks, shared_executor, use_parallel
+from common.pattern_packs import COMPLIANCE_PACK, PatternPack, load_pack
+
+# Defaults come from the bundled patterns/compliance.json
+DEFAULT_PACK = load_pack(COMPLIANCE_PACK, expected_name="compliance")
+SENSITIVE_PATTERNS = DEFAULT_PACK.patterns["sensitive"]
+VERIFICATION_PATTERNS = DEFAULT_PACK.patterns["verification"]
+
+
+def _first_match_chunk(patterns: Tuple[str, ...], texts: List[str]) -> Optional[Tuple[int, int]]:
+    # (position in the chunk, pattern index) of the first text any pattern
+    # matches, or None
+    prefiltered = shared_patterns(patterns, re.IGNORECASE)
+    for position, text in enumerate(texts):
+        index = prefiltered.first_match(text)
+        if index is not None:
+            return position, index
+    return None
+
 
 class ComplianceRegexDetector:
-    def __init__(self):
-        self.sensitive_patterns = [
-            # Balance and payment information
-            r"balance\s+(?:is|of|shows|shows as|at|available)?\s+\$?[\d,]+\.?\d*",
-            r"(?:you|your account|customer)\s+(?:currently )?(?:has|have|owe[sd]?|are carrying)\s+(?:a )?(?:balance|debt|amount)(?:\s+of)?\s+\$?[\d,]+\.?\d*",
-            r"(?:account|current|available)\s+balance\s+(?:is|of|at|available)?\s+\$?[\d,]+\.?\d*",
-            r"(?:minimum|past due|last|recent|next|monthly) (?:payment|bill|amount due)(?:\s+is)?\s+\$?[\d,]+\.?\d*",
-            r"(?:total|outstanding|remaining) (?:balance|amount|debt)(?:\s+is)?\s+\$?[\d,]+\.?\d*",
-            r"(?:paid|charged|deposited|withdrew|transferred)\s+\$?[\d,]+\.?\d*",
-            r"transaction(?:\s+amount)?\s+(?:of|is|was)?\s+\$?[\d,]+\.?\d*",
-            
-            # Account numbers and identifiers
-            r"account\s+(?:number|#)\s+(?:is|ends in|last digits|ending with)?\s+[\*x]?\d+",
-            r"last\s+(?:\d+|four|five|six)\s+(?:digits|numbers)\s+(?:of|is|are)?\s+\d+",
-            r"(?:your|the)\s+account\s+(?:number|ending|ends|last digits)\s+(?:with|in|is)?\s+\d+",
-            r"card\s+(?:number|#)\s+(?:ending|ends|last digits)\s+(?:with|in)?\s+\d+",
-            r"(?:credit|debit)\s+card\s+(?:ending|ends|last digits)\s+(?:with|in)?\s+\d+",
-            r"routing\s+number\s+(?:is|of)?\s+\d+",
-            
-            # Loan and interest information
-            r"interest\s+rate\s+(?:is|of|at)?\s+\d+\.?\d*\s*%",
-            r"loan\s+(?:amount|balance|principal)\s+(?:is|of|remaining)?\s+\$?[\d,]+\.?\d*",
-            r"(?:APR|annual percentage rate)\s+(?:is|of|at)?\s+\d+\.?\d*\s*%",
-            
-            # Date-related sensitive information
-            r"expir(?:y|ation)\s+date\s+(?:is|of)?\s+\d{1,2}[\/\-]\d{1,2}[\/\-]?\d{0,4}",
-            r"due\s+date\s+(?:is|of|on)?\s+\d{1,2}[\/\-]\d{1,2}[\/\-]?\d{0,4}",
-            
-            # Personal identifiable information
-            r"(?:your|the) (?:address|email|phone|contact number|zip code)\s+(?:is|shows as|listed as)?\s+\w+",
-            r"(?:full|partial) (?:SSN|social security number)\s+(?:is|ending in)?\s+[\*x]?\d+"
-        ]
-        self.verification_patterns = [
-            # DOB verification
-            r"(?:can|could) (?:you|I) (?:please |kindly )?(?:verify|confirm|tell me|provide|share)(?:\s+your)?\s+(?:date of birth|DOB|birthday)",
-            r"(?:what|when)(?:'s| is) your (?:date of birth|DOB|birthday)",
-            r"(?:I need to|I'll need to|I have to|need to|must) (?:verify|confirm)(?:\s+your)?\s+(?:date of birth|DOB|birthday)",
-            r"for verification(?:\s+purposes)?,? (?:what is|can you tell me)(?:\s+your)?\s+(?:date of birth|DOB|birthday)",
-            
-            # Address verification
-            r"(?:can|could) (?:you|I) (?:please |kindly )?(?:verify|confirm|tell me|provide|share)(?:\s+your)?\s+(?:address|mailing address|home address|billing address|residential address)",
-            r"(?:what|where)(?:'s| is) your (?:address|mailing address|home address|billing address|residential address)",
-            r"(?:I need to|I'll need to|I have to|need to|must) (?:verify|confirm)(?:\s+your)?\s+(?:address|mailing address|home address|billing address|residential address)",
-            r"for verification(?:\s+purposes)?,? (?:what is|can you tell me)(?:\s+your)?\s+(?:address|mailing address|home address|billing address|residential address)",
-            
-            # SSN verification
-            r"(?:can|could) (?:you|I) (?:please |kindly )?(?:verify|confirm|tell me|provide|share)(?:\s+your)?\s+(?:social security number|SSN|last four of your social|last four digits of your SSN)",
-            r"(?:what|what's) (?:is |are )?(?:your|the last|the) (?:social security number|SSN|last four of your social|last four digits of your SSN)",
-            r"(?:I need to|I'll need to|I have to|need to|must) (?:verify|confirm)(?:\s+your)?\s+(?:social security number|SSN|last four of your social|last four digits of your SSN)",
-            r"for verification(?:\s+purposes)?,? (?:what is|can you tell me)(?:\s+your)?\s+(?:social security number|SSN|last four of your social|last four digits of your SSN)",
-            
-            # General identity verification
-            r"(?:I need to|I'll need to|I have to|need to|must) (?:verify|confirm|authenticate)(?:\s+your)?\s+(?:identity|ID|identification)",
-            r"for (?:security|verification|authentication) (?:purposes|reasons|measures)",
-            r"before (?:I|we) (?:can|could|proceed|continue|access|provide|share) (?:that|this|account|information|details)",
-            r"(?:can|could) (?:you|I) (?:please |kindly )?(?:verify|confirm|authenticate)(?:\s+your)?\s+(?:identity|ID|identification)",
-            
-            # Security questions
-            r"(?:security|verification) question",
-            r"mother's maiden name",
-            r"first pet'?s name",
-            r"(?:childhood|high school|elementary school) (?:street|address|school)"
-        ]
-        
-        self.sensitive_regexes = [re.compile(pat, re.IGNORECASE) for pat in self.sensitive_patterns]
-        self.verification_regexes = [re.compile(pat, re.IGNORECASE) for pat in self.verification_patterns]
+    def __init__(
+        self,
+        sensitive_patterns: List[str] = None,
+        verification_patterns: List[str] = None,
+        instrumentation: Instrumentation = None
+    ):
+        self.sensitive_patterns = sensitive_patterns or SENSITIVE_PATTERNS
+        self.verification_patterns = verification_patterns or VERIFICATION_PATTERNS
+        self.pack_version = DEFAULT_PACK.version if not (sensitive_patterns or verification_patterns) else None
+
+        # Each regex sits behind a literal/digit prefilter derived from the
+        # pattern itself, so most utterances never reach the regex engine.
+        # Compiled once per process per pattern list and shared by instances.
+        self.sensitive_filter = shared_patterns(self.sensitive_patterns, re.IGNORECASE)
+        self.verification_filter = shared_patterns(self.verification_patterns, re.IGNORECASE)
+        self.sensitive_regexes = self.sensitive_filter.regexes
+        self.verification_regexes = self.verification_filter.regexes
+        # Optional common.instrumentation.Instrumentation for timings and pattern hits
+        self.instrumentation = instrumentation
+
+    @classmethod
+    def from_pack(cls, pack: PatternPack, instrumentation: Instrumentation = None) -> "ComplianceRegexDetector":
+        """
+        Builds a detector from a "compliance" pattern pack (see
+        common.pattern_packs).
+        """
+        detector = cls(
+            sensitive_patterns=pack.patterns["sensitive"],
+            verification_patterns=pack.patterns["verification"],
+            instrumentation=instrumentation
+        )
+        detector.pack_version = pack.version
+        return detector
+
+    def find_sensitive_info(self, text: str) -> Optional[str]:
+        """
+        Returns the first sensitive-info pattern that matches the text, or None.
+        """
+        index = self.sensitive_filter.first_match(text)
+        return None if index is None else self.sensitive_patterns[index]
+
+    def find_verification(self, text: str) -> Optional[str]:
+        """
+        Returns the first verification pattern that matches the text, or None.
+        """
+        index = self.verification_filter.first_match(text)
+        return None if index is None else self.verification_patterns[index]
 
     def contains_sensitive_info(self, text: str) -> bool:
-        return any(pat.search(text) for pat in self.sensitive_regexes)
+        return self.find_sensitive_info(text) is not None
 
     def contains_verification(self, text: str) -> bool:
-        return any(pat.search(text) for pat in self.verification_regexes)
+        return self.find_verification(text) is not None
 
-    def analyze_conversation(self, conversation: Union[List[Dict], Dict]) -> Dict[str, bool]:
+    def analyze_conversation_detailed(self, conversation: Union[List[Dict], Dict]) -> Dict[str, Any]:
         """
-        Returns:
-        {
-            "privacy_violation": True/False
-        }
+        Same verdict as analyze_conversation, plus the utterance index and
+        pattern of the first verification and of the violation, if any.
         """
+        return self._detailed(self._scan, conversation)
 
-        verified = False
-        violation_detected = False
+    def _detailed(self, scan: Callable, conversation: Union[List[Dict], Dict]) -> Dict[str, Any]:
+        if self.instrumentation is None:
+            return scan(conversation)
 
-        for con in conversation:
+        with self.instrumentation.timer("regex_scan", detector="compliance_regex"):
+            result = scan(conversation)
+        for group in ("verification", "violation"):
+            if result[f"{group}_pattern"] is not None:
+                self.instrumentation.count(
+                    "pattern_hits", detector="compliance_regex", category=group, pattern=result[f"{group}_pattern"]
+                )
+        return result
+
+    def _scan(self, conversation: Union[List[Dict], Dict]) -> Dict[str, Any]:
+        result = {
+            "privacy_violation": False,
+            "verification_index": None,
+            "verification_pattern": None,
+            "violation_index": None,
+            "violation_pattern": None
+        }
+
+        for index, con in enumerate(conversation):
             speaker = con.get("speaker", "").lower()
             text = con.get("text", "")
 
@@ -94,13 +116,170 @@ class ComplianceRegexDetector:
                 continue
 
             # Check if identity verification occurs
-            if self.contains_verification(text):
-                verified = True
-                continue
+            pattern = self.find_verification(text)
+            if pattern is not None:
+                result["verification_index"] = index
+                result["verification_pattern"] = pattern
+                break  # Nothing shared after verification can be a violation
 
             # Check if sensitive info is shared without prior verification
-            if self.contains_sensitive_info(text) and not verified:
-                violation_detected = True
+            pattern = self.find_sensitive_info(text)
+            if pattern is not None:
+                result["privacy_violation"] = True
+                result["violation_index"] = index
+                result["violation_pattern"] = pattern
                 break  # One violation is enough to flag
 
-        return {"privacy_violation": violation_detected}
+        return result
+
+    def _scan_parallel(self, conversation: List[Dict], executor: Executor, chunk_size: int) -> Dict[str, Any]:
+        # The sequential scan stops at the first agent utterance that either
+        # verifies (checked first) or shares sensitive info. So search both
+        # pattern sets over the agent's utterances in chunks, and the answer
+        # is known once some chunk has a hit and every chunk before it and
+        # that chunk itself are done for both searches.
+        speakers, texts = columns(conversation)
+        agent = [index for index, speaker in enumerate(speakers) if "agent" in speaker.lower()]
+        agent_texts = [texts[index] for index in agent]
+        bounds = chunk_bounds(len(agent), chunk_size)
+
+        groups = (tuple(self.verification_patterns), tuple(self.sensitive_patterns))
+        tasks = [(patterns, agent_texts[start:end]) for patterns in groups for start, end in bounds]
+        chunks = len(bounds)
+        found: Dict[int, Optional[Tuple[int, int]]] = {}
+
+        def decided_chunk() -> Optional[int]:
+            for chunk in range(chunks):
+                if chunk not in found or chunk + chunks not in found:
+                    return None
+                if found[chunk] is not None or found[chunk + chunks] is not None:
+                    return chunk
+            return None
+
+        def settled(index: int, match: Optional[Tuple[int, int]]) -> bool:
+            found[index] = match
+            return decided_chunk() is not None
+
+        run_chunks(executor, _first_match_chunk, tasks, settled)
+
+        result = {
+            "privacy_violation": False,
+            "verification_index": None,
+            "verification_pattern": None,
+            "violation_index": None,
+            "violation_pattern": None
+        }
+        chunk = decided_chunk()
+        if chunk is None:
+            return result
+
+        start = bounds[chunk][0]
+        verification, sensitive = found[chunk], found[chunk + chunks]
+        if verification is not None and (sensitive is None or verification[0] <= sensitive[0]):
+            result["verification_index"] = agent[start + verification[0]]
+            result["verification_pattern"] = self.verification_patterns[verification[1]]
+        else:
+            result["privacy_violation"] = True
+            result["violation_index"] = agent[start + sensitive[0]]
+            result["violation_pattern"] = self.sensitive_patterns[sensitive[1]]
+        return result
+
+    def analyze_conversation_parallel(
+        self,
+        conversation: Union[List[Dict], Dict],
+        executor: Executor = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        min_utterances: int = None
+    ) -> Dict[str, bool]:
+        """
+        Same verdict as analyze_conversation, for very long transcripts: the
+        first verification and the first sensitive disclosure by the agent
+        are searched for in parallel chunks on `executor` (default: a shared
+        process pool) and combined. Calls shorter than `min_utterances`
+        (default common.parallel_scan.MIN_PARALLEL_UTTERANCES) are scanned in
+        place.
+        """
+        if not use_parallel(len(conversation), executor, min_utterances):
+            return self.analyze_conversation(conversation)
+
+        scan = partial(self._scan_parallel, executor=executor or shared_executor(), chunk_size=chunk_size)
+        result = self._detailed(scan, conversation)
+        return {"privacy_violation": result["privacy_violation"]}
+
+    def analyze_conversation(self, conversation: Union[List[Dict], Dict]) -> Dict[str, bool]:
+        """
+        Returns:
+        {
+            "privacy_violation": True/False
+        }
+        """
+        result = self.analyze_conversation_detailed(conversation)
+        return {"privacy_violation": result["privacy_violation"]}
+
+
+class IncrementalComplianceDetector:
+    """
+    Stateful compliance check fed one utterance at a time. The verdict is
+    final as soon as the agent either verifies identity (nothing later can be
+    a violation) or shares sensitive information before verifying.
+    """
+
+    def __init__(self, detector: ComplianceRegexDetector = None):
+        self.detector = detector or ComplianceRegexDetector()
+        self.verified = False
+        self.violation_detected = False
+
+    @property
+    def is_final(self) -> bool:
+        return self.verified or self.violation_detected
+
+    def update(self, utterance: Dict) -> Optional[Dict[str, bool]]:
+        """
+        Consumes one utterance and returns the verdict if it just became
+        final, otherwise None.
+        """
+        if self.is_final:
+            return None
+
+        speaker = utterance.get("speaker", "").lower()
+        if "agent" not in speaker:
+            return None
+
+        text = utterance.get("text", "")
+        if self.detector.contains_verification(text):
+            self.verified = True
+        elif self.detector.contains_sensitive_info(text):
+            self.violation_detected = True
+
+        return self.finalize() if self.is_final else None
+
+    def finalize(self) -> Dict[str, bool]:
+        return {"privacy_violation": self.violation_detected}
+
+
+class ComplianceStage(IncrementalComplianceDetector):
+    """
+    common.pipeline stage with the same verdict as analyze_conversation. The
+    prefilters reuse the shared lower-cased text and digit check instead of
+    recomputing them for each pattern set.
+    """
+
+    def update(self, features) -> Optional[Dict[str, bool]]:
+        if self.is_final or features.role != "agent":
+            return None
+
+        detector = self.detector
+        index = detector.verification_filter.first_match_features(features)
+        if index is not None:
+            self.verified = True
+            pattern, group = detector.verification_patterns[index], "verification"
+        else:
+            index = detector.sensitive_filter.first_match_features(features)
+            if index is None:
+                return None
+            self.violation_detected = True
+            pattern, group = detector.sensitive_patterns[index], "violation"
+
+        if detector.instrumentation is not None:
+            detector.instrumentation.count("pattern_hits", detector="compliance_regex", category=group, pattern=pattern)
+        return self.finalize()
@@ -1,12 +1,96 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import json
+from common.instrumentation import Instrumentation
+
+# Bumped whenever the metric definitions change, so stored results are redone
+METRICS_VERSION = "2"
+
 
 class CallQualityAnalyzer:
-    def __init__(self, tolerance: float = 0.1):
+    """
+    Call quality metrics with the same definitions as
+    task3_metrics.timeline.build_timeline:
+    - total: first utterance start to the latest utterance end
+    - overtalk: time during which two or more distinct speakers talk
+    - silence: gaps with nobody talking that are longer than `tolerance`
+    - speaking: total minus silence
+    """
+
+    def __init__(self, tolerance: float = 0.1, instrumentation: Instrumentation = None):
         self.tolerance = tolerance
+        # Optional common.instrumentation.Instrumentation for per-call timings
+        self.instrumentation = instrumentation
 
     def analyze(self, conversation: List[Dict]) -> Dict[str, float]:
-        if not conversation:
+        if self.instrumentation is None:
+            return self._analyze(conversation)
+        with self.instrumentation.timer("analyze", detector="call_quality"):
+            return self._analyze(conversation)
+
+    def _analyze(self, conversation: List[Dict]) -> Dict[str, float]:
+        # Sort a copy so the caller's list is left untouched
+        running = IncrementalCallQualityAnalyzer(self.tolerance)
+        for utterance in sorted(conversation, key=lambda x: x["stime"]):
+            running.update(utterance)
+        return running.finalize()
+
+
+class IncrementalCallQualityAnalyzer:
+    """
+    Running version of CallQualityAnalyzer for utterances that arrive in
+    start-time order, as they do from a live transcript. Nobody can start
+    talking before the latest start, so everything before it is final; only
+    each speaker's current end of speech and the running totals are kept.
+    """
+
+    def __init__(self, tolerance: float = 0.1):
+        self.tolerance = tolerance
+        self.first_start = None
+        self.last_end = None
+        # Time up to which overtalk and silence are final
+        self.cursor = None
+        self.speaker_ends: Dict[str, float] = {}
+        self.overtalk_duration = 0.0
+        self.silence_duration = 0.0
+
+    def _latest_two(self) -> Tuple[Optional[float], Optional[float]]:
+        # The two latest speaker ends after the cursor, i.e. how long the
+        # floor stays taken and how long two speakers stay on it
+        first = second = None
+        for end in self.speaker_ends.values():
+            if end <= self.cursor:
+                continue
+            if first is None or end > first:
+                first, second = end, first
+            elif second is None or end > second:
+                second = end
+        return first, second
+
+    def update(self, utterance: Dict) -> None:
+        start, end = utterance["stime"], utterance["etime"]
+        if self.first_start is None:
+            self.first_start = self.cursor = start
+            self.last_end = end
+        elif end > self.last_end:
+            self.last_end = end
+        if end <= start:
+            return  # takes no time, so it only stretches the call span
+
+        latest, second = self._latest_two()
+        if second is not None:
+            self.overtalk_duration += min(second, start) - self.cursor
+        if latest is None:
+            latest = self.cursor
+        # Not start - latest: 25.1 - 25 rounds to just above a 0.1 tolerance
+        if start > latest + self.tolerance:
+            self.silence_duration += start - latest
+        self.cursor = start
+
+        speaker = utterance.get("speaker", "unknown")
+        self.speaker_ends[speaker] = max(self.speaker_ends.get(speaker, end), end)
+
+    def finalize(self) -> Dict[str, float]:
+        if self.first_start is None:
             return {
                 "total_duration": 0.0,
                 "overtalk_duration": 0.0,
@@ -14,30 +98,59 @@ class CallQualityAnalyzer:
                 "speaking_duration": 0.0
             }
 
-        conversation.sort(key=lambda x: x["stime"])
+        # Nobody starts after the last utterance: speakers still talking at
+        # the cursor overlap until the second latest of them stops
+        _, second = self._latest_two()
+        overtalk_duration = self.overtalk_duration + (second - self.cursor if second is not None else 0.0)
+        total_duration = self.last_end - self.first_start
+        return {
+            "total_duration": round(total_duration, 3),
+            "overtalk_duration": round(overtalk_duration, 3),
+            "silence_duration": round(self.silence_duration, 3),
+            "speaking_duration": round(total_duration - self.silence_duration, 3)
+        }
+
 
-        total_duration = conversation[-1]["etime"] - conversation[0]["stime"]
-        overtalk_duration = 0.0
-        silence_duration = 0.0
+class UnorderedCallQualityAnalyzer(IncrementalCallQualityAnalyzer):
+    """
+    IncrementalCallQualityAnalyzer for utterances in any order, such as a
+    live ASR feed that emits each utterance when it ends, so an interjection
+    arrives before the turn it interrupts. The running totals are used while
+    starts keep increasing; after a late utterance, the metrics are computed
+    from the collected times at the end. Only the times are kept.
+    """
 
-        for i in range(1, len(conversation)):
-            prev = conversation[i - 1]
-            curr = conversation[i]
+    def __init__(self, analyzer: CallQualityAnalyzer = None):
+        self.analyzer = analyzer or CallQualityAnalyzer()
+        super().__init__(self.analyzer.tolerance)
+        self.times = []
+        self.in_order = True
 
-            prev_end = prev["etime"]
-            curr_start = curr["stime"]
+    def update(self, utterance: Dict) -> None:
+        speaker, stime, etime = utterance.get("speaker", "unknown"), utterance["stime"], utterance["etime"]
+        if self.times and stime < self.times[-1][1]:
+            self.in_order = False
+        self.times.append((speaker, stime, etime))
+        if self.in_order:
+            super().update(utterance)
 
-            if curr_start < prev_end - self.tolerance:
-                overtalk_duration += prev_end - curr_start
-            elif curr_start > prev_end + self.tolerance:
-                silence_duration += curr_start - prev_end
+    def finalize(self) -> Dict[str, float]:
+        if self.in_order:
+            return super().finalize()
+        return self.analyzer._analyze([
+            {"speaker": speaker, "stime": stime, "etime": etime} for speaker, stime, etime in self.times
+        ])
 
-        speaking_duration = total_duration - silence_duration
 
-        return {
-            "total_duration": round(total_duration, 3),
-            "overtalk_duration": round(overtalk_duration, 3),
-            "silence_duration": round(silence_duration, 3),
-            "speaking_duration": round(speaking_duration, 3)
-        }
+class CallQualityStage(UnorderedCallQualityAnalyzer):
+    """
+    common.pipeline stage with the same metrics as CallQualityAnalyzer, in
+    any utterance order.
+    """
+
+    @property
+    def is_final(self) -> bool:
+        return False
 
+    def update(self, features) -> None:
+        super().update({"speaker": features.speaker, "stime": features.stime, "etime": features.etime})
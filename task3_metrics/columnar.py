@@ -0,0 +1,244 @@
+"""
+Vectorized call quality metrics over columnar batches of utterances.
+
+All utterances of all calls are held in four flat arrays (call_id, speaker
+code, stime, etime), so metrics for hundreds of thousands of calls come out
+of a handful of NumPy sorts and reductions instead of a Python loop per call.
+The metrics match CallQualityAnalyzer.analyze; run
+
+    python -m task3_metrics.columnar All_Conversations
+
+to check parity against it on a directory of calls.
+"""
+import os
+import sys
+import json
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from task3_metrics.call_quality import CallQualityAnalyzer
+
+
+def conversations_to_columns(conversations: Dict[str, List[Dict]]) -> Dict[str, np.ndarray]:
+    """
+    Flattens {call_id: utterances} into columns. Speakers are encoded as
+    integer codes into the returned `speakers` label array; `calls` holds the
+    call IDs in the order of their integer codes.
+    """
+    calls = list(conversations)
+    speaker_codes = {}
+    call_id, speaker, stime, etime = [], [], [], []
+
+    for code, name in enumerate(calls):
+        for utt in conversations[name]:
+            call_id.append(code)
+            speaker.append(speaker_codes.setdefault(utt.get("speaker", "unknown"), len(speaker_codes)))
+            stime.append(utt["stime"])
+            etime.append(utt["etime"])
+
+    return {
+        "call_id": np.asarray(call_id, dtype=np.int64),
+        "speaker": np.asarray(speaker, dtype=np.int32),
+        "stime": np.asarray(stime, dtype=np.float64),
+        "etime": np.asarray(etime, dtype=np.float64),
+        "calls": np.asarray(calls, dtype=object),
+        "speakers": np.asarray(list(speaker_codes), dtype=object)
+    }
+
+
+def read_parquet_columns(path: str) -> Dict[str, np.ndarray]:
+    """
+    Loads a Parquet file with call_id, speaker, stime and etime columns.
+    String call IDs and speaker labels are factorized into integer codes.
+    """
+    import pandas as pd
+
+    frame = pd.read_parquet(path, columns=["call_id", "speaker", "stime", "etime"])
+    call_id, calls = pd.factorize(frame["call_id"])
+    speaker, speakers = pd.factorize(frame["speaker"])
+    return {
+        "call_id": call_id.astype(np.int64),
+        "speaker": speaker.astype(np.int32),
+        "stime": frame["stime"].to_numpy(dtype=np.float64),
+        "etime": frame["etime"].to_numpy(dtype=np.float64),
+        "calls": np.asarray(calls, dtype=object),
+        "speakers": np.asarray(speakers, dtype=object)
+    }
+
+
+class ColumnarCallQualityAnalyzer:
+    def __init__(self, tolerance: float = 0.1):
+        self.tolerance = tolerance
+
+    def analyze_columns(
+        self,
+        call_id: np.ndarray,
+        speaker: np.ndarray,
+        stime: np.ndarray,
+        etime: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """
+        Returns one entry per distinct call ID, in ascending call ID order:
+        total, overtalk, silence and speaking durations, plus a
+        (calls x speakers) matrix of summed utterance durations indexed by
+        speaker code.
+        """
+        call_id = np.asarray(call_id)
+        speaker = np.asarray(speaker)
+        stime = np.asarray(stime, dtype=np.float64)
+        etime = np.asarray(etime, dtype=np.float64)
+
+        if call_id.size == 0:
+            empty = np.zeros(0)
+            return {
+                "call_id": call_id,
+                "total_duration": empty,
+                "overtalk_duration": empty,
+                "silence_duration": empty,
+                "speaking_duration": empty,
+                "speaker_duration": np.zeros((0, 0))
+            }
+
+        order = np.lexsort((stime, call_id))
+        call_id, speaker, stime, etime = call_id[order], speaker[order], stime[order], etime[order]
+
+        is_first = np.empty(call_id.size, dtype=bool)
+        is_first[0] = True
+        np.not_equal(call_id[1:], call_id[:-1], out=is_first[1:])
+        firsts = np.flatnonzero(is_first)
+        row_call = np.cumsum(is_first) - 1
+        n_calls = firsts.size
+
+        total = np.maximum.reduceat(etime, firsts) - stime[firsts]
+        overtalk, silence = self._sweep(row_call, speaker, stime, etime, stime[firsts], n_calls)
+
+        n_speakers = int(speaker.max()) + 1
+        speaker_duration = np.bincount(
+            row_call * n_speakers + speaker,
+            weights=etime - stime,
+            minlength=n_calls * n_speakers
+        ).reshape(n_calls, n_speakers)
+
+        return {
+            "call_id": call_id[firsts],
+            "total_duration": np.round(total, 3),
+            "overtalk_duration": np.round(overtalk, 3),
+            "silence_duration": np.round(silence, 3),
+            "speaking_duration": np.round(total - silence, 3),
+            "speaker_duration": speaker_duration
+        }
+
+    def _sweep(
+        self,
+        row_call: np.ndarray,
+        speaker: np.ndarray,
+        stime: np.ndarray,
+        etime: np.ndarray,
+        call_start: np.ndarray,
+        n_calls: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Overtalk and silence per call, the same event sweep as build_timeline:
+        each speaker's utterances are merged into runs of continuous speech,
+        and the +1/-1 run boundaries of a call are swept in time order.
+        """
+        talking = etime > stime
+        row_call, speaker, stime, etime = row_call[talking], speaker[talking], stime[talking], etime[talking]
+        overtalk, silence = np.zeros(n_calls), np.zeros(n_calls)
+        if row_call.size == 0:
+            return overtalk, silence
+
+        # Runs of one speaker: a new run starts past every earlier end
+        order = np.lexsort((stime, speaker, row_call))
+        row_call, speaker, stime, etime = row_call[order], speaker[order], stime[order], etime[order]
+        new_group = np.empty(row_call.size, dtype=bool)
+        new_group[0] = True
+        new_group[1:] = (row_call[1:] != row_call[:-1]) | (speaker[1:] != speaker[:-1])
+        group = np.cumsum(new_group)
+        earlier_end = np.empty_like(etime)
+        earlier_end[0] = -np.inf
+        earlier_end[1:] = np.where(group[1:] == group[:-1], _segmented_cummax(etime, group)[:-1], -np.inf)
+        run_starts = np.flatnonzero(stime > earlier_end)
+        run_call = row_call[run_starts]
+        run_begin = stime[run_starts]
+        run_end = np.maximum.reduceat(etime, run_starts)
+
+        # Every call's deltas sum to zero, so one cumsum gives the number of
+        # distinct speakers talking after each event
+        event_call = np.concatenate([run_call, run_call])
+        event_time = np.concatenate([run_begin, run_end])
+        event_delta = np.concatenate([np.ones(run_call.size), -np.ones(run_call.size)])
+        order = np.lexsort((event_time, event_call))
+        event_call, event_time = event_call[order], event_time[order]
+        active = np.cumsum(event_delta[order])
+
+        same_call = event_call[1:] == event_call[:-1]
+        length = event_time[1:] - event_time[:-1]
+        now = active[:-1]
+        overtalk += np.bincount(
+            event_call[:-1], weights=np.where(same_call & (now >= 2), length, 0.0), minlength=n_calls
+        )
+        silence += np.bincount(
+            event_call[:-1],
+            weights=np.where(same_call & (now == 0) & (event_time[1:] > event_time[:-1] + self.tolerance), length, 0.0),
+            minlength=n_calls
+        )
+
+        # Silence before a call's first run, after utterances that take no time
+        first_event = np.flatnonzero(np.concatenate([[True], ~same_call]))
+        lead_start = call_start[event_call[first_event]]
+        lead = event_time[first_event] - lead_start
+        silence[event_call[first_event]] += np.where(event_time[first_event] > lead_start + self.tolerance, lead, 0.0)
+        return overtalk, silence
+
+
+def _segmented_cummax(values: np.ndarray, group: np.ndarray) -> np.ndarray:
+    """
+    Running maximum of `values` that restarts wherever `group` changes
+    (groups are contiguous), in log2(n) vectorized passes.
+    """
+    out = values.copy()
+    shift = 1
+    while shift < out.size:
+        same = group[shift:] == group[:-shift]
+        out[shift:] = np.maximum(out[shift:], np.where(same, out[:-shift], -np.inf))
+        shift *= 2
+    return out
+
+
+def check_parity(directory: str, tolerance: float = 0.1) -> List[Tuple[str, str]]:
+    """
+    Runs both analyzers over every conversation file in a directory and
+    returns (file, metric) pairs that disagree.
+    """
+    conversations = {}
+    for fname in sorted(os.listdir(directory)):
+        if fname.endswith(".json"):
+            with open(os.path.join(directory, fname), "r") as f:
+                conversations[fname] = json.load(f)
+
+    columns = conversations_to_columns(conversations)
+    result = ColumnarCallQualityAnalyzer(tolerance).analyze_columns(
+        columns["call_id"], columns["speaker"], columns["stime"], columns["etime"]
+    )
+    row_of = {int(code): row for row, code in enumerate(result["call_id"])}
+
+    analyzer = CallQualityAnalyzer(tolerance)
+    mismatches = []
+    for code, fname in enumerate(columns["calls"]):
+        expected = analyzer.analyze(conversations[fname])
+        for metric, value in expected.items():
+            actual = result[metric][row_of[code]] if code in row_of else 0.0
+            # Both sides are rounded to 3 decimals; allow for rounding ties
+            if abs(actual - value) > 1e-3 + 1e-9:
+                mismatches.append((fname, metric))
+    return mismatches
+
+
+if __name__ == "__main__":
+    mismatches = check_parity(sys.argv[1] if len(sys.argv) > 1 else "All_Conversations")
+    for fname, metric in mismatches:
+        print(f"[MISMATCH] {fname}: {metric}")
+    print(f"{len(mismatches)} mismatches")
+    sys.exit(1 if mismatches else 0)
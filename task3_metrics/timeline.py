@@ -0,0 +1,105 @@
+from typing import List, Dict, Optional
+from itertools import groupby
+
+
+def build_timeline(
+    conversation: List[Dict],
+    silence_threshold: float = 0.1,
+    start: Optional[float] = None
+) -> Dict:
+    """
+    Event-based sweep over all utterance boundaries, O(n log n). In one pass
+    and without touching the input list it computes:
+    - per-speaker talk time (time during which that speaker is talking)
+    - exact overtalk intervals (two or more distinct speakers at once)
+    - silence intervals (nobody talking for longer than `silence_threshold`)
+    - the timeline segments sorted by start time, each flagged if it
+      overlaps speech from another speaker
+
+    The call span runs from `start` (or the first utterance when None) to the
+    last utterance end. With the defaults the totals are the ones
+    CallQualityAnalyzer reports.
+    """
+    segments = [
+        {
+            "speaker": seg.get("speaker", "unknown"),
+            "start": seg["stime"],
+            "end": seg["etime"],
+            "text": seg.get("text", ""),
+            "overlapping": False
+        }
+        for seg in sorted(conversation, key=lambda x: x["stime"])
+    ]
+
+    if not segments:
+        return {
+            "start": 0.0,
+            "end": 0.0,
+            "total_duration": 0.0,
+            "speaker_talk_time": {},
+            "overtalk_intervals": [],
+            "overtalk_duration": 0.0,
+            "silence_intervals": [],
+            "silence_duration": 0.0,
+            "segments": []
+        }
+
+    span_start = segments[0]["start"] if start is None else min(start, segments[0]["start"])
+    span_end = max(seg["end"] for seg in segments)
+
+    # (time, delta, segment index); zero-length segments take no time
+    events = []
+    for index, seg in enumerate(segments):
+        if seg["end"] > seg["start"]:
+            events.append((seg["start"], 1, index))
+            events.append((seg["end"], -1, index))
+    events.sort()
+
+    talk_time = {seg["speaker"]: 0.0 for seg in segments}
+    active_speakers = {}
+    # Active segments not flagged yet, so each one is flagged at most once
+    unflagged = set()
+    overtalk, silence = [], []
+    prev_time = span_start
+
+    for time, group in groupby(events, key=lambda e: e[0]):
+        length = time - prev_time
+        if length > 0:
+            if not active_speakers:
+                if time > prev_time + silence_threshold:
+                    silence.append((prev_time, time))
+            else:
+                for speaker in active_speakers:
+                    talk_time[speaker] += length
+                if len(active_speakers) > 1:
+                    if overtalk and overtalk[-1][1] == prev_time:
+                        overtalk[-1] = (overtalk[-1][0], time)
+                    else:
+                        overtalk.append((prev_time, time))
+                    for index in unflagged:
+                        segments[index]["overlapping"] = True
+                    unflagged.clear()
+
+        for _, delta, index in group:
+            speaker = segments[index]["speaker"]
+            if delta > 0:
+                active_speakers[speaker] = active_speakers.get(speaker, 0) + 1
+                unflagged.add(index)
+            else:
+                active_speakers[speaker] -= 1
+                if not active_speakers[speaker]:
+                    del active_speakers[speaker]
+                unflagged.discard(index)
+        prev_time = time
+
+    return {
+        "start": span_start,
+        "end": span_end,
+        "total_duration": span_end - span_start,
+        "speaker_talk_time": talk_time,
+        "overtalk_intervals": overtalk,
+        "overtalk_duration": sum(end - begin for begin, end in overtalk),
+        "silence_intervals": silence,
+        "silence_duration": sum(end - begin for begin, end in silence),
+        "segments": segments
+    }
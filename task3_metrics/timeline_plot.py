@@ -0,0 +1,138 @@
+"""
+Timeline rendering for the output of build_timeline.
+
+Segments are grouped into layers (one per row and color) and each layer is
+drawn with a single broken_barh call, so drawing cost no longer grows with
+one matplotlib artist per segment. For very long calls, timeline_chart builds
+an interactive Altair view with the layers downsampled to a fixed number of
+bars.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import matplotlib.pyplot as plt
+import matplotlib.patches as mpatches
+
+AGENT_COLOR = "#4682B4"
+CUSTOMER_COLOR = "#6B8E23"
+OVERLAP_COLOR = "#FF6347"
+SILENCE_COLOR = "#DCDCDC"
+
+# Text labels are one artist each, so they are skipped on long calls
+MAX_LABELED_SEGMENTS = 300
+
+# layer name -> (row, color, label)
+LAYERS = {
+    "agent": (1, AGENT_COLOR, "Agent Speaking"),
+    "agent_overlap": (1, OVERLAP_COLOR, "Overlapping Speech"),
+    "customer": (0, CUSTOMER_COLOR, "Customer Speaking"),
+    "customer_overlap": (0, OVERLAP_COLOR, "Overlapping Speech")
+}
+
+
+def timeline_layers(timeline: Dict) -> Dict[str, List[Tuple[float, float]]]:
+    """
+    Splits the segments into (start, width) ranges per layer, plus a
+    "silence" layer. The Agent is drawn on the top row and every other
+    speaker on the bottom row, as in the original chart.
+    """
+    layers = {name: [] for name in LAYERS}
+    for seg in timeline["segments"]:
+        name = "agent" if seg["speaker"] == "Agent" else "customer"
+        if seg["overlapping"]:
+            name += "_overlap"
+        layers[name].append((seg["start"], seg["end"] - seg["start"]))
+    layers["silence"] = [(start, end - start) for start, end in timeline["silence_intervals"]]
+    return layers
+
+
+def downsample_ranges(ranges: List[Tuple[float, float]], resolution: float) -> List[Tuple[float, float]]:
+    """
+    Merges (start, width) ranges whose gap is under `resolution`, in one pass
+    over the ranges sorted by start. At that resolution the merged bars look
+    the same as the originals.
+    """
+    merged = []
+    for start, width in sorted(ranges):
+        end = start + width
+        if merged and start - merged[-1][1] < resolution:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end - start) for start, end in merged]
+
+
+def plot_timeline(timeline: Dict, resolution: Optional[float] = None):
+    """
+    Draws the conversation timeline and returns the figure. With a
+    `resolution` (seconds), each layer is downsampled first.
+    """
+    layers = timeline_layers(timeline)
+    if resolution:
+        layers = {name: downsample_ranges(ranges, resolution) for name, ranges in layers.items()}
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+
+    ax.broken_barh(layers["silence"], (-1, 2), color=SILENCE_COLOR, alpha=0.3)
+    for name, (row, color, _) in LAYERS.items():
+        ax.broken_barh(layers[name], (row - 0.4, 0.8), color=color)
+
+    segments = timeline["segments"]
+    if len(segments) <= MAX_LABELED_SEGMENTS:
+        for seg in segments:
+            if seg["end"] - seg["start"] > 3:
+                y = 1 if seg["speaker"] == "Agent" else 0
+                short_text = seg["text"][:20] + "..." if len(seg["text"]) > 20 else seg["text"]
+                ax.text(seg["start"] + 0.1, y, short_text, va="center", fontsize=8, color="white")
+
+    ax.set_yticks([0, 1])
+    ax.set_yticklabels(["Customer", "Agent"])
+
+    ax.set_xlim(0, timeline["end"])
+    ax.set_xlabel("Time (seconds)")
+    ax.set_title("Conversation Timeline")
+
+    ax.grid(axis="x", linestyle="--", alpha=0.6)
+
+    legend_patches = [
+        mpatches.Patch(color=AGENT_COLOR, label="Agent Speaking"),
+        mpatches.Patch(color=CUSTOMER_COLOR, label="Customer Speaking"),
+        mpatches.Patch(color=OVERLAP_COLOR, label="Overlapping Speech"),
+        mpatches.Patch(color=SILENCE_COLOR, label="Silence", alpha=0.3),
+    ]
+    ax.legend(handles=legend_patches, loc="upper right")
+
+    return fig
+
+
+def timeline_chart(timeline: Dict, max_bars: int = 2000):
+    """
+    Interactive (zoom and pan) Altair version of the timeline. Each layer is
+    downsampled so the chart holds roughly `max_bars` bars at most, however
+    long the call is.
+    """
+    import altair as alt
+
+    resolution = timeline["end"] / max_bars if timeline["end"] > 0 else 0
+    layers = timeline_layers(timeline)
+
+    rows = []
+    for name, ranges in layers.items():
+        if name == "silence":
+            speakers, label = ("Agent", "Customer"), "Silence"
+        else:
+            row, _, label = LAYERS[name]
+            speakers = ("Agent" if row == 1 else "Customer",)
+        for start, width in downsample_ranges(ranges, resolution):
+            for speaker in speakers:
+                rows.append({"speaker": speaker, "start": start, "end": start + width, "layer": label})
+
+    labels = ["Agent Speaking", "Customer Speaking", "Overlapping Speech", "Silence"]
+    colors = [AGENT_COLOR, CUSTOMER_COLOR, OVERLAP_COLOR, SILENCE_COLOR]
+    return alt.Chart(alt.Data(values=rows)).mark_bar().encode(
+        x=alt.X("start:Q", title="Time (seconds)"),
+        x2="end:Q",
+        y=alt.Y("speaker:N", title=None, sort=["Agent", "Customer"]),
+        color=alt.Color("layer:N", scale=alt.Scale(domain=labels, range=colors), title=None),
+        tooltip=["layer:N", "start:Q", "end:Q"]
+    ).properties(title="Conversation Timeline").interactive(bind_y=False)